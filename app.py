@@ -1,6 +1,5 @@
 import os
 import yaml
-import time
 from datetime import datetime
 import traceback
 import logging.config
@@ -10,16 +9,18 @@ from flask import render_template, request, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 
 try:
-    from src.storage import tomysql, s3tofrom
-    from src.ingestion import get_data, cleandata
+    from src.storage import tomysql
+    from src.ingestion import get_data
     from config.flaskconfig import SQLALCHEMY_DATABASE_URI, DB_USER, DB_PW, DATABASE, DB_HOST
-    from src.statistics import clustering, regression
+    from src.utils import profiling, dtypes, stagecache
+    from src import pipeline
 except ModuleNotFoundError:
-    from ingestion import get_data, cleandata
+    from ingestion import get_data
     from storage import tos3, tomysql
-    from ingestion import get_data, cleandata
+    from ingestion import get_data
     from flaskconfig import SQLALCHEMY_DATABASE_URI
-    from statistics import clustering, regression
+    from utils import profiling, dtypes, stagecache
+    import pipeline
 
 
 # Initialize the Flask application
@@ -180,52 +181,44 @@ def refresh():
                 status = 'Data last refreshed on ' + strdate[0]
 
         if runbool == 1:
-            startt = time.time()
+            # time and measure every stage of this refresh
+            profiling.PROFILER.configure(**yaml0['profiling']).reset()
+            dtypes.POLICY.configure(**yaml0['dtypes']).reset()
             try:
-                mtg = get_data.MTGAPI()
-                scry0 = mtg.scryfall_api()
-                prices = mtg.mtgjson_api()
+                # imported here, only the refresh needs boto3 and aiohttp
+                from src.storage import s3tofrom
+                mtg = get_data.MTGAPI(**yaml0['get_data']['MTGAPI'])
+                # download all sources at the same time
+                raw0 = mtg.ingest_all(sources=['scryfall', 'mtgjson'])
+                scry0 = raw0['scryfall']
+                prices = raw0['mtgjson']
 
                 # upload raw data to S3
                 s3tofrom.to_s3(scry0, customname="chrawdata/scryfall1", **yaml0['s3tofrom'])
                 s3tofrom.to_s3(prices, customname="chrawdata/mtgjson1", **yaml0['s3tofrom'])
-                s3_time = 'Finished raw data upload to S3 at: ' + str(time.time() - startt)
-
-                # merge scryfall and mtgjson data + clean them
-                cclean = cleandata.Clean(scry0, prices, **yaml0['get_data']['merge_all'])
-                mergeraw = cclean.merge_all()
-                dgee = cclean.for_gee()
-                dkmean = cclean.for_kmeans()
-                clean_time = 'Finished data cleaning at: ' + str(time.time() - startt)
-
-                kcenter1, kmdf0, score1 = clustering.run_kmeans(dkmean, **yaml0['clustering']['run_kmeans'])
-                rdf0, rmodel0 = regression.run_reg(dgee, modeltype='gee', **yaml0['regression']['run_reg'])
-                rdf1, rmodel1 = regression.run_reg(dkmean, modeltype='linear', **yaml0['regression']['run_reg'])
-                model_time = 'Finished statistical calculations at: ' + str(time.time() - startt)
-
-                # save model to s3
-                s3tofrom.model_save(rmodel0, s3pathfile='chmodel/gee.joblib', **yaml0['s3tofrom'])
-                s3tofrom.model_save(rmodel1, s3pathfile='chmodel/ols.joblib', **yaml0['s3tofrom'])
-
-                # get all unique card names
-                namedf = pd.DataFrame(list(set(dkmean['name'].values.tolist())), columns=['cardname'])
 
                 print(DB_USER, DB_PW, DATABASE)
                 chsql = tomysql.MysqlAll(u=DB_USER, p=DB_PW, db=DATABASE, schema='msia423_db', isflask=True)
 
-                chsql.insert_df(kmdf0, name='cluster_result', replace=True)
-                chsql.insert_df(rdf0, name='gee_result', replace=True)
-                chsql.insert_df(rdf1, name='ols_result', replace=True)
-                chsql.insert_df(mergeraw, name='merge_raw', replace=True)
-                chsql.insert_df(namedf, name='cards', replace=True)
-                db_time = 'Finished database updates at: ' + str(time.time() - startt)
+                # merge scryfall and mtgjson data + clean them, run the models and insert the results, skipping the
+                # stages whose inputs did not change since the last refresh unless recomputing was asked for
+                force = True if request.form.get('force') == 'yes' else None
+                pipe = pipeline.refresh(yaml0, scry0, prices, cache=stagecache.from_config(**yaml0['stagecache']),
+                                        chsql=chsql, replace=True, force=force).run()
+
+                # save model to s3
+                s3tofrom.model_save(pipe.get('gee.model'), s3pathfile='chmodel/gee.joblib', **yaml0['s3tofrom'])
+                s3tofrom.model_save(pipe.get('ols.model'), s3pathfile='chmodel/ols.joblib', **yaml0['s3tofrom'])
                 # write update date to a text file
                 with open(yaml0['app']['refresh']['refreshfile'], 'w') as file:
                     file.write(datetime.now().strftime('%Y-%m-%d'))
                     file.close()
-                # + s3_time + '   '
-                logs = logs + '<br>' + clean_time + '<br>' + model_time + '<br>' + db_time
-                logger.info(logs)
+                logs = pipe.report().round(3).to_html(classes='dataframe', index=False)
+                logs += profiling.PROFILER.summary().round(3).to_html(classes='dataframe', index=False)
+                logs += dtypes.POLICY.summary().round(3).to_html(classes='dataframe', index=False)
+                logger.info('Cached stages:\n{}'.format(pipe.table()))
+                logger.info('Refresh stages:\n{}'.format(profiling.PROFILER.table()))
+                logger.info('Downcast frames:\n{}'.format(dtypes.POLICY.table()))
             except Exception as e:
                 traceback.print_exc()
                 logger.error('Error with the refresh page! {}'.format(e))
@@ -0,0 +1,56 @@
+"""
+    Compares the uncompressed and compressed (gz, bz2, xz) variants of the MTGJSON price file: bytes transferred,
+    wall time to download, decompress and parse the file, and the transfer time the byte counts imply on a given
+    bandwidth. Payloads are generated and served locally so no network is needed.
+
+    Usage (from the repo root):
+        python -m benchmarks.bench_codecs --ncard 5000 --ndays 90 --mbps 100
+"""
+import time
+import argparse
+import pandas as pd
+
+from benchmarks import standin
+from src.ingestion import get_data
+
+
+def bench_codecs(ncard=5000, ndays=90, mbps=100, repeat=3):
+    """
+        Returns:
+            Pandas dataframe with one row per codec
+    """
+    days = pd.date_range('2021-03-01', periods=ndays).strftime('%Y-%m-%d').tolist()
+    httpd, base = standin.start({'/AllPrices.json': standin.prices(days, ncard)})
+    uuid0 = {'u{}'.format(i) for i in range(ncard)}
+    rows = []
+    try:
+        for codec in [None, 'gz', 'bz2', 'xz']:
+            # compress once outside of the timings
+            path0 = '/AllPrices.json' + ('' if codec is None else '.' + codec)
+            standin.StandIn.bodies[path0] = standin.body_of(path0)
+            mtg = standin.point(get_data.MTGAPI(codec=codec), base)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                mtg.mtgjson_prices(mtg.mtgjson, uuid0)
+                times.append(time.perf_counter() - start)
+            nbytes = int(mtg.session.report()['bytes'].iloc[0] / repeat)
+            rows.append({'codec': codec or 'none', 'bytes': nbytes, 'wall_seconds': min(times),
+                         'transfer_seconds': nbytes * 8 / (mbps * 1e6)})
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    res0 = pd.DataFrame(rows)
+    res0['ratio'] = res0['bytes'].iloc[0] / res0['bytes']
+    res0['total_seconds'] = res0['wall_seconds'] + res0['transfer_seconds']
+    return res0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark compressed MTGJSON variants')
+    parser.add_argument('--ncard', type=int, default=5000, help='number of cards in the price file')
+    parser.add_argument('--ndays', type=int, default=90, help='number of days of prices per card')
+    parser.add_argument('--mbps', type=float, default=100, help='bandwidth used for the transfer time estimate')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per codec, the fastest is reported')
+    args = parser.parse_args()
+    print(bench_codecs(args.ncard, args.ndays, args.mbps, args.repeat).round(3).to_string(index=False))
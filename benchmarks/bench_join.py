@@ -0,0 +1,72 @@
+"""
+    Compares the join of Clean.merge_all: the former pd.merge of all Scryfall cards with the MTGJSON prices followed
+    by the rarity and release date filters, against cleandata.inner_join, which filters the cards first and joins on
+    integer codes. Reports the wall time, the tracemalloc peak and the rows of the joined frame before filtering.
+
+    Usage (from the repo root):
+        python -m benchmarks.bench_join --size large
+"""
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+
+from benchmarks import synthetic, suite
+from src.ingestion import cleandata
+
+
+RARITIES = ['common', 'rare', 'uncommon', 'mythic']
+
+
+def merge_filter(scry, mtgjson):
+    # the former merge_all
+    scrypr0 = pd.merge(scry, mtgjson, left_on='id', right_on='scryfallId', how='inner')
+    scrypr1 = scrypr0[scrypr0['rarity'].isin(RARITIES)]
+    return scrypr1.dropna(subset=['released_at']), len(scrypr0)
+
+
+def join_filter(scry, mtgjson):
+    keep = (scry['rarity'].isin(RARITIES) & scry['released_at'].notna()).to_numpy()
+    res0 = cleandata.inner_join(scry, mtgjson, left_on='id', right_on='scryfallId', keep=keep)
+    return res0, len(res0)
+
+
+def bench_join(size='large', ndays=90, repeat=3, seed=0):
+    """
+        Args:
+            size (string): name of benchmarks.suite.SIZES or number of generated printings
+
+        Returns:
+            Pandas dataframe with one row per implementation
+    """
+    syn0 = synthetic.Synthetic(suite.SIZES[size] if size in suite.SIZES else int(size), ndays=ndays, seed=seed)
+    scry, mtgjson = syn0.scryfall(), syn0.mtgjson()
+    # scryfall_api already drops most special cards, keep some so the filter has work to do
+    scry.loc[scry.index[::10], 'rarity'] = 'special'
+    rows = []
+    results = {}
+    for name, func in [('merge_filter', merge_filter), ('inner_join', join_filter)]:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name], joined = func(scry, mtgjson)
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        func(scry, mtgjson)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append({'join': name, 'cards': len(scry), 'prices': len(mtgjson), 'joined_rows': joined,
+                     'rows': len(results[name]), 'wall_seconds': min(times), 'traced_peak_mb': peak / 1024 ** 2})
+    pd.testing.assert_frame_equal(results['inner_join'], results['merge_filter'])
+    res0 = pd.DataFrame(rows)
+    res0['speedup'] = res0['wall_seconds'].iloc[0] / res0['wall_seconds']
+    return res0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Scryfall and MTGJSON join')
+    parser.add_argument('--size', default='large', help='size of the synthetic data, e.g. large or 20000')
+    parser.add_argument('--ndays', type=int, default=90, help='number of days of prices per card')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs, the fastest is reported')
+    args = parser.parse_args()
+    print(bench_join(args.size, args.ndays, args.repeat).round(4).to_string(index=False))
@@ -0,0 +1,36 @@
+"""
+    Pytest entry point of the benchmark suite. The file name keeps it out of the regular test run, pass it
+    explicitly:
+        python -m pytest benchmarks/bench_pipeline.py --sizes small medium --threshold 0.25
+"""
+import os
+import pytest
+
+try:
+    from benchmarks import suite
+except ModuleNotFoundError:
+    import suite
+
+
+@pytest.fixture(scope='session')
+def report(request):
+    report0 = suite.run(request.config.getoption('--sizes'), repeat=request.config.getoption('--repeat'))
+    suite.save(report0, request.config.getoption('--bench-output'))
+    return report0
+
+
+@pytest.fixture(scope='session')
+def comparison(request, report):
+    baseline = request.config.getoption('--baseline')
+    if not os.path.isfile(baseline):
+        pytest.skip('No baseline at {}, run `python run.py bench --update` first'.format(baseline))
+    return suite.compare(report, suite.load(baseline), threshold=request.config.getoption('--threshold'))
+
+
+@pytest.mark.parametrize('stage', list(suite.STAGES))
+def test_no_regression(report, comparison, stage):
+    skipped = [r['skipped'] for r in report['results'] if r['stage'] == stage and r['skipped']]
+    if skipped:
+        pytest.skip(skipped[0])
+    comp0 = comparison[comparison['stage'] == stage]
+    assert not comp0['regressed'].any(), comp0.to_string(index=False)
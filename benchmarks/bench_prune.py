@@ -0,0 +1,69 @@
+"""
+    Compares the column pruning of Clean.merge_clean, dropping each sparse numeric column in its own fill and drop
+    (the former loop), against cleandata.prune, which fills, checks and drops all columns at once. The frames are
+    the merged synthetic data (benchmarks/synthetic.py) with a growing number of keyword and subtype indicators.
+
+    Usage (from the repo root):
+        python -m benchmarks.bench_prune --ncard 2000 --widths 100 400 1600
+"""
+import re
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src.ingestion import cleandata
+
+
+def loop_prune(df, cols, minsum):
+    # the former merge_clean loop, copying the frame twice per column
+    for n in cols:
+        df = df.fillna({n: 0})
+        if df[n].sum() < minsum:
+            df = df.drop([n], axis=1)
+    return df
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res0 = func()
+        times.append(time.perf_counter() - start)
+    return min(times), res0
+
+
+def bench_prune(ncard=2000, widths=(100, 400, 1600), percentkeep=0.03, repeat=3, seed=0):
+    """
+        Args:
+            ncard (int): number of generated printings
+            widths (list): numbers of distinct keywords and subtypes, split 1 to 4 as in the real data
+
+        Returns:
+            Pandas dataframe with one row per width
+    """
+    rows = []
+    for width in widths:
+        syn0 = synthetic.Synthetic(ncard, ndays=30, nkeyword=max(width // 5, 1), nsubtype=max(width - width // 5, 1),
+                                   seed=seed)
+        df0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson()).merge_all()
+        cols = [c for c in df0.select_dtypes(include=np.number).columns if not re.match(r"pd[0-9]+", c)]
+        minsum = len(df0) * percentkeep
+        loop0, res0 = timed(lambda: loop_prune(df0, cols, minsum), repeat)
+        vec0, res1 = timed(lambda: cleandata.prune(df0, cols, minsum=minsum), repeat)
+        pd.testing.assert_frame_equal(res0, res1)
+        rows.append({'rows': len(df0), 'columns': len(cols), 'kept': len(cols) - (df0.shape[1] - res1.shape[1]),
+                     'loop_seconds': loop0, 'prune_seconds': vec0, 'speedup': loop0 / vec0})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pruning of sparse feature columns')
+    parser.add_argument('--ncard', type=int, default=2000, help='number of generated printings')
+    parser.add_argument('--widths', type=int, nargs='+', default=[100, 400, 1600],
+                        help='numbers of distinct keywords and subtypes')
+    parser.add_argument('--percentkeep', type=float, default=0.03, help='percent threshold of merge_clean')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per width, the fastest is reported')
+    args = parser.parse_args()
+    print(bench_prune(args.ncard, args.widths, args.percentkeep, args.repeat).round(4).to_string(index=False))
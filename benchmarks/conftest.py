@@ -0,0 +1,13 @@
+try:
+    from benchmarks import suite
+except ModuleNotFoundError:
+    import suite
+
+
+def pytest_addoption(parser):
+    parser.addoption('--sizes', nargs='+', default=['small', 'medium'],
+                     help='benchmark sizes ({}) or numbers of printings'.format(', '.join(suite.SIZES)))
+    parser.addoption('--repeat', type=int, default=3, help='timed runs per stage, the fastest is reported')
+    parser.addoption('--baseline', default=suite.BASELINE, help='baseline JSON the results are compared to')
+    parser.addoption('--threshold', type=float, default=0.25, help='allowed relative growth before failing')
+    parser.addoption('--bench-output', default='data/benchmarks.json', help='JSON file the results are saved to')
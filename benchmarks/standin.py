@@ -0,0 +1,171 @@
+import bz2
+import gzip
+import json
+import lzma
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Local stand-in for the Scryfall, MTGJSON and MTGGoldfish servers, shared by the tests and benchmarks."""
+    # keep-alive connections
+    protocol_version = 'HTTP/1.1'
+    # path -> body, shared with the tests so payloads can be changed between requests
+    bodies = {}
+    # path -> number of 503 responses sent before the body
+    failures = {}
+    requests = []
+    clients = []
+    delay = 0
+    # requests being answered right now and the most answered at the same time
+    inflight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def empty(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        StandIn.requests.append(self.path)
+        StandIn.clients.append(self.client_address)
+        with StandIn.lock:
+            StandIn.inflight += 1
+            StandIn.peak = max(StandIn.peak, StandIn.inflight)
+        try:
+            self.answer()
+        finally:
+            with StandIn.lock:
+                StandIn.inflight -= 1
+
+    def answer(self):
+        time.sleep(StandIn.delay)
+        if StandIn.failures.get(self.path, 0) > 0:
+            StandIn.failures[self.path] -= 1
+            return self.empty(503)
+        body = body_of(self.path)
+        if body is None:
+            return self.empty(404)
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self.empty(304)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Tue, 01 Jun 2021 00:00:00 GMT')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+COMPRESS = {'gz': gzip.compress, 'bz2': bz2.compress, 'xz': lzma.compress}
+
+
+def body_of(path):
+    # compressed variants (.gz, .bz2, .xz) of every body are compressed on request
+    base0, ext0 = path.rsplit('.', 1) if '.' in path else (path, '')
+    if path not in StandIn.bodies and ext0 in COMPRESS and base0 in StandIn.bodies:
+        return COMPRESS[ext0](StandIn.bodies[base0])
+    return StandIn.bodies.get(path)
+
+
+def start(bodies, delay=0):
+    """
+        Starts the stand-in server on a free local port.
+
+        Returns:
+            server object (call shutdown() and server_close() when done), base url
+    """
+    StandIn.bodies = bodies
+    StandIn.failures = {}
+    StandIn.requests = []
+    StandIn.clients = []
+    StandIn.delay = delay
+    StandIn.inflight = 0
+    StandIn.peak = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, 'http://127.0.0.1:{}'.format(httpd.server_port)
+
+
+def card(i, **kwargs):
+    # one Scryfall default-cards object with the fields used by scryfall_api
+    card0 = {'object': 'card', 'id': 'scry-{}'.format(i), 'oracle_id': 'oracle-{}'.format(i),
+             'name': 'Card {}'.format(i), 'lang': 'en', 'released_at': '2021-04-23',
+             'uri': 'https://api.scryfall.com/cards/{}'.format(i),
+             'scryfall_uri': 'https://scryfall.com/card/{}'.format(i), 'layout': 'normal',
+             'image_uris': {'small': 's.jpg', 'normal': 'n{}.jpg'.format(i)}, 'mana_cost': '{1}{G}',
+             'cmc': 2.0, 'type_line': 'Creature — Beast', 'power': '2', 'toughness': '2', 'colors': ['G'],
+             'color_identity': ['G'], 'keywords': ['Trample'] if i % 2 else [], 'multiverse_ids': [i],
+             'games': ['paper'], 'legalities': {'standard': 'legal'}, 'prices': {'usd': '0.10'},
+             'artist_ids': ['a'], 'illustration_id': 'ill', 'card_back_id': 'back', 'set': 'stx',
+             'set_type': 'expansion', 'rarity': 'common', 'arena_id': i, 'promo_types': None,
+             'frame_effects': None, 'produced_mana': None}
+    card0.update(kwargs)
+    return card0
+
+
+def prices(days, ncard=6):
+    """
+        Builds an MTGJSON price file (AllPrices.json or AllPricesToday.json) with the prices of `days`.
+
+        Returns:
+            body bytes
+    """
+    prices0 = {'u{}'.format(i): {'mtgo': {'cardhoarder': {'retail': {'normal': {d: 0.01 for d in days}}}},
+                                 'paper': {'tcgplayer': {'buylist': {'normal': {d: round(0.1 * i, 2) for d in days}},
+                                                         'retail': {'normal': {d: round(0.2 * i, 2) for d in days},
+                                                                    'foil': {d: 1.0 for d in days}},
+                                                         'currency': 'USD'}}}
+               for i in range(ncard + 2)}
+    return json.dumps({'meta': {'version': '5.1'}, 'data': prices0}).encode()
+
+
+def payloads(ncard=6):
+    """
+        Builds small but complete Scryfall, MTGJSON and MTGGoldfish payloads.
+
+        Returns:
+            dictionary of {path: body bytes}
+    """
+    cards = [card(0, all_parts=[{'id': 'scry-1'}], preview={'source': 'x'}, card_faces=[{'name': 'Card 0'}])] + \
+        [card(i) for i in range(1, ncard)] + [card(ncard, lang='ja'),
+                                               card(ncard + 1, type_line='Basic Land — Forest')]
+    idens = {'u{}'.format(i): {'name': 'Card {}'.format(i), 'uuid': 'u{}'.format(i), 'type': 'Creature — Beast',
+                               'availability': ['paper'], 'legalities': {'standard': 'Legal'}, 'rulings': [],
+                               'subtypes': ['Beast'], 'supertypes': [], 'types': ['Creature'],
+                               'identifiers': {'mtgjsonV4Id': 'v4-{}'.format(i), 'scryfallId': 'scry-{}'.format(i),
+                                               'scryfallOracleId': 'oracle-{}'.format(i),
+                                               'scryfallIllustrationId': 'ill', 'tcgplayerProductId': '1'}}
+             for i in range(ncard)}
+    days = ['2021-06-0{}'.format(d) for d in range(1, 4)]
+    table = '<html><body><table><tr><th></th><th>Card</th><th>Decks</th></tr>' + \
+            ''.join('<tr><td>{0}</td><td>Card {0}</td><td>{1}%</td></tr>'.format(i, 10 * i) for i in range(3)) + \
+            '</table></body></html>'
+    return {'/bulk-data/default-cards': json.dumps({'object': 'bulk_data', 'type': 'default_cards',
+                                                    'updated_at': '2021-06-03T09:00:00.000+00:00', 'size': 1,
+                                                    'download_uri': '{base}/default-cards.json'}).encode(),
+            '/default-cards.json': json.dumps(cards).encode(),
+            '/AllIdentifiers.json': json.dumps({'meta': {'version': '5.1'}, 'data': idens}).encode(),
+            '/AllPrices.json': prices(days, ncard),
+            '/AllPricesToday.json': prices(['2021-06-03'], ncard),
+            '/creatures': table.encode(), '/spells': table.encode()}
+
+
+def point(mtg, base):
+    # direct every MTGAPI url to the stand-in server
+    if '/bulk-data/default-cards' in StandIn.bodies:
+        StandIn.bodies['/bulk-data/default-cards'] = StandIn.bodies['/bulk-data/default-cards'].replace(
+            b'{base}', base.encode())
+    mtg.scryfall = base + '/bulk-data/default-cards'
+    mtg.identifier = base + '/AllIdentifiers.json'
+    mtg.mtgjson = base + '/AllPrices.json'
+    mtg.today = base + '/AllPricesToday.json'
+    mtg.creatures = base + '/creatures'
+    mtg.spells = base + '/spells'
+    return mtg
@@ -0,0 +1,323 @@
+"""
+    End-to-end benchmarks of the pipeline on synthetic data (benchmarks/synthetic.py): MTGAPI parsing of recorded
+    payloads, the Clean steps, the models, the database insert and the Flask query route, each timed and memory
+    profiled over several data sizes. Results are saved as JSON and compared against a stored baseline, a stage
+    regresses when its wall time or traced memory peak grows past the threshold.
+
+    Usage (from the repo root):
+        python run.py bench --sizes small medium
+        python -m pytest benchmarks/bench_pipeline.py --sizes small
+"""
+import io
+import os
+import sys
+import json
+import time
+import contextlib
+import datetime
+import platform
+import tempfile
+import sqlite3
+import logging.config
+import pandas as pd
+import numpy as np
+from tabulate import tabulate
+
+from benchmarks import synthetic
+from src.ingestion import get_data, cleandata, snapshots
+from src.statistics import clustering, regression
+from src.utils import profiling
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+# number of generated printings of every size, roughly a quarter is kept by MTGAPI
+SIZES = {'small': 500, 'medium': 2000, 'large': 10000}
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# base url the recorded payloads are archived under
+BASE = 'http://synthetic.local'
+
+
+class Body:
+    # response with a fixed body, archived like a download
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        yield self.body
+
+    def close(self):
+        pass
+
+
+class Data:
+    def __init__(self, size, ncard, workdir, ndays=90, seed=0):
+        """
+            Synthetic data of one size and the intermediate frames the stages start from, built once outside of
+            the timings.
+
+            Args:
+                size (string): name of the size, e.g. 'small'
+                ncard (int): number of generated printings
+                workdir (string): directory for the recorded payloads and databases
+        """
+        self.size = size
+        self.ncard = ncard
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+        self.syn = synthetic.Synthetic(ncard, ndays=ndays, seed=seed)
+        self.scry = self.syn.scryfall()
+        self.mtgjson = self.syn.mtgjson()
+        clean0 = self.clean()
+        self.merged = clean0.merge_all()
+        self.gee = clean0.for_gee()
+        self.kmeans = clean0.for_kmeans()
+        self.clusters = None
+        self.snapshotdir = None
+
+    def clean(self, **kwargs):
+        # card ages counted up to the last generated price day, so the results do not depend on the run date
+        return cleandata.Clean(self.scry, self.mtgjson, refdate=self.syn.days[-1], **kwargs)
+
+    def record(self):
+        """Archives the generated payloads as one day of raw downloads, so MTGAPI can replay them."""
+        if self.snapshotdir is None:
+            self.snapshotdir = os.path.join(self.workdir, 'snapshots')
+            arch0 = snapshots.SnapshotArchive(self.snapshotdir)
+            for path0, body in self.syn.payloads().items():
+                arch0.save(BASE + path0, Body(body.replace(b'{base}', BASE.encode())))
+        return self.snapshotdir
+
+    def mtgapi(self):
+        # MTGAPI reading every download from the recording
+        mtg = get_data.MTGAPI(codec=None, snapshotdir=self.record(), replay=datetime.date.today().isoformat())
+        mtg.scryfall = BASE + '/bulk-data/default-cards'
+        mtg.identifier = BASE + '/AllIdentifiers.json'
+        mtg.mtgjson = BASE + '/AllPrices.json'
+        mtg.today = BASE + '/AllPricesToday.json'
+        return mtg
+
+    def cluster_result(self):
+        if self.clusters is None:
+            self.clusters = clustering.run_kmeans(self.kmeans)[1]
+        return self.clusters
+
+
+def refresh(data):
+    # the Clean calls of a refresh (app.refresh, run.py s3rds) on one object
+    clean0 = data.clean(release=True)
+    return clean0.merge_all(), clean0.for_gee(), clean0.for_kmeans()
+
+
+def insert_df(data):
+    from src.storage import tomysql
+    chsql = tomysql.MysqlAll(connstring='sqlite:///' + os.path.join(data.workdir, 'insert.db'), schema=None)
+    return lambda: chsql.insert_df(data.cluster_result(), name='cluster_result', replace=True)
+
+
+# SQLite file the Flask app attaches as the msia423_db schema. The app, and with it its engine, is only imported once
+# per process, so the file of the current data size is looked up on every connection
+FLASKDB = {}
+
+
+def attach(conn, record):
+    conn.execute("ATTACH DATABASE '{}' AS msia423_db".format(FLASKDB['file']))
+
+
+def flask_query(data):
+    # the app reads the tables of the msia423_db schema, a second SQLite file attached under that name
+    dbfile = os.path.join(data.workdir, 'msia423_db.db')
+    with sqlite3.connect(dbfile) as conn:
+        data.cluster_result().to_sql('cluster_result', conn, if_exists='replace', index=False)
+        data.merged[['name', 'image_url']].to_sql('merge_raw', conn, if_exists='replace', index=False)
+    FLASKDB['file'] = dbfile
+    import sqlalchemy
+    # the app reads its database from the environment when it is imported, the main database is not used
+    env0 = os.environ.get('SQLALCHEMY_DATABASE_URI')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    try:
+        import app as webapp
+    finally:
+        if env0 is None:
+            del os.environ['SQLALCHEMY_DATABASE_URI']
+        else:
+            os.environ['SQLALCHEMY_DATABASE_URI'] = env0
+
+    with webapp.app.app_context():
+        engine = webapp.db.engine
+    if not sqlalchemy.event.contains(engine, 'connect', attach):
+        sqlalchemy.event.listen(engine, 'connect', attach)
+    # connections opened for an earlier file are closed
+    engine.dispose()
+    client = webapp.app.test_client()
+    name0 = data.kmeans['name'].iloc[0]
+
+    def post():
+        resp = client.post('/', data={'cardname': name0, 'ncard0': '10'})
+        assert resp.status_code == 200
+        return resp
+    return post
+
+
+# stage name -> function returning the call to time for a given Data
+STAGES = {
+    'MTGAPI.scryfall_api': lambda d: d.mtgapi().scryfall_api,
+    'MTGAPI.mtgjson_api': lambda d: lambda: d.mtgapi().mtgjson_api(incremental=False),
+    'Clean.merge_all': lambda d: lambda: d.clean().merge_all(),
+    'Clean.merge_clean': lambda d: lambda: d.clean().merge_clean(),
+    'Clean.for_gee': lambda d: lambda: d.clean().for_gee(),
+    'Clean.for_kmeans': lambda d: lambda: d.clean().for_kmeans(),
+    'Clean.refresh': lambda d: lambda: refresh(d),
+    'run_kmeans': lambda d: lambda: clustering.run_kmeans(d.kmeans),
+    'run_reg.gee': lambda d: lambda: regression.run_reg(d.gee, modeltype='gee'),
+    'run_reg.linear': lambda d: lambda: regression.run_reg(d.kmeans, modeltype='linear'),
+    'insert_df': insert_df,
+    'flask.query': flask_query,
+}
+
+
+def measure(name, func, repeat=3, memory=True):
+    """
+        Times a call `repeat` times and, if `memory`, runs it once more with tracemalloc.
+
+        Returns:
+            dictionary with the fastest wall and CPU seconds, the RSS growth and the traced peak in MB
+    """
+    prof0 = profiling.Profiler(trace=False)
+    # the models print their results, which would bury the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            with prof0.stage(name):
+                func()
+    rec0 = pd.DataFrame(prof0.records)
+    res0 = {'wall': rec0['wall'].min(), 'cpu': rec0['cpu'].min(),
+            'rss_growth_mb': ((rec0['rss_peak'] - rec0['rss_start']).max()) / 1024 ** 2, 'traced_peak_mb': None}
+    if memory:
+        prof1 = profiling.Profiler(trace=True)
+        with contextlib.redirect_stdout(io.StringIO()), prof1.stage(name):
+            func()
+        res0['traced_peak_mb'] = prof1.records[0]['traced_peak'] / 1024 ** 2
+    return res0
+
+
+def run(sizes=('small', 'medium'), stages=None, repeat=3, memory=True, ndays=90, seed=0):
+    """
+        Runs the benchmarks.
+
+        Args:
+            sizes (list): names of SIZES (or numbers of printings) to run
+            stages (list): names of STAGES to run, all by default
+            repeat (int): timed runs per stage, the fastest is reported
+            memory (bool): whether to run every stage once more under tracemalloc
+            ndays (int): days of prices
+            seed (int): seed of the synthetic data
+
+        Returns:
+            dictionary with the run metadata and one result per stage and size. Stages that cannot run in this
+            environment (e.g. missing database drivers) are reported with the reason in `skipped`
+    """
+    stages = list(STAGES) if stages is None else stages
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError('Unknown benchmark stages {0}, choose from {1}'.format(unknown, list(STAGES)))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp0:
+        for size in sizes:
+            ncard = SIZES[size] if size in SIZES else int(size)
+            start = time.perf_counter()
+            data = Data(str(size), ncard, os.path.join(tmp0, str(size)), ndays=ndays, seed=seed)
+            logger.info('Generated {0} data ({1} printings) in {2} seconds'.format(
+                size, ncard, round(time.perf_counter() - start, 2)))
+            for name in stages:
+                res0 = {'stage': name, 'size': str(size), 'ncard': ncard, 'skipped': None}
+                try:
+                    func = STAGES[name](data)
+                except ImportError as e:
+                    res0['skipped'] = repr(e)
+                    logger.warning('Skipping {0}: {1}'.format(name, e))
+                else:
+                    res0.update(measure(name, func, repeat=repeat, memory=memory))
+                results.append(res0)
+    profiling.PROFILER.reset()
+    meta = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'platform': platform.platform(),
+            'repeat': repeat, 'ndays': ndays, 'seed': seed}
+    return {'meta': meta, 'results': results}
+
+
+def save(report, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(report, baseline, threshold=0.25, metrics=('wall', 'traced_peak_mb'), floor=(0.05, 1.0)):
+    """
+        Compares benchmark results against a baseline.
+
+        Args:
+            report (dict): output of run()
+            baseline (dict): output of an earlier run()
+            threshold (float): largest allowed relative growth of each metric, e.g. 0.25 for 25%
+            metrics (list): metrics compared
+            floor (list): absolute growth of each metric ignored as noise (seconds, MB)
+
+        Returns:
+            Pandas dataframe with one row per stage, size and metric present in both, with the ratio to the
+            baseline and whether it regressed
+    """
+    cols = ['stage', 'size', 'metric', 'baseline', 'current', 'ratio', 'regressed']
+    base0 = {(r['stage'], r['size']): r for r in baseline['results'] if not r.get('skipped')}
+    rows = []
+    for r in report['results']:
+        b = base0.get((r['stage'], r['size']))
+        if b is None or r.get('skipped'):
+            continue
+        for m, fl in zip(metrics, floor):
+            if r.get(m) is None or b.get(m) is None:
+                continue
+            ratio = r[m] / b[m] if b[m] else np.inf
+            rows.append([r['stage'], r['size'], m, b[m], r[m], ratio,
+                         bool(r[m] > b[m] * (1 + threshold) and r[m] - b[m] > fl)])
+    return pd.DataFrame(rows, columns=cols)
+
+
+def table(report):
+    """Returns the results as a printable table."""
+    df0 = pd.DataFrame(report['results'])
+    return tabulate(df0.round(3), headers='keys', tablefmt='psql', showindex=False)
+
+
+def main(sizes=('small', 'medium'), stages=None, repeat=3, memory=True, baseline=BASELINE, threshold=0.25,
+         output='data/benchmarks.json', update=False):
+    """
+        Runs the benchmarks, saves the results and compares them against the baseline (used by `run.py bench`).
+
+        Returns:
+            0 if no stage regressed, 1 otherwise
+    """
+    report = run(sizes, stages, repeat=repeat, memory=memory)
+    save(report, output)
+    print(table(report))
+    if update or not os.path.isfile(baseline):
+        save(report, baseline)
+        logger.info('Saved the results as the new baseline {}'.format(baseline))
+        return 0
+    comp0 = compare(report, load(baseline), threshold=threshold)
+    print(comp0.round(3).to_string(index=False))
+    regressed = comp0[comp0['regressed']]
+    if len(regressed):
+        logger.error('{0} benchmark(s) regressed by more than {1}%:\n{2}'.format(
+            len(regressed), round(100 * threshold), regressed.to_string(index=False)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,507 @@
+"""
+    Seeded generator of synthetic Scryfall and MTGJSON data for offline benchmarks. The same cards can be emitted
+    as raw bulk JSON (default-cards.json, AllIdentifiers.json, AllPrices.json, AllPricesToday.json), as payloads for
+    the local stand-in server, or directly as the dataframes returned by MTGAPI.scryfall_api and
+    MTGAPI.mtgjson_api. The dataframes are built with the same get_data functions MTGAPI uses, without writing or
+    parsing any JSON, so they stay cheap at 200k cards.
+
+    Usage (from the repo root):
+        python -m benchmarks.synthetic --ncard 20000 --ndays 90 --outdir data/synthetic --codec gz
+"""
+import os
+import bz2
+import gzip
+import json
+import lzma
+import argparse
+import pandas as pd
+import numpy as np
+
+from src.ingestion import get_data
+from src.storage import pricestore
+from src.utils import dtypes
+
+
+RARITIES = ['common', 'uncommon', 'rare', 'mythic', 'special']
+TYPES = ['Creature', 'Instant', 'Sorcery', 'Enchantment', 'Artifact', 'Land', 'Planeswalker']
+COLORS = ['W', 'U', 'B', 'R', 'G']
+LANGS = ['ja', 'de', 'fr', 'es', 'it']
+KEYWORDS = ['Flying', 'Trample', 'Haste', 'Vigilance', 'Lifelink', 'Deathtouch', 'Reach', 'First strike', 'Flash',
+            'Menace', 'Defender', 'Hexproof', 'Indestructible', 'Scry', 'Mill', 'Prowess', 'Kicker', 'Cycling',
+            'Equip', 'Enchant', 'Ward', 'Fight', 'Double strike', 'Landfall', 'Crew', 'Foretell', 'Learn',
+            'Magecraft', 'Escape', 'Mutate', 'Adamant', 'Boast', 'Protection', 'Changeling', 'Companion',
+            'Constellation', 'Hexproof from']
+SUBTYPES = ['Human', 'Elf', 'Goblin', 'Zombie', 'Wizard', 'Soldier', 'Warrior', 'Knight', 'Beast', 'Spirit',
+            'Cleric', 'Rogue', 'Shaman', 'Dragon', 'Vampire', 'Angel', 'Elemental', 'Merfolk', 'Cat', 'Bird',
+            'Aura', 'Equipment', 'Vehicle', 'Saga', 'Adventure', 'Lesson', 'Giant', 'Dwarf', 'Demon', 'Horror',
+            'Insect', 'Druid', 'Wolf', 'Snake', 'Faerie', 'Treefolk', 'Golem', 'Construct', 'Dinosaur', 'Pirate',
+            'Hydra', 'Sphinx', 'Troll', 'Ogre', 'Orc', 'Berserker', 'Assassin', 'Advisor', 'Kor', 'God']
+WORDS = ['Ancient', 'Burning', 'Silent', 'Grim', 'Verdant', 'Storm', 'Iron', 'Hollow', 'Radiant', 'Feral', 'Sunken',
+         'Glorious', 'Wicked', 'Frost', 'Shadow', 'Thorn', 'Ember', 'Tidal', 'Wild', 'Gilded']
+NOUNS = ['Sentinel', 'Oath', 'Drake', 'Pact', 'Harbinger', 'Grove', 'Tyrant', 'Charm', 'Strike', 'Seer', 'Titan',
+         'Ritual', 'Hound', 'Vault', 'Herald', 'Reckoning', 'Wanderer', 'Idol', 'Bloom', 'Colossus']
+# fields of a Scryfall card object in the order the bulk download lists them
+FIELDS = ['object', 'id', 'oracle_id', 'multiverse_ids', 'mtgo_id', 'mtgo_foil_id', 'tcgplayer_id', 'cardmarket_id',
+          'arena_id', 'name', 'printed_name', 'lang', 'released_at', 'uri', 'scryfall_uri', 'layout',
+          'highres_image', 'image_status', 'image_uris', 'mana_cost', 'cmc', 'type_line', 'printed_type_line',
+          'oracle_text', 'printed_text', 'power', 'toughness', 'loyalty', 'colors', 'color_indicator',
+          'color_identity', 'keywords', 'produced_mana', 'all_parts', 'card_faces', 'legalities', 'games',
+          'reserved', 'foil', 'nonfoil', 'oversized', 'promo', 'reprint', 'variation', 'variation_of', 'set',
+          'set_name', 'set_type', 'collector_number', 'digital', 'rarity', 'watermark', 'flavor_name',
+          'flavor_text', 'card_back_id', 'artist', 'artist_ids', 'illustration_id', 'border_color', 'frame',
+          'frame_effects', 'full_art', 'textless', 'booster', 'story_spotlight', 'edhrec_rank', 'promo_types',
+          'preview', 'prices', 'content_warning', 'life_modifier', 'hand_modifier']
+# optional fields that Clean.merge_clean uses by name, so at least one kept card must have them
+REQUIRED = {'printed_name': None, 'printed_type_line': None, 'printed_text': None, 'content_warning': True,
+            'variation_of': None, 'flavor_name': None, 'watermark': 'set', 'power': '2', 'toughness': '2',
+            'loyalty': '3'}
+OPENERS = {None: open, 'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+
+def vocabulary(base, n, prefix):
+    # the first n names of a real vocabulary, extended with generated names when n is larger
+    return base[:n] + ['{0}{1}'.format(prefix, i) for i in range(max(n - len(base), 0))]
+
+
+def zipf(n, a=1.1):
+    # skewed frequencies, a few keywords/subtypes are on many cards and most are rare
+    p0 = 1 / np.arange(1, n + 1) ** a
+    return p0 / p0.sum()
+
+
+def kept(cards):
+    # same filter as get_data.scryfall_keep, vectorized over all generated printings
+    return cards['legal'] & np.isin(cards['set_type'], ['expansion', 'core']) & \
+        (np.array(cards['lang']) == 'en') & ~cards['basic']
+
+
+class Synthetic:
+    def __init__(self, ncard=1000, ndays=90, nkeyword=40, nsubtype=200, nset=None, seed=0, end='2021-06-03'):
+        """
+            Generates `ncard` printings with `ndays` of daily prices up to `end`. Everything is drawn up front from
+            one seeded generator, so the same arguments always give the same cards, JSON and dataframes.
+
+            Args:
+                ncard (int): number of Scryfall printings, including the ones MTGAPI filters out (non-English,
+                             not standard legal, basic lands)
+                ndays (int): number of days of prices
+                nkeyword (int): number of distinct keywords (columns of the kw_ indicators)
+                nsubtype (int): number of distinct subtypes (columns of the subtype_ indicators)
+                nset (int): number of sets, defaults to one per 300 cards (at least 10)
+                seed (int): seed of the random generator
+                end (string): last price day (YYYY-MM-DD)
+        """
+        self.ncard = ncard
+        self.ndays = ndays
+        self.seed = seed
+        self.keywords = vocabulary(KEYWORDS, nkeyword, 'Keyword')
+        self.subtypes = vocabulary(SUBTYPES, nsubtype, 'Kind')
+        self.days = pd.date_range(end=end, periods=ndays).strftime('%Y-%m-%d').tolist()
+        self.rng = np.random.default_rng(seed)
+        self.cards = self.generate(nset or max(10, ncard // 300), pd.Timestamp(end))
+        self.buy, self.sell, self.hasbuy = self.generate_prices()
+        self.index = {u: i for i, u in enumerate(self.cards['uuid'])}
+
+    def uuids(self, n):
+        hex0 = self.rng.bytes(16 * n).hex()
+        return ['{0}-{1}-{2}-{3}-{4}'.format(hex0[i:i + 8], hex0[i + 8:i + 12], hex0[i + 12:i + 16],
+                                             hex0[i + 16:i + 20], hex0[i + 20:i + 32]) for i in range(0, 32 * n, 32)]
+
+    def sample(self, p, k):
+        # up to k[i] distinct indices for every card, drawn with probabilities p in one call
+        draws = self.rng.choice(len(p), size=(len(k), 2 * max(int(k.max(initial=0)), 1)), p=p).tolist()
+        return [sorted(list(dict.fromkeys(d))[:j]) if j else [] for d, j in zip(draws, k.tolist())]
+
+    def generate(self, nset, end):
+        rng = self.rng
+        n = self.ncard
+
+        # sets: code, name, type and release date
+        codes = [''.join(chr(97 + (s // 26 ** j) % 26) for j in range(3)) for s in range(nset)]
+        setnames = ['{0} {1}'.format(WORDS[s % len(WORDS)], NOUNS[(s // len(WORDS)) % len(NOUNS)])
+                    + ('' if s < len(WORDS) * len(NOUNS) else ' {}'.format(s)) for s in range(nset)]
+        settypes = rng.choice(['expansion', 'core', 'masters', 'commander', 'promo'], size=nset,
+                              p=[0.6, 0.15, 0.1, 0.1, 0.05])
+        setage = rng.integers(0, 4 * 365, size=nset)
+        set0 = rng.integers(0, nset, size=n)
+        age = setage[set0]
+        released = (end - pd.to_timedelta(age, unit='D')).strftime('%Y-%m-%d').tolist()
+
+        rarity = rng.choice(RARITIES, size=n, p=[0.44, 0.3, 0.18, 0.06, 0.02])
+        lang = np.where(rng.random(n) < 0.9, 'en', rng.choice(LANGS, size=n))
+        type0 = rng.choice(TYPES, size=n, p=[0.45, 0.12, 0.12, 0.1, 0.1, 0.08, 0.03])
+        basic = (type0 == 'Land') & (rng.random(n) < 0.25)
+        legendary = (type0 == 'Planeswalker') | (rng.random(n) < 0.08)
+        snow = rng.random(n) < 0.02
+        legal = (np.isin(settypes[set0], ['expansion', 'core'])) & (rarity != 'special') & \
+            (rng.random(n) < np.where(age < 730, 0.9, 0.05))
+
+        # colors and mana costs
+        ncolor = np.where(np.isin(type0, ['Land', 'Artifact']), 0, rng.choice([1, 2, 3], size=n, p=[0.8, 0.17, 0.03]))
+        colors = [sorted(rng.choice(5, size=c, replace=False).tolist()) for c in ncolor]
+        colors = [[COLORS[c] for c in cs] for cs in colors]
+        generic = rng.integers(0, 6, size=n)
+        xcost = rng.random(n) < 0.03
+        hybrid = rng.random(n) < 0.03
+        manacost, cmc = [], []
+        for i in range(n):
+            if type0[i] == 'Land':
+                manacost.append('')
+                cmc.append(0.0)
+                continue
+            pips = [c for c in colors[i] for _ in range(1 + int(rng.integers(0, 2)))]
+            if hybrid[i] and len(colors[i]) > 1:
+                pips = ['{0}/{1}'.format(*colors[i][:2])] + pips[2:]
+            cost = ('{X}' if xcost[i] else '') + ('{{{}}}'.format(generic[i]) if generic[i] or not pips else '') + \
+                ''.join('{{{}}}'.format(p) for p in pips)
+            manacost.append(cost)
+            cmc.append(float(generic[i] + len(pips)))
+
+        # keywords and subtypes, skewed towards the first names of each vocabulary
+        nkw = np.minimum(rng.poisson(np.where(type0 == 'Creature', 1.0, 0.3)), 4)
+        keywords = [[self.keywords[k] for k in ks] for ks in self.sample(zipf(len(self.keywords)), nkw)]
+        nsub = np.where(type0 == 'Creature', rng.choice([1, 2], size=n, p=[0.6, 0.4]),
+                        np.where(type0 == 'Planeswalker', 1, (rng.random(n) < 0.15).astype(int)))
+        subtypes = [[self.subtypes[k] for k in ks] for ks in self.sample(zipf(len(self.subtypes)), nsub)]
+        subtypes = [['Forest'] if basic[i] else subtypes[i] for i in range(n)]
+        supertypes = [(['Basic'] if basic[i] else []) + (['Legendary'] if legendary[i] and not basic[i] else []) +
+                      (['Snow'] if snow[i] else []) for i in range(n)]
+        typeline = [' '.join(supertypes[i] + [type0[i]]) + (' — ' + ' '.join(subtypes[i]) if subtypes[i] else '')
+                    for i in range(n)]
+        produced = [['G'] if basic[i] else (sorted(rng.choice(COLORS, size=2, replace=False).tolist())
+                                            if type0[i] == 'Land' else
+                                            (['C'] if type0[i] == 'Artifact' and rng.random() < 0.15 else None))
+                    for i in range(n)]
+
+        creature = type0 == 'Creature'
+        power = [str(p) if c else None for p, c in zip(rng.integers(0, 8, size=n), creature)]
+        toughness = [str(t) if c else None for t, c in zip(rng.integers(1, 8, size=n), creature)]
+        loyalty = [str(v) if t == 'Planeswalker' else None for v, t in zip(rng.integers(2, 7, size=n), type0)]
+
+        def some(p, values):
+            # value where a card has the field, None (field left out) elsewhere
+            mask0 = rng.random(n) < p
+            return [v if m else None for v, m in zip(values, mask0)]
+
+        ints = rng.integers(1000, 600000, size=(5, n)).tolist()
+        ids = self.uuids(n)
+        names = ['{0} {1}'.format(WORDS[k % len(WORDS)], NOUNS[(k // len(WORDS)) % len(NOUNS)]) +
+                 ('' if k < len(WORDS) * len(NOUNS) else ' {}'.format(k // (len(WORDS) * len(NOUNS))))
+                 for k in rng.integers(0, max(int(n * 0.8), 1), size=n)]
+        foreign = lang != 'en'
+        cards = {
+            'object': ['card'] * n,
+            'id': ids,
+            'oracle_id': self.uuids(n),
+            'multiverse_ids': [[m] for m in ints[0]],
+            'mtgo_id': some(0.7, ints[1]),
+            'mtgo_foil_id': some(0.5, ints[2]),
+            'tcgplayer_id': some(0.9, ints[3]),
+            'cardmarket_id': some(0.85, ints[4]),
+            'arena_id': some(0.7, rng.integers(60000, 80000, size=n).tolist()),
+            'name': names,
+            'printed_name': [names[i][::-1] if foreign[i] else None for i in range(n)],
+            'lang': lang.tolist(),
+            'released_at': released,
+            'uri': ['https://api.scryfall.com/cards/{}'.format(i) for i in ids],
+            'scryfall_uri': ['https://scryfall.com/card/{}'.format(i) for i in ids],
+            'layout': rng.choice(['normal', 'transform', 'adventure', 'saga'], size=n,
+                                 p=[0.93, 0.03, 0.02, 0.02]).tolist(),
+            'highres_image': (rng.random(n) < 0.9).tolist(),
+            'image_status': rng.choice(['highres_scan', 'lowres', 'placeholder'], size=n,
+                                       p=[0.9, 0.08, 0.02]).tolist(),
+            'image_uris': some(0.98, [{'small': 'https://c1.scryfall.com/small/{}.jpg'.format(i),
+                                       'normal': 'https://c1.scryfall.com/normal/{}.jpg'.format(i),
+                                       'large': 'https://c1.scryfall.com/large/{}.jpg'.format(i)} for i in ids]),
+            'mana_cost': manacost,
+            'cmc': cmc,
+            'type_line': typeline,
+            'printed_type_line': [typeline[i] if foreign[i] else None for i in range(n)],
+            'oracle_text': ['{0}{1}When this enters the battlefield, draw a card.'.format(
+                ', '.join(k), '\n' if k else '') for k in keywords],
+            'printed_text': [keywords[i][0] if foreign[i] and keywords[i] else None for i in range(n)],
+            'power': power,
+            'toughness': toughness,
+            'loyalty': loyalty,
+            'colors': colors,
+            'color_indicator': [colors[i] if manacost[i] == '' and colors[i] else None for i in range(n)],
+            'color_identity': colors,
+            'keywords': keywords,
+            'produced_mana': produced,
+            'all_parts': some(0.05, [[{'object': 'related_card', 'id': i}] for i in ids]),
+            'card_faces': None,
+            'legalities': [{'standard': 'legal' if g else 'not_legal', 'pioneer': 'legal' if g else 'not_legal',
+                            'vintage': 'legal'} for g in legal],
+            'games': [['paper', 'mtgo', 'arena'] if a else ['paper', 'mtgo'] for a in rng.random(n) < 0.7],
+            'reserved': (rng.random(n) < 0.01).tolist(),
+            'foil': (rng.random(n) < 0.8).tolist(),
+            'nonfoil': (rng.random(n) < 0.95).tolist(),
+            'oversized': (rng.random(n) < 0.001).tolist(),
+            'promo': (rng.random(n) < 0.05).tolist(),
+            'reprint': (rng.random(n) < 0.2).tolist(),
+            'variation': (rng.random(n) < 0.01).tolist(),
+            'variation_of': some(0.01, self.uuids(n)),
+            'set': [codes[s] for s in set0],
+            'set_name': [setnames[s] for s in set0],
+            'set_type': settypes[set0].tolist(),
+            'collector_number': [str(c) for c in rng.integers(1, 400, size=n)],
+            'digital': (rng.random(n) < 0.02).tolist(),
+            'rarity': rarity.tolist(),
+            'watermark': some(0.08, rng.choice(['set', 'planeswalker', 'guild'], size=n).tolist()),
+            'flavor_name': some(0.005, names),
+            'flavor_text': some(0.4, ['Every {} has its day.'.format(w.lower()) for w in names]),
+            'card_back_id': ['0aeebaf5-8c7d-4636-9e82-8c27447861f7'] * n,
+            'artist': ['{0} {1}'.format(NOUNS[a % len(NOUNS)], WORDS[a // len(NOUNS) % len(WORDS)])
+                       for a in rng.integers(0, 300, size=n)],
+            'artist_ids': [[a] for a in self.uuids(n)],
+            'illustration_id': self.uuids(n),
+            'border_color': rng.choice(['black', 'borderless', 'white'], size=n, p=[0.95, 0.04, 0.01]).tolist(),
+            'frame': rng.choice(['2015', '1997', 'future'], size=n, p=[0.9, 0.08, 0.02]).tolist(),
+            'frame_effects': some(0.08, rng.choice(['legendary', 'showcase', 'extendedart'], size=n).tolist()),
+            'full_art': (rng.random(n) < 0.02).tolist(),
+            'textless': (rng.random(n) < 0.005).tolist(),
+            'booster': (rng.random(n) < 0.9).tolist(),
+            'story_spotlight': (rng.random(n) < 0.01).tolist(),
+            'edhrec_rank': some(0.8, rng.integers(1, 20000, size=n).tolist()),
+            'promo_types': some(0.05, [['prerelease']] * n),
+            'preview': some(0.05, [{'source': 'synthetic', 'previewed_at': r} for r in released]),
+            'prices': [{'usd': None, 'usd_foil': None, 'eur': None, 'tix': None}] * n,
+            'content_warning': some(0.002, [True] * n),
+            'life_modifier': [None] * n,
+            'hand_modifier': [None] * n,
+            'legal': legal,
+            'basic': basic,
+            'age': age,
+        }
+        cards['card_faces'] = [[{'name': names[i]}, {'name': names[i] + ' Reborn'}]
+                               if cards['layout'][i] in ['transform', 'adventure'] else None for i in range(n)]
+        cards['frame_effects'] = [[f] if f is not None else None for f in cards['frame_effects']]
+
+        # the optional fields Clean drops by name are given to the first kept card if no kept card has them
+        keep = kept(cards)
+        if keep.any():
+            first = int(np.argmax(keep))
+            for c, v in REQUIRED.items():
+                if all(cards[c][i] is None for i in np.flatnonzero(keep)):
+                    cards[c][first] = names[first] if v is None else v
+
+        # MTGJSON identifiers of the English printings
+        cards['uuid'] = self.uuids(n)
+        cards['v4id'] = self.uuids(n)
+        cards['paper'] = ~foreign
+        cards['subtypes'] = subtypes
+        cards['supertypes'] = supertypes
+        cards['types'] = type0.tolist()
+        cards['rulings'] = [[{'date': '2021-01-01', 'text': 'Ruling {}.'.format(r)} for r in range(k)]
+                            for k in rng.poisson(0.5, size=n)]
+        return cards
+
+    def generate_prices(self):
+        rng = self.rng
+        n, d = self.ncard, self.ndays
+        # log-normal starting prices by rarity and a geometric random walk with a card specific drift and volatility
+        base = pd.Series(self.cards['rarity']).map({'common': 0.12, 'uncommon': 0.25, 'rare': 1.2, 'mythic': 5.0,
+                                                    'special': 2.0}).values
+        start = np.log(base) + rng.normal(0, 0.7, size=n)
+        drift = rng.normal(0, 0.003, size=n)
+        vol = rng.uniform(0.005, 0.04, size=n)
+        walk = np.cumsum(rng.normal(drift[:, None], vol[:, None], size=(n, d)), axis=1)
+        sell = np.maximum(np.round(np.exp(start[:, None] + walk), 2), 0.01)
+        buy = np.maximum(np.round(sell * rng.uniform(0.3, 0.6, size=(n, 1)), 2), 0.01)
+
+        # no prices before the set was released and a few missing days
+        daynum = np.arange(d)[None, :] - (d - 1)
+        missing = (daynum < -self.cards['age'][:, None]) | (rng.random((n, d)) < 0.005)
+        sell[missing] = np.nan
+        buy[missing] = np.nan
+        # cards without buylist prices are dropped by MTGAPI.mtgjson_api
+        hasbuy = rng.random(n) < 0.92
+        return buy, sell, hasbuy
+
+    def card(self, i):
+        """Returns the Scryfall card object of printing `i` (fields without a value are left out)."""
+        return {f: self.cards[f][i] for f in FIELDS if self.cards[f][i] is not None}
+
+    def identifier(self, i):
+        """Returns the AllIdentifiers.json entry of printing `i`."""
+        c = self.cards
+        return {'name': c['name'][i], 'uuid': c['uuid'][i], 'type': c['type_line'][i],
+                'availability': ['paper', 'mtgo'] + (['arena'] if 'arena' in c['games'][i] else []),
+                'legalities': {'standard': 'Legal', 'vintage': 'Legal'} if c['legal'][i] else {'vintage': 'Legal'},
+                'rulings': c['rulings'][i], 'subtypes': c['subtypes'][i], 'supertypes': c['supertypes'][i],
+                'types': [c['types'][i]],
+                'identifiers': {'mtgjsonV4Id': c['v4id'][i], 'scryfallId': c['id'][i],
+                                'scryfallOracleId': c['oracle_id'][i],
+                                'scryfallIllustrationId': c['illustration_id'][i],
+                                'tcgplayerProductId': str(c['tcgplayer_id'][i] or '')}}
+
+    def price(self, i, days=None):
+        """
+            Returns the AllPrices.json entry of printing `i`.
+
+            Args:
+                days (slice): days of the price arrays to include, all days by default
+        """
+        days = slice(None) if days is None else days
+
+        def series(values):
+            return {d: v for d, v in zip(self.days[days], values[days].tolist()) if v == v}
+
+        sell, buy = self.sell[i], self.buy[i]
+        tcg = {'retail': {'normal': series(sell), 'foil': series(np.round(sell * 2.5, 2))}, 'currency': 'USD'}
+        if self.hasbuy[i]:
+            tcg['buylist'] = {'normal': series(buy)}
+        ck = {'retail': {'normal': series(np.round(sell * 1.1, 2))}, 'buylist': {'normal': series(buy)},
+              'currency': 'USD'}
+        return {'mtgo': {'cardhoarder': {'retail': {'normal': series(np.round(sell / 10, 2))}, 'currency': 'USD'}},
+                'paper': {'tcgplayer': tcg, 'cardkingdom': ck}}
+
+    def meta(self):
+        return {'version': '5.1.0', 'date': self.days[-1]}
+
+    def english(self):
+        return np.flatnonzero(self.cards['paper'])
+
+    def write_json(self, path, codec=None):
+        # writes every file one card at a time, so memory stays flat even for the largest card counts
+        opener = OPENERS[codec]
+        name0 = os.path.basename(path)
+        with opener(path + ('' if codec is None else '.' + codec), 'wt') as f:
+            if name0 == 'default-cards.json':
+                f.write('[')
+                for i in range(self.ncard):
+                    f.write((',\n' if i else '') + json.dumps(self.card(i)))
+                f.write(']')
+                return
+            f.write('{"meta": %s, "data": {' % json.dumps(self.meta()))
+            for j, i in enumerate(self.english()):
+                if name0 == 'AllIdentifiers.json':
+                    value = self.identifier(i)
+                else:
+                    value = self.price(i, slice(-1, None) if name0 == 'AllPricesToday.json' else None)
+                f.write((',\n' if j else '') + json.dumps(self.cards['uuid'][i]) + ': ' + json.dumps(value))
+            f.write('}}')
+
+    def write(self, outdir, codec=None):
+        """
+            Writes the raw bulk files.
+
+            Args:
+                outdir (string): output directory
+                codec (string): compression of the files, None, 'gz', 'bz2' or 'xz'
+
+            Returns:
+                list of written paths
+        """
+        os.makedirs(outdir, exist_ok=True)
+        paths = []
+        for name0 in ['default-cards.json', 'AllIdentifiers.json', 'AllPrices.json', 'AllPricesToday.json']:
+            self.write_json(os.path.join(outdir, name0), codec)
+            paths.append(os.path.join(outdir, name0) + ('' if codec is None else '.' + codec))
+        return paths
+
+    def payloads(self):
+        """
+            Builds the bodies served by the stand-in server (benchmarks/standin.py), same paths as
+            standin.payloads.
+
+            Returns:
+                dictionary of {path: body bytes}
+        """
+        idens = {self.cards['uuid'][i]: self.identifier(i) for i in self.english()}
+        days0 = {'/AllPrices.json': None, '/AllPricesToday.json': slice(-1, None)}
+        names = sorted(set(self.cards['name']))[:50]
+        table = '<html><body><table><tr><th></th><th>Card</th><th>Decks</th></tr>' + \
+                ''.join('<tr><td>{0}</td><td>{1}</td><td>{2}%</td></tr>'.format(i, c, 50 - i)
+                        for i, c in enumerate(names)) + '</table></body></html>'
+        bodies = {'/bulk-data/default-cards': json.dumps({
+                      'object': 'bulk_data', 'type': 'default_cards',
+                      'updated_at': self.days[-1] + 'T09:00:00.000+00:00',
+                      'size': self.ncard,
+                      'download_uri': '{base}/default-cards.json'}).encode(),
+                  '/default-cards.json': json.dumps([self.card(i) for i in range(self.ncard)]).encode(),
+                  '/AllIdentifiers.json': json.dumps({'meta': self.meta(), 'data': idens}).encode(),
+                  '/creatures': table.encode(), '/spells': table.encode()}
+        for path0, days in days0.items():
+            bodies[path0] = json.dumps({'meta': self.meta(), 'data': {
+                self.cards['uuid'][i]: self.price(i, days) for i in self.english()}}).encode()
+        return bodies
+
+    def scryfall(self, hotdtype='int64', sparse=False):
+        """
+            Returns:
+                Pandas dataframe with the same columns and values MTGAPI.scryfall_api returns for these cards
+        """
+        rows = np.flatnonzero(kept(self.cards))
+        card1 = pd.DataFrame({f: [np.nan if self.cards[f][i] is None else self.cards[f][i] for i in rows]
+                              for f in FIELDS})
+        # fields without a value on any kept card are not columns of the parsed bulk download either
+        card1 = card1.dropna(axis=1, how='all')
+        card1 = get_data.scryfall_frame(card1, hotdtype=hotdtype, sparse=sparse)
+        return dtypes.downcast(card1, 'scryfall_api')
+
+    def identifiers(self, hotdtype='int64', sparse=False):
+        """
+            Returns:
+                dataframe and join columns MTGAPI.mtgjson_id returns for these cards
+        """
+        c = self.cards
+        rows = self.english()
+        iden1 = pd.DataFrame([self.identifier(i) for i in rows], index=[c['uuid'][i] for i in rows], dtype=object)
+        iden3, idkey1 = get_data.identifier_frame(iden1, hotdtype=hotdtype, sparse=sparse)
+        return dtypes.downcast(iden3, 'mtgjson_id'), idkey1
+
+    def prices(self, iden3=None):
+        """
+            Args:
+                iden3 (dataframe): identifier dataframe returned by identifiers(), built if None
+
+            Returns:
+                rows of the price arrays and buylist and retail price dataframes (p_YYYY-MM-DD columns) of the cards
+                MTGAPI.mtgjson_api keeps, in the order of the identifier dataframe
+        """
+        iden3 = self.identifiers()[0] if iden3 is None else iden3
+        rows = np.array([self.index[u] for u in iden3['uuid']], dtype=np.int64)
+        rows = rows[self.hasbuy[rows]]
+        cols = ['p_' + d for d in self.days]
+        # days without any price are not keys of any card in the price file
+        buy0 = pd.DataFrame(self.buy[rows], columns=cols).dropna(axis=1, how='all')
+        sel0 = pd.DataFrame(self.sell[rows], columns=cols).dropna(axis=1, how='all')
+        return rows, buy0, sel0
+
+    def mtgjson(self, hotdtype='int64', sparse=False):
+        """
+            Returns:
+                Pandas dataframe with the same columns and values MTGAPI.mtgjson_api returns for these cards
+                (non incremental)
+        """
+        iden3, idkey0 = self.identifiers(hotdtype=hotdtype, sparse=sparse)
+        rows, buy0, sel0 = self.prices(iden3)
+        price2 = iden3[iden3['uuid'].isin([self.cards['uuid'][i] for i in rows])].reset_index(drop=True)
+        price3 = get_data.price_frame(price2, idkey0, buy0, sel0)
+        return dtypes.downcast(price3, 'mtgjson_api')
+
+    def store(self):
+        """
+            Returns:
+                pricestore.PriceStore of the kept cards, as MTGAPI keeps it in `self.store`
+        """
+        rows, buy0, sel0 = self.prices()
+        uuids = [self.cards['uuid'][i] for i in rows]
+        return pricestore.PriceStore.from_frames(*[f.set_axis(uuids, axis=0).rename(columns=lambda c: c[len('p_'):])
+                                                   for f in [buy0, sel0]])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Scryfall and MTGJSON bulk files')
+    parser.add_argument('--ncard', type=int, default=1000, help='number of Scryfall printings')
+    parser.add_argument('--ndays', type=int, default=90, help='number of days of prices')
+    parser.add_argument('--nkeyword', type=int, default=40, help='number of distinct keywords')
+    parser.add_argument('--nsubtype', type=int, default=200, help='number of distinct subtypes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--outdir', default='data/synthetic', help='directory the files are written to')
+    parser.add_argument('--codec', default=None, choices=['gz', 'bz2', 'xz'], help='compression of the files')
+    args = parser.parse_args()
+    syn0 = Synthetic(args.ncard, args.ndays, args.nkeyword, args.nsubtype, seed=args.seed)
+    for p in syn0.write(args.outdir, args.codec):
+        print(p, os.path.getsize(p))
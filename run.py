@@ -2,19 +2,20 @@ import os
 import yaml
 import argparse
 import logging.config
-import pandas as pd
 
 try:
-    from src.ingestion import get_data as getd, cleandata
+    from src.ingestion import get_data as getd
     from src.storage import s3tofrom, tomysql
     from config.flaskconfig import SQLALCHEMY_DATABASE_URI
     from src.storage import msia423_sql as m423
-    from src.statistics import clustering, regression
+    from src.utils import profiling, dtypes, stagecache
+    from src import pipeline
 except ModuleNotFoundError:
-    from ingestion import get_data as getd, cleandata
+    from ingestion import get_data as getd
     from storage import tos3, tomysql
     from flaskconfig import SQLALCHEMY_DATABASE_URI
-    from statistics import clustering, regression
+    from utils import profiling, dtypes, stagecache
+    import pipeline
 
 
 logging.config.fileConfig(os.path.join('config', 'logging', 'local.conf'))
@@ -28,6 +29,8 @@ if __name__ == '__main__':
 
     # Add parsers for both creating a database and adding songs to it
     parser = argparse.ArgumentParser(description="Create and/or add data to database")
+    parser.add_argument("--trace", action='store_true',
+                        help="Trace Python allocations of every stage with tracemalloc (slower)")
     subparsers = parser.add_subparsers(dest='subparser_name')
 
     # Sub-parser for creating a database
@@ -45,6 +48,8 @@ if __name__ == '__main__':
     sb_create.add_argument("--item1", default="chrawdata/gold1", help="Name of the mtggoldfish raw data item")
     sb_create.add_argument("--item2", default="chrawdata/scryfall1", help="Name of the scryfall raw data item")
     sb_create.add_argument("--item3", default="chrawdata/mtgjson1", help="Name of the mtgjson raw data item")
+    sb_create.add_argument("--force", nargs='*', default=None,
+                           help="Stages to run even if cached (e.g. clean kmeans), all of them if none are given")
 
     # parser to create only an empty table
     sb_create = subparsers.add_parser("sqlempty", description="Create an empty sql table")
@@ -62,15 +67,43 @@ if __name__ == '__main__':
     sb_ingest = subparsers.add_parser("fgoogle", description="Add data to s3 bucket")
     sb_ingest.add_argument("--item2", default="scryfall1", help="Name of the scryfall raw data item")
     sb_ingest.add_argument("--item3", default="mtgjson1", help="Name of the mtgjson raw data item")
+    sb_ingest.add_argument("--force", nargs='*', default=None,
+                           help="Stages to run even if cached (e.g. clean kmeans), all of them if none are given")
+
+    # Sub-parser for re-running the pipeline on an archived day without any network access
+    sb_replay = subparsers.add_parser("replay", description="Run ingestion, cleaning and models on archived raw data")
+    sb_replay.add_argument("--date", required=True, help="Archived day to replay (YYYY-MM-DD)")
+    sb_replay.add_argument("--snapshotdir", default=None, help="Directory of the raw data archive")
+    sb_replay.add_argument("--outdir", default=None, help="Directory to save the model results to as csv files")
+    sb_replay.add_argument("--force", nargs='*', default=None,
+                           help="Stages to run even if cached (e.g. clean kmeans), all of them if none are given")
+
+    # Sub-parser for timing and memory profiling every stage on synthetic data and comparing against a baseline
+    sb_bench = subparsers.add_parser("bench", description="Benchmark the pipeline on synthetic data")
+    sb_bench.add_argument("--sizes", nargs='+', default=None, help="Data sizes (small, medium, large or card counts)")
+    sb_bench.add_argument("--stages", nargs='+', default=None, help="Stages to benchmark, all by default")
+    sb_bench.add_argument("--repeat", type=int, default=None, help="Timed runs per stage, the fastest is reported")
+    sb_bench.add_argument("--threshold", type=float, default=None, help="Allowed relative growth before failing")
+    sb_bench.add_argument("--baseline", default=None, help="Baseline JSON the results are compared to")
+    sb_bench.add_argument("--output", default=None, help="JSON file the results are saved to")
+    sb_bench.add_argument("--update", action='store_true', help="Save the results as the new baseline")
 
     args = parser.parse_args()
     sp_used = args.subparser_name
+    profiling.PROFILER.configure(**dict(yaml0['profiling'], trace=args.trace or yaml0['profiling'].get('trace')))
+    dtypes.POLICY.configure(**yaml0['dtypes'])
+    # outputs of the cleaning, models and database writes are reused while their inputs stay the same
+    cache = stagecache.from_config(**yaml0['stagecache'])
+    force = True if getattr(args, 'force', None) == [] else getattr(args, 'force', None)
+    pipe = None
 
     if sp_used == 'ingests3':
         # get raw data from the API
-        mtg = getd.MTGAPI()
-        scry0 = mtg.scryfall_api()
-        prices = mtg.mtgjson_api()
+        mtg = getd.MTGAPI(**yaml0['get_data']['MTGAPI'])
+        # download all sources at the same time
+        raw0 = mtg.ingest_all(sources=['scryfall', 'mtgjson'])
+        scry0 = raw0['scryfall']
+        prices = raw0['mtgjson']
 
         # upload raw data to S3
         s3tofrom.to_s3(scry0, customname=args.item2, bucket=args.bucket)
@@ -81,18 +114,6 @@ if __name__ == '__main__':
         s3scry = s3tofrom.from_s3(bucket=args.bucket, s3pathfile=args.item2)
         s3json = s3tofrom.from_s3(bucket=args.bucket, s3pathfile=args.item3)
 
-        # merge scryfall and mtgjson data + clean them
-        cclean = cleandata.Clean(s3scry, s3json, **yaml0['get_data']['merge_all'])
-        mergeraw = cclean.merge_all()
-        dgee = cclean.for_gee()
-        dkmean = cclean.for_kmeans()
-
-        kcenter1, kmdf0, score1 = clustering.run_kmeans(dkmean, **yaml0['clustering']['run_kmeans'])
-        rdf0, rmodel0 = regression.run_reg(dgee, modeltype='gee', **yaml0['regression']['run_reg'])
-        rdf1, rmodel1 = regression.run_reg(dkmean, modeltype='linear', **yaml0['regression']['run_reg'])
-        # get all unique card names
-        namedf = pd.DataFrame(list(set(dkmean['name'].values.tolist())), columns=['cardname'])
-
         # if the user and password arguments are not provided
         if (args.user != '') and (args.password != ''):
             chsql = tomysql.MysqlAll(u=args.user, p=args.password, db=args.dbname, schema=args.schema)
@@ -102,11 +123,9 @@ if __name__ == '__main__':
         # whether the user wants to replace an existing table or append to it
         replace0 = True if args.replace == 'yes' else False
 
-        chsql.insert_df(kmdf0, name='cluster_result', replace=replace0)
-        chsql.insert_df(rdf0, name='gee_result', replace=replace0)
-        chsql.insert_df(rdf1, name='ols_result', replace=replace0)
-        chsql.insert_df(mergeraw, name='merge_raw', replace=replace0)
-        chsql.insert_df(namedf, name='cards', replace=replace0)
+        # merge scryfall and mtgjson data + clean them, run the models and insert the results, skipping the stages
+        # whose inputs did not change since the last run
+        pipe = pipeline.refresh(yaml0, s3scry, s3json, cache=cache, chsql=chsql, replace=replace0, force=force).run()
 
     elif sp_used == 'fgoogle':
         # this only reads data from S3 and runs the models, no insertion back into RDS
@@ -115,24 +134,53 @@ if __name__ == '__main__':
         s3scry = s3tofrom.from_s3(bucket=args.bucket, s3pathfile=args.item2)
         s3json = s3tofrom.from_s3(bucket=args.bucket, s3pathfile=args.item3)
 
-        # merge scryfall and mtgjson data + clean them
-        cclean = cleandata.Clean(s3scry, s3json, **yaml0['get_date']['merge_all'])
-        mergeraw = cclean.merge_all()
-        dgee = cclean.for_gee()
-        dkmean = cclean.for_kmeans()
-
-        kcenter1, kmdf0, score1 = clustering.run_kmeans(dkmean, **yaml0['clustering']['run_kmeans'])
-        rdf0, rmodel0 = regression.run_reg(dgee, modeltype='gee', **yaml0['regression']['run_reg'])
-        rdf1, rmodel1 = regression.run_reg(dkmean, modeltype='linear', **yaml0['regression']['run_reg'])
+        # merge scryfall and mtgjson data + clean them and run the models
+        pipe = pipeline.refresh(yaml0, s3scry, s3json, cache=cache, force=force).run()
 
         # save model to s3
-        s3tofrom.model_save(rmodel0, s3pathfile='chmodel/gee.joblib', bucket="2021-msia423-ke-chenghao")
-        s3tofrom.model_save(rmodel1, s3pathfile='chmodel/ols.joblib', bucket="2021-msia423-ke-chenghao")
+        s3tofrom.model_save(pipe.get('gee.model'), s3pathfile='chmodel/gee.joblib', bucket="2021-msia423-ke-chenghao")
+        s3tofrom.model_save(pipe.get('ols.model'), s3pathfile='chmodel/ols.joblib', bucket="2021-msia423-ke-chenghao")
+
+    elif sp_used == 'replay':
+        # same parsing, cleaning and modelling code as a refresh, but every download is read from the archive
+        mtgkw = dict(yaml0['get_data']['MTGAPI'], replay=args.date)
+        if args.snapshotdir is not None:
+            mtgkw['snapshotdir'] = args.snapshotdir
+        mtg = getd.MTGAPI(**mtgkw)
+        raw0 = mtg.ingest_all(sources=['scryfall', 'mtgjson'])
+
+        pipe = pipeline.refresh(yaml0, raw0['scryfall'], raw0['mtgjson'], cache=cache, force=force).run()
+        mergeraw = pipe.get('clean.merge_raw')
+        kmdf0 = pipe.get('kmeans.clusters')
+        logger.info('Replay of {0} finished: {1} merged rows, {2} clustered cards'.format(args.date, len(mergeraw),
+                                                                                        len(kmdf0)))
+
+        if args.outdir is not None:
+            os.makedirs(args.outdir, exist_ok=True)
+            for name, df in [('cluster_result', kmdf0), ('gee_result', pipe.get('gee.result')),
+                             ('ols_result', pipe.get('ols.result')), ('merge_raw', mergeraw)]:
+                df.to_csv(os.path.join(args.outdir, '{}.csv'.format(name)), index=False)
+
+    elif sp_used == 'bench':
+        # benchmarks are development tooling, only imported when asked for
+        from benchmarks import suite
+        benchkw = dict(yaml0['benchmarks'], update=args.update)
+        benchkw.update({k: v for k, v in vars(args).items() if k in ['sizes', 'stages', 'repeat', 'threshold',
+                                                                    'baseline', 'output'] and v is not None})
+        if suite.main(**benchkw):
+            raise SystemExit(1)
 
     elif sp_used == 'sqlempty':
         m423.create_db(args.engine_string)
     else:
         parser.print_help()
 
+    if pipe is not None:
+        print(pipe.table())
+    if profiling.PROFILER.records:
+        print(profiling.PROFILER.table())
+    if dtypes.POLICY.reports:
+        print(dtypes.POLICY.table())
+
 
 
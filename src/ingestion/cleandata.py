@@ -1,29 +1,434 @@
+import os
 import re
-from datetime import datetime
+import glob
+import functools
+import contextlib
+import datetime
 import logging.config
 import numpy as np
 import pandas as pd
 
 
+try:
+    from src.utils import profiling, dtypes
+    from src.statistics import pricestats
+except ModuleNotFoundError:
+    from utils import profiling, dtypes
+    from statistics import pricestats
+
+
 logger = logging.getLogger(__name__)
 logger.setLevel("INFO")
-pd.options.mode.chained_assignment = None
+
+# date features date_features() can compute, and the default age buckets (3 months, 1, 2 and 5 years)
+DATEFEATURES = ['days_since_release', 'days_since_set_release', 'age_bucket']
+AGEBINS = [90, 365, 730, 1825]
+
+
+def prunable(df, cols, minsum=None, minvar=None, minunique=None):
+    """
+        Finds the feature columns that carry too little information, with missing values counted as 0. Every
+        threshold is checked on all columns at once.
+
+        Args:
+            df (dataframe): dataframe holding the features
+            cols (list): numeric columns to check
+            minsum (float): columns summing to less than this are dropped (e.g. indicators set on too few rows)
+            minvar (float): columns with a sample variance below this are dropped
+            minunique (int): columns with fewer distinct values than this are dropped
+
+        Returns:
+            list of the columns of `cols` to drop
+    """
+    if not cols:
+        return []
+    drop = pd.Series(False, index=cols)
+    if minsum is not None:
+        # missing values add nothing to the sums
+        drop |= df[cols].sum() < minsum
+    if minvar is not None or minunique is not None:
+        filled = df[cols].fillna(0)
+        if minvar is not None:
+            drop |= filled.var().fillna(0) < minvar
+        if minunique is not None:
+            drop |= filled.nunique() < minunique
+    return drop.index[drop].tolist()
+
+
+def prune(df, cols, minsum=None, minvar=None, minunique=None):
+    """
+        Drops feature columns that carry too little information (see prunable). Missing values of the columns are
+        filled with 0 in one pass, so the frame is copied at most twice however many columns there are.
+
+        Returns:
+            Pandas dataframe with the missing values of the kept `cols` filled with 0
+    """
+    drop = prunable(df, cols, minsum=minsum, minvar=minvar, minunique=minunique)
+    if not cols:
+        return df
+    df = df.fillna({c: 0 for c in cols})
+    if drop:
+        logger.debug('Pruning {0} of {1} feature columns'.format(len(drop), len(cols)))
+        df = df.drop(drop, axis=1)
+    return df
+
+
+def copy_on_write():
+    """
+        Returns:
+            context in which pandas copies data only when it is modified (pandas 1.5 or later), so column selections
+            share the data of the frame they come from. Nothing changes with older pandas
+    """
+    if 'copy_on_write' in dir(pd.options.mode):
+        return pd.option_context('mode.copy_on_write', True)
+    # empty ExitStack as the no-op context, contextlib.nullcontext needs Python 3.7
+    return contextlib.ExitStack()
+
+
+def type_block(df, pricetype, days, dtype, id='scryfallId', by='pricetype'):
+    """
+        Returns:
+            array of the ids of the cards with prices of `pricetype` (first row of each card) and 2d array of
+            their prices on `days`. Only the price columns of these rows are copied
+    """
+    mask = (df[by] == pricetype).to_numpy()
+    ids = df[id].to_numpy()[mask]
+    first = ~pd.Index(ids).duplicated()
+    return ids[first], df.loc[mask, days].to_numpy(dtype=dtype)[first]
+
+
+def long_prices(df, id='scryfallId', by='pricetype', regex=r"pd[0-9]+"):
+    """
+        Turns the wide merged dataset (one row per card and price type, one column per price day) into the long
+        format of the GEE model: one row per card and price day with one price column per price type. The price
+        blocks of every type are reshaped as arrays and the static card features repeated once per day, which gives
+        the frame melt and pivot_table would build, rows and index labels included, without their grouping.
+
+        Args:
+            df (dataframe): wide dataset, e.g. from Clean.merge_clean()
+            id (string): column identifying a card
+            by (string): column holding the price type
+            regex (string): regex matching the price day columns, whose digits give the day
+
+        Returns:
+            Pandas dataframe sorted by card and day. As with pivot_table, cards with a missing feature and days
+            without any price are left out, and the remaining missing prices are 0
+    """
+    days = [c for c in df.columns if re.match(regex, c)]
+    static = [c for c in df.columns if c not in days and c != by]
+    df = df[df[static].notna().all(axis=1)]
+    if isinstance(df[by].dtype, pd.CategoricalDtype):
+        types = [t for t in df[by].cat.categories if t in set(df[by])]
+    else:
+        types = sorted(df[by].unique())
+
+    cards = df[static].drop_duplicates(subset=[id]).sort_values(by=id, kind='stable')
+    daynum = np.array([int(re.sub(r'[^0-9]', '', d)) for d in days], dtype=int)
+    order = np.argsort(daynum, kind='stable')
+    days, daynum = [days[i] for i in order], daynum[order]
+    dtype = np.result_type(*df[days].dtypes) if days else np.float64
+    blocks = []
+    for t in types:
+        ids, block0 = type_block(df, t, days, dtype, id=id, by=by)
+        block = np.full((len(cards), len(days)), np.nan, dtype=dtype)
+        block[pd.Index(cards[id]).get_indexer(ids)] = block0
+        blocks.append(block)
+
+    # days without any price are dropped, then types without any price
+    keep = ~np.logical_and.reduce([np.isnan(b) for b in blocks]) if blocks else np.zeros((len(cards), len(days)), bool)
+    # pivot_table numbers the rows with the day names sorted as strings
+    lex = np.argsort(np.array(days, dtype=str), kind='stable')
+    labels = np.empty(keep.shape, dtype=np.int64)
+    labels[:, lex] = np.cumsum(keep[:, lex].ravel()).reshape(keep.shape) - 1
+    keep = keep.ravel()
+
+    long0 = cards.take(np.repeat(np.arange(len(cards)), len(days))[keep])
+    long0.index = labels.ravel()[keep]
+    long0['priceday'] = np.tile(daynum, len(cards))[keep]
+    for t, block in zip(types, blocks):
+        values = block.ravel()[keep]
+        if not np.isnan(values).all():
+            long0[t] = np.nan_to_num(values, nan=0)
+    long0.columns.name = by
+    return long0
+
+
+def price_summary(df, features=('max', 'min', 'mean'), id='scryfallId', by='pricetype', regex=r"pd[0-9]+"):
+    """
+        Summarizes the prices of the wide merged dataset (one row per card and price type, one column per price day)
+        into one row per card, with the summary features of every price type as columns (e.g. 'sell_max'). The
+        features are reductions over the rows of each price block (see pricestats.summarize), so the days are never
+        melted into a long format.
+
+        Args:
+            df (dataframe): wide dataset, e.g. from Clean.merge_clean()
+            features (list): features of every price type, any of pricestats.FEATURES
+            id (string): column identifying a card
+            by (string): column holding the price type
+            regex (string): regex matching the price day columns, whose digits give the day
+
+        Returns:
+            Pandas dataframe with the static columns of every card followed by the features of each price type.
+            Features are missing for cards without prices of a type and keep the dtype of the prices (count aside)
+    """
+    days = [c for c in df.columns if re.match(regex, c)]
+    daynum = np.array([int(re.sub(r'[^0-9]', '', d)) for d in days], dtype=int)
+    order = np.argsort(daynum, kind='stable')
+    days, daynum = [days[i] for i in order], daynum[order]
+    if isinstance(df[by].dtype, pd.CategoricalDtype):
+        types = [t for t in df[by].cat.categories if t in set(df[by])]
+    else:
+        types = sorted(df[by].unique())
+    dtype = np.result_type(*df[days].dtypes) if days else np.float64
+
+    summ0 = df[[c for c in df.columns if c not in days and c != by]].drop_duplicates().reset_index(drop=True)
+    feats = {}
+    for t in types:
+        ids, block = type_block(df, t, days, dtype, id=id, by=by)
+        pos = pd.Index(ids).get_indexer(summ0[id])
+        res0 = pricestats.summarize(block, features, days=daynum)
+        for f in features:
+            values = res0[f] if f == 'count' else res0[f].astype(dtype)
+            feats[t + '_' + f] = np.where(pos >= 0, values[pos], 0 if f == 'count' else np.nan)
+    return pd.concat([summ0, pd.DataFrame(feats, index=summ0.index)], axis=1)
+
+
+def date_features(df, refdate, features=('days_since_release',), agebins=AGEBINS, setrelease=None):
+    """
+        Release date features of every card, computed from one parse of the release dates.
+
+        Args:
+            df (dataframe): dataframe with the released_at (YYYY-MM-DD) and set columns of every card
+            refdate (date): day the ages are counted up to
+            features (list): any of 'days_since_release', 'days_since_set_release' (days since the earliest release
+                             of a card of the same set in `df`) and 'age_bucket' (number of `agebins` boundaries, in
+                             days, the age of the card has passed, e.g. 0 for cards released in the last 90 days)
+            agebins (list): increasing ages in days bounding the age buckets
+            setrelease (series): earliest release date (YYYY-MM-DD) of every set, indexed by set, from `df` if None
+
+        Returns:
+            Pandas dataframe with the same index as `df` and one integer column per feature
+    """
+    unknown = [f for f in features if f not in DATEFEATURES]
+    if unknown:
+        raise ValueError('Unknown date features {0}, choose from {1}'.format(unknown, DATEFEATURES))
+    released = pd.to_datetime(df['released_at'], format='%Y-%m-%d')
+    days = (pd.Timestamp(refdate) - released).dt.days
+    feats = pd.DataFrame(index=df.index)
+    for f in features:
+        if f == 'days_since_release':
+            feats[f] = days
+        elif f == 'days_since_set_release' and setrelease is None:
+            feats[f] = (pd.Timestamp(refdate) - released.groupby(df['set'], observed=True).transform('min')).dt.days
+        elif f == 'days_since_set_release':
+            setrel = pd.to_datetime(df['set'].astype(object).map(setrelease), format='%Y-%m-%d')
+            feats[f] = (pd.Timestamp(refdate) - setrel).dt.days
+        else:
+            feats[f] = np.searchsorted(np.asarray(agebins), days.to_numpy(), side='right')
+    return feats
+
+
+def inner_join(left, right, left_on, right_on, keep=None, suffixes=('_x', '_y')):
+    """
+        Inner join of two dataframes on one key, filtering the left rows before joining. Both keys are mapped to the
+        integer codes of the left keys, and the matching rows are taken by position. The result is the frame
+        `pd.merge(left, right, left_on=left_on, right_on=right_on, how='inner')[keep]` would give, index labels
+        included, without building the rows the filter drops.
+
+        Args:
+            left (dataframe): left dataframe, e.g. the Scryfall cards
+            right (dataframe): right dataframe, e.g. the MTGJSON prices (one row per card and price type)
+            left_on (string): key column of `left`
+            right_on (string): key column of `right`
+            keep (array): boolean mask of the left rows to join, all if None
+            suffixes (list): suffixes of the columns found in both dataframes
+
+        Returns:
+            Pandas dataframe with the columns of `left` followed by those of `right`
+    """
+    lcodes, uniques = pd.factorize(left[left_on])
+    rcodes = pd.Index(uniques).get_indexer(right[right_on])
+    # right rows grouped by code, in their original order within a code
+    rorder = np.argsort(rcodes, kind='stable')
+    rorder = rorder[rcodes[rorder] >= 0]
+    counts = np.bincount(rcodes[rcodes >= 0], minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+
+    # number of matches of every left row, the first label of its matches in the unfiltered join
+    nmatch = np.where(lcodes >= 0, counts[lcodes], 0) if len(uniques) else np.zeros(len(left), dtype=int)
+    first = np.cumsum(nmatch) - nmatch
+    rows = np.flatnonzero((nmatch > 0) & (True if keep is None else np.asarray(keep)))
+    lpos = np.repeat(rows, nmatch[rows])
+    within = np.arange(len(lpos)) - np.repeat(np.cumsum(nmatch[rows]) - nmatch[rows], nmatch[rows])
+    rpos = rorder[starts[lcodes[lpos]] + within]
+
+    both = [c for c in left.columns if c in right.columns and not (c == left_on and c == right_on)]
+    left1 = left.iloc[lpos].rename(columns={c: c + suffixes[0] for c in both})
+    right1 = right.iloc[rpos].rename(columns={c: c + suffixes[1] for c in both})
+    if left_on == right_on:
+        right1 = right1.drop(columns=[right_on])
+    left1.index = right1.index = first[lpos] + within
+    return pd.concat([left1, right1], axis=1)
+
+
+class MergedStats:
+    # columns of every merged row kept to choose the rows and the set release dates
+    KEYS = ['scryfallId', 'name', 'pricetype', 'set', 'released_at']
+
+    def __init__(self, prices=r"pd[0-9]+", moments=False, uniques=False):
+        """
+            Statistics of the merged dataset that decide how Clean cleans it, accumulated over chunks of rows so the
+            decisions are the same however the cards are split. Missing values of the numeric columns count as 0.
+
+            Args:
+                prices (string): regex matching the price day columns, which are never pruned
+                moments (bool): whether to accumulate the squares needed for the variances
+                uniques (bool): whether to accumulate the distinct values of the numeric columns
+        """
+        self.prices = prices
+        self.moments = moments
+        self.uniques = uniques
+        self.nrows = 0
+        self.columns = None
+        self.numeric = None
+        self.notna = None
+        self.sums = None
+        self.sumsq = None
+        self.values = {}
+        self.rarities = set()
+        self.categories = None
+        self.keys = []
+
+    def update(self, df):
+        """Adds the rows of a merged dataframe (e.g. Clean.merge_all() of some of the cards)."""
+        if self.columns is None:
+            self.columns = df.columns.tolist()
+            self.numeric = [c for c in df.select_dtypes(include=np.number).columns if not re.match(self.prices, c)]
+            self.notna = pd.Series(False, index=self.columns)
+            self.sums = pd.Series(0.0, index=self.numeric)
+            self.sumsq = pd.Series(0.0, index=self.numeric)
+            if isinstance(df['rarity'].dtype, pd.CategoricalDtype):
+                self.categories = df['rarity'].cat.categories.tolist()
+        self.nrows += len(df)
+        # one column at a time, so no copy of the whole chunk is made
+        self.notna |= pd.Series({c: bool(df[c].notna().any()) for c in self.columns})
+        self.sums += df[self.numeric].sum()
+        for c in self.numeric if self.moments or self.uniques else []:
+            col = df[c].fillna(0)
+            if self.moments:
+                self.sumsq[c] += (col.astype(np.float64) ** 2).sum()
+            if self.uniques:
+                self.values.setdefault(c, set()).update(col.unique().tolist())
+        self.rarities.update(df['rarity'].dropna().unique().tolist())
+        self.keys.append(pd.DataFrame({k: df[k].astype(object) for k in self.KEYS}))
+
+    def prunable(self, cols, minsum=None, minvar=None, minunique=None):
+        """
+            Returns:
+                list of the columns of `cols` with too little information (see prunable())
+        """
+        drop = []
+        for c in cols:
+            var = (self.sumsq[c] - self.sums[c] ** 2 / self.nrows) / (self.nrows - 1) if self.nrows > 1 else 0
+            if (minsum is not None and self.sums[c] < minsum) or (minvar is not None and var < minvar) or \
+                    (minunique is not None and len(self.values.get(c, ())) < minunique):
+                drop.append(c)
+        return drop
+
+    def rarity_order(self):
+        # rarities of all cards, in the order get_dummies would give them
+        if self.categories is not None:
+            return [r for r in self.categories if r in self.rarities]
+        return sorted(self.rarities)
+
+    def winners(self):
+        """
+            Returns:
+                MultiIndex of the (scryfallId, pricetype) pairs of the cards kept when several printings share a name:
+                the printing with the smallest id, as the sort and drop_duplicates of merge_clean have always kept
+        """
+        keys = pd.concat(self.keys, ignore_index=True) if self.keys else pd.DataFrame(columns=self.KEYS)
+        keys = keys.sort_values(by='scryfallId', kind='stable').drop_duplicates(subset=['name', 'pricetype'])
+        return pd.MultiIndex.from_frame(keys[['scryfallId', 'pricetype']])
+
+    def set_release(self):
+        """Returns the earliest release date of every set, indexed by set."""
+        keys = pd.concat(self.keys, ignore_index=True) if self.keys else pd.DataFrame(columns=self.KEYS)
+        return keys.dropna(subset=['released_at']).groupby('set')['released_at'].min()
+
+
+def memoized(func):
+    """
+        Caches the result of a Clean step, so each intermediate is computed at most once per Clean object. Once
+        every step listed in Clean.CONSUMERS as using a result has run, the cached result is freed if the object
+        was created with `release`. Steps run with copy-on-write, so selecting columns does not copy them.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        if name not in self.cache:
+            with copy_on_write():
+                self.cache[name] = func(self)
+            for prod, cons in self.CONSUMERS.items():
+                if name in cons:
+                    self.used.setdefault(prod, set()).add(name)
+                    if self.release and self.used[prod] >= set(cons):
+                        self.cache.pop(prod, None)
+        return self.cache[name]
+    return wrapper
 
 
 class Clean:
-    def __init__(self, scryfalldf, mtgjsondf, percentkeep=0.03):
+    # steps using the result of each intermediate step
+    CONSUMERS = {'merge_all': ['merge_clean'], 'merge_clean': ['for_gee', 'for_kmeans']}
+    # changing any of these drops every cached result
+    INPUTS = ['scry', 'mtgjson', 'percentkeep', 'minvar', 'minunique', 'features', 'dates', 'refdate']
+
+    def __init__(self, scryfalldf, mtgjsondf, percentkeep=0.03, release=False, minvar=None, minunique=None,
+                 features=('max', 'min', 'mean'), dates=(), refdate=None):
         """
-            This class is used to join and clean the filtered Scryfall and MTGJSON datasets.
+            This class is used to join and clean the filtered Scryfall and MTGJSON datasets. Every step is computed
+            once and cached, so calling merge_all, for_gee and for_kmeans in sequence joins and cleans the data only
+            once. The cached dataframes are shared between calls and should not be modified in place.
 
             Args:
                 scryfalldf (dataframe): dataframe produced by the scryfall_api() function within the MTGAPI class
                 mtgjsondf (dataframe): dataframe produced by the mtgjson_api() function within the MTGAPI class
                 percentkeep (float): percent threshold used to drop a numeric column
+                minvar (float): numeric columns with a lower variance are dropped as well, not checked if None
+                minunique (int): numeric columns with fewer distinct values are dropped as well, not checked if None
+                features (list): price features of every price type in the K-means data, any of pricestats.FEATURES
+                dates (list): date features added to days_since_release, any of DATEFEATURES
+                refdate (string): day (YYYY-MM-DD) the card ages are counted up to, today when the object is created
+                                  if None, so the results do not change while the object is used
+                release (bool): whether to free the merged datasets once the steps using them have run (calling
+                                them again afterwards recomputes them)
         """
+        self.cache = {}
+        self.used = {}
+        self.release = release
         self.scry = scryfalldf
         self.mtgjson = mtgjsondf
         self.percentkeep = percentkeep
+        self.minvar = minvar
+        self.minunique = minunique
+        self.features = list(features)
+        self.dates = list(dates)
+        self.refdate = datetime.date.today() if refdate is None else pd.Timestamp(refdate).date()
+
+    def __setattr__(self, name, value):
+        if name in self.INPUTS:
+            self.invalidate()
+        super().__setattr__(name, value)
+
+    def invalidate(self):
+        """Drops every cached result, e.g. after the input dataframes were modified in place."""
+        self.cache = {}
+        self.used = {}
 
+    @memoized
+    @profiling.track()
     def merge_all(self):
         """
             This function is used to inner join the filtered Scryfall and MTGJSON datasets.
@@ -31,20 +436,22 @@ class Clean:
                 Pandas dataframe
         """
 
-        scry1 = self.scry
-        price1 = self.mtgjson
-        logger.debug('Merging dataframes')
-        scrypr0 = pd.merge(scry1, price1, left_on='id', right_on='scryfallId', how='inner')
-
-        # drop cards with rarity type special (just keep the 4 basic types)
-        logger.debug('Running rarity filter')
-        scrypr0 = scrypr0[scrypr0['rarity'].isin(['common', 'rare', 'uncommon', 'mythic'])]
-        # drop cards with no released_at
-        scrypr0 = scrypr0.dropna(subset=['released_at'])
+        scrypr0 = self.join(self.scry, self.mtgjson)
         logger.info('APIs merged!')
 
         return scrypr0
 
+    @staticmethod
+    def join(scry1, price1):
+        # drop cards with rarity type special (just keep the 4 basic types) and cards with no released_at, before
+        # the join so their prices are never joined
+        logger.debug('Running rarity filter')
+        keep = (scry1['rarity'].isin(['common', 'rare', 'uncommon', 'mythic']) & scry1['released_at'].notna())
+        logger.debug('Merging dataframes')
+        return inner_join(scry1, price1, left_on='id', right_on='scryfallId', keep=keep.to_numpy())
+
+    @memoized
+    @profiling.track()
     def merge_clean(self):
         """
             This function is used to clean and drop columns from the merged dataset
@@ -54,8 +461,28 @@ class Clean:
                 Pandas dataframe
         """
         scrypr0 = self.merge_all()
+        stats = self.stats()
+        stats.update(scrypr0)
+        scrypr00 = self.clean_merged(scrypr0, self.plan(stats))
+        logger.info('Merged dataset cleaned')
+
+        return dtypes.downcast(scrypr00, 'Clean.merge_clean')
+
+    def stats(self):
+        """Returns empty statistics of the merged dataset, with what the pruning thresholds need."""
+        return MergedStats(moments=self.minvar is not None, uniques=self.minunique is not None)
+
+    def plan(self, stats):
+        """
+            Decides how the merged dataset is cleaned from its statistics.
 
-        # drop columns that are not needed
+            Args:
+                stats (MergedStats): statistics of every merged row
+
+            Returns:
+                dictionary with the columns to drop, the numeric columns to fill with 0, the rarities of the dummies,
+                the (scryfallId, pricetype) pairs kept and the release date of every set
+        """
         noneed = ['object', 'id', 'oracle_id', 'mtgo_id', 'mtgo_foil_id', 'tcgplayer_id', 'cardmarket_id', 'lang',
                   'highres_image', 'image_status', 'image_url', 'type_line', 'oracle_text', 'reserved', 'foil',
                   'nonfoil', 'oversized', 'promo', 'variation', 'digital', 'flavor_text', 'artist', 'border_color',
@@ -63,49 +490,66 @@ class Clean:
                   'printed_text', 'content_warning', 'variation_of', 'flavor_name', 'uuid', 'mtgjsonV4Id',
                   'scryfallIllustrationId', 'scryfallOracleId', 'minday', 'maxday', 'layout', 'set', 'set_name',
                   'set_type', 'collector_number']
-        scrypr00 = scrypr0.drop(noneed, axis=1)
         # drop columns with all na
-        scrypr00 = scrypr00.dropna(axis=1, how='all')
-
+        drop = noneed + [c for c in stats.columns if c not in noneed and not stats.notna[c]]
         # filter columns with very little variation
-        numcols = scrypr00.select_dtypes(include=np.number).columns.tolist()
-        numcols1 = [c for c in numcols if not re.match(r"pd[0-9]+", c)]
+        numcols1 = [c for c in stats.numeric if c not in drop]
+        pruned = stats.prunable(numcols1, minsum=stats.nrows * self.percentkeep, minvar=self.minvar,
+                                minunique=self.minunique)
+        return {'drop': drop + pruned, 'fill': [c for c in numcols1 if c not in pruned],
+                'rarities': stats.rarity_order(), 'winners': stats.winners(),
+                'setrelease': stats.set_release() if 'days_since_set_release' in self.dates else None}
 
-        pkeep = len(scrypr00) * self.percentkeep
-        for n in numcols1:
-            scrypr00 = scrypr00.fillna({n: 0})
-            if scrypr00[n].sum() < pkeep:
-                scrypr00 = scrypr00.drop([n], axis=1)
+    def clean_merged(self, scrypr0, plan):
+        """
+            Cleans merged rows as decided by plan(). Rows and columns are chosen first, so the data kept is copied
+            once.
 
-        # manual recode to numeric
-        logger.debug("Running power, toughness and loyalty recoding")
-        scrypr00['power'] = pd.to_numeric(scrypr00['power'], errors='coerce')
-        scrypr00['toughness'] = pd.to_numeric(scrypr00['toughness'], errors='coerce')
-        scrypr00['loyalty'] = pd.to_numeric(scrypr00['loyalty'], errors='coerce')
-        scrypr00 = scrypr00.fillna({'power': 0, 'toughness': 0, 'loyalty': 0})
-        # boolean to numeric / int
-        boocols = scrypr00.select_dtypes(include=bool).columns.tolist()
-        for b in boocols:
-            scrypr00[b] = scrypr00[b] * 1
+            Args:
+                scrypr0 (dataframe): merged dataset, or the merged rows of some of the cards
+                plan (dict): output of plan() for the whole merged dataset
+
+            Returns:
+                Pandas dataframe
+        """
+        scrypr00 = scrypr0.drop(plan['drop'], axis=1)
 
-        # dummy var
-        scrypr00 = pd.get_dummies(scrypr00, prefix=['rarity'], columns=['rarity'], drop_first=True)
-        # released_at to day from today
+        # released_at to days up to the reference day, with the other date features
         logger.debug('Running released_at recoding')
-        scrypr00['days_since_release'] = scrypr00['released_at'].apply(
-            lambda x: (datetime.now() - datetime.strptime(x, "%Y-%m-%d")).days)
+        feats = date_features(scrypr0, self.refdate, ['days_since_release'] + [d for d in self.dates
+                                                                               if d != 'days_since_release'],
+                              setrelease=plan['setrelease'])
 
-        # drop cards with the same name, keep most recent version
-        scrypr00 = scrypr00.sort_values(by=['scryfallId', 'name', 'days_since_release', 'pricetype'])
-        scrypr00 = scrypr00.drop_duplicates(subset=['name', 'pricetype'], keep='first')
-        scrypr00 = scrypr00.drop(['released_at'], axis=1)
+        # rows: drop cards with the same name, keep most recent version
+        pairs = pd.MultiIndex.from_arrays([scrypr00['scryfallId'].astype(object),
+                                           scrypr00['pricetype'].astype(object)])
+        keep = pairs.isin(plan['winners']) & ~pairs.duplicated()
+        keys = pd.DataFrame({'scryfallId': scrypr00['scryfallId'], 'name': scrypr00['name'],
+                             'days_since_release': feats['days_since_release'],
+                             'pricetype': scrypr00['pricetype']})[keep]
+        rows = keys.sort_values(by=['scryfallId', 'name', 'days_since_release', 'pricetype']).index
 
-        # reorder
-        scrypr00 = scrypr00[['scryfallId'] + [c for c in scrypr00.columns if c != 'scryfallId']]
-        logger.info('Merged dataset cleaned')
+        # the only copy of the data: the kept rows of the kept columns, in their final order
+        cols = [c for c in scrypr00.columns if c not in ['scryfallId', 'rarity', 'released_at']]
+        rarity = scrypr00['rarity']
+        scrypr00 = scrypr00.loc[rows, ['scryfallId'] + cols]
+        scrypr00.fillna({c: 0 for c in plan['fill']}, inplace=True)
 
-        return scrypr00
+        # manual recode to numeric
+        logger.debug("Running power, toughness and loyalty recoding")
+        for c in ['power', 'toughness', 'loyalty']:
+            scrypr00[c] = pd.to_numeric(scrypr00[c], errors='coerce').fillna(0)
+        # boolean to numeric / int
+        for b in scrypr00.select_dtypes(include=bool).columns:
+            scrypr00[b] = scrypr00[b].astype(np.int64)
+        # dummy var (categories of rarities filtered out in merge_all would become empty dummies)
+        dummies = pd.get_dummies(pd.Categorical(rarity.loc[rows], categories=plan['rarities']), prefix='rarity',
+                                 drop_first=True)
+        dummies.index = rows
+        return pd.concat([scrypr00, dummies, feats.loc[rows]], axis=1)
 
+    @memoized
+    @profiling.track()
     def for_gee(self):
         """
             This function is used to clean and produce the dataset needed for GEE modeling
@@ -115,20 +559,14 @@ class Clean:
         """
         scrypr00 = self.merge_clean()
 
-        # wide to long
-        scrypr1 = pd.melt(scrypr00, id_vars=[c for c in scrypr00.columns if not re.match(r"pd[0-9]+", c)],
-                          value_vars=[c for c in scrypr00.columns if re.match(r"pd[0-9]+", c)], var_name='priceday',
-                          value_name='price')
-        scrypr2 = scrypr1.pivot_table(index=[c for c in scrypr1.columns if c not in ['pricetype', 'price']],
-                                      columns='pricetype', values='price', aggfunc='first', fill_value=0).reset_index()
-        # price day to int
-        scrypr2['priceday'] = scrypr2['priceday'].apply(lambda x: re.sub(r'[^0-9]', '', x)).astype(int)
-        # sort by id and day order
-        scrypr2 = scrypr2.sort_values(by=['scryfallId', 'priceday'])
+        # wide to long, with the buy and sell prices side by side and sorted by id and day order
+        scrypr2 = long_prices(scrypr00)
         logger.info('Cleaned GEE data generated')
 
         return scrypr2
 
+    @memoized
+    @profiling.track()
     def for_kmeans(self):
         """
             This function is used to clean and produce the dataset needed for K-means and linear regression modeling
@@ -138,26 +576,126 @@ class Clean:
         """
         scrypr00 = self.merge_clean()
 
-        # wide to long
-        m0 = pd.melt(scrypr00, id_vars=[c for c in scrypr00 if not re.match(r"pd[0-9]+", c)],
-                     value_vars=[c for c in scrypr00 if re.match(r"pd[0-9]+", c)], var_name='priceday',
-                     value_name='price')
-        # get max, min, avg price of each card during time range
-        form = []
-        for p in set(m0['pricetype'].values.tolist()):
-            m1 = m0[m0['pricetype'] == p].groupby(['scryfallId'], as_index=False).agg(
-                {'price': ['max', 'min', 'mean']})
-            m1.columns = ['scryfallId', p + '_max', p + '_min', p + '_mean']
-            form.append(m1)
-        # remove duplicates
-        m2 = m0[[c for c in m0.columns if c not in ['priceday', 'price', 'pricetype']]]
-        m2 = m2.drop_duplicates(keep='first')
-        for m in form:
-            m2 = pd.merge(m2, m, how='left', on='scryfallId')
+        # summary features (e.g. max, min, avg price) of each card and price type during time range
+        m2 = price_summary(scrypr00, features=self.features)
 
         logger.info('Cleaned Kmeans data generated')
         return m2
 
+    def merged_chunks(self, nchunks=8, by='hash'):
+        """
+            Splits the cards into chunks and yields the merged dataset (see merge_all) of each.
+
+            Args:
+                nchunks (int): number of chunks
+                by (string): 'hash' to split the cards by a hash of their id, 'set' to keep the cards of a set together
+
+            Returns:
+                generator of (chunk number, dataframe), empty chunks are skipped
+        """
+        if by not in ['hash', 'set']:
+            raise ValueError('Cards are split by hash or set, not {}'.format(by))
+        key = self.scry['id' if by == 'hash' else 'set'].astype(str).to_numpy(dtype=object)
+        chunk = pd.util.hash_array(key) % nchunks
+        # prices go to the chunk of their card
+        idchunk = pd.Series(chunk, index=self.scry['id'].to_numpy())
+        idchunk = idchunk[~idchunk.index.duplicated()]
+        pchunk = idchunk.reindex(self.mtgjson['scryfallId'].to_numpy()).to_numpy()
+        for k in range(nchunks):
+            merged = self.join(self.scry.iloc[np.flatnonzero(chunk == k)],
+                               self.mtgjson.iloc[np.flatnonzero(pchunk == k)])
+            if len(merged):
+                yield k, merged
+
+    def chunks(self, nchunks=8, by='hash'):
+        """
+            Cleans the data chunk by chunk, so only one chunk of the merged and long datasets is in memory at a time.
+            A first pass over the chunks gathers the statistics of the whole merged dataset, so every chunk keeps the
+            same columns and the same cards as merge_clean would.
+
+            Args:
+                nchunks (int): number of chunks
+                by (string): 'hash' or 'set', see merged_chunks()
+
+            Returns:
+                generator of (chunk number, for_gee data, for_kmeans data) of every chunk
+        """
+        stats = self.stats()
+        for _, merged in self.merged_chunks(nchunks, by):
+            with copy_on_write():
+                stats.update(merged)
+        plan = self.plan(stats)
+        for k, merged in self.merged_chunks(nchunks, by):
+            with copy_on_write():
+                clean0 = dtypes.downcast(self.clean_merged(merged, plan), 'Clean.chunks')
+                gee0, kmean0 = long_prices(clean0), price_summary(clean0, features=self.features)
+            yield k, gee0, kmean0
+
+    @profiling.track()
+    def partitioned(self, outdir, nchunks=8, by='hash', compression='snappy'):
+        """
+            Writes the for_gee and for_kmeans data chunk by chunk (see chunks()) to Parquet, one file per chunk under
+            <outdir>/for_gee and <outdir>/for_kmeans. Files of an earlier run are replaced.
+
+            Args:
+                outdir (string): output directory
+                nchunks (int): number of chunks
+                by (string): 'hash' or 'set', see merged_chunks()
+                compression (string): Parquet compression
+
+            Returns:
+                Partitioned handle of the written data
+        """
+        for name in Partitioned.OUTPUTS:
+            os.makedirs(os.path.join(outdir, name), exist_ok=True)
+            for path in glob.glob(os.path.join(outdir, name, 'part-*.parquet')):
+                os.remove(path)
+        for k, gee0, kmean0 in self.chunks(nchunks, by):
+            for name, df in zip(Partitioned.OUTPUTS, [gee0, kmean0]):
+                df.to_parquet(os.path.join(outdir, name, 'part-{:05d}.parquet'.format(k)), index=False,
+                              compression=compression)
+            logger.debug('Chunk {0} written, {1} GEE rows'.format(k, len(gee0)))
+        logger.info('Cleaned data written to {}'.format(outdir))
+        return Partitioned(outdir)
+
+
+class Partitioned:
+    # outputs of Clean.partitioned(), one directory each
+    OUTPUTS = ['for_gee', 'for_kmeans']
+
+    def __init__(self, outdir):
+        """
+            Handle of the data written by Clean.partitioned(). Nothing is read until asked for, chunks can be read one
+            at a time with iter_chunks() or all together with read().
+
+            Args:
+                outdir (string): directory the data was written to
+        """
+        self.outdir = outdir
+
+    def parts(self, name):
+        """Returns the paths of the chunks of an output ('for_gee' or 'for_kmeans')."""
+        if name not in self.OUTPUTS:
+            raise ValueError('Unknown output {0}, choose from {1}'.format(name, self.OUTPUTS))
+        return sorted(glob.glob(os.path.join(self.outdir, name, 'part-*.parquet')))
+
+    def iter_chunks(self, name, columns=None):
+        """
+            Args:
+                name (string): 'for_gee' or 'for_kmeans'
+                columns (list): columns to read, all if None
+
+            Returns:
+                generator of the dataframe of every chunk
+        """
+        for path in self.parts(name):
+            yield pd.read_parquet(path, columns=columns)
+
+    def read(self, name, columns=None):
+        """Returns all chunks of an output as one dataframe (dtypes a chunk narrowed are widened to fit all)."""
+        chunks = list(self.iter_chunks(name, columns=columns))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
 
 if __name__ == '__main__':
     # clean = Clean(scry0, mjson0)
@@ -0,0 +1,110 @@
+import re
+import logging.config
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+# text between the braces of a mana cost
+MANA = re.compile(r'\{([^}]*)\}')
+
+
+def multihot(col, prefix, clean=r'-|,|/|\s+', dtype='int64', sparse=False, count=False):
+    """
+        Expands a list valued column (e.g. keywords, subtypes) into one indicator column per distinct value. The
+        column is exploded once and the whole indicator matrix is filled in a single vectorized pass instead of one
+        full column scan per value.
+
+        Args:
+            col (Series): pandas Series holding lists, missing values and empty lists give a row of zeros
+            prefix (string): prefix added to every new column name, e.g. 'kw_'
+            clean (string): regex of characters removed from the values when building column names
+            dtype (string): numpy dtype of the indicators, e.g. 'int64' or 'uint8'
+            sparse (bool): whether to return pandas sparse columns instead of dense ones
+            count (bool): whether to count repeated values within a row instead of only flagging them
+
+        Returns:
+            Pandas dataframe with the same index as `col` and columns sorted by name
+    """
+    ex0 = col.reset_index(drop=True).explode().dropna()
+    names = prefix + ex0.astype(str).str.replace(clean, '', regex=True)
+    codes, uniques = pd.factorize(names, sort=True)
+    rows = ex0.index.values.astype(np.int64)
+    if not count:
+        # values repeated within a row (or mapped to the same cleaned name) are only flagged once
+        flat0 = np.unique(rows * max(len(uniques), 1) + codes)
+        rows, codes = np.divmod(flat0, max(len(uniques), 1))
+    shape = (len(col), len(uniques))
+
+    if sparse:
+        # scipy only comes with scikit-learn, so it is only needed when sparse columns are asked for
+        from scipy import sparse as sp
+        mat0 = sp.coo_matrix((np.ones(len(rows), dtype=dtype), (rows, codes)), shape=shape).tocsc()
+        return pd.DataFrame.sparse.from_spmatrix(mat0, index=col.index, columns=list(uniques))
+    mat0 = np.zeros(shape, dtype=dtype)
+    np.add.at(mat0, (rows, codes), 1)
+    return pd.DataFrame(mat0, index=col.index, columns=list(uniques))
+
+
+def mana_symbol(sym):
+    """
+        Classifies a single mana symbol (text between the braces of a cost, e.g. '2', 'G', 'W/U', '2/B', 'G/P').
+
+        Args:
+            sym (string): mana symbol without braces
+
+        Returns:
+            dictionary of {column suffix: contribution}. Numeric symbols only add to 'generic', every other symbol
+            gets its own count column (slashes removed, e.g. 'WU', 'GP') and flags whether it is hybrid/Phyrexian
+    """
+    if sym.isdigit():
+        return {'generic': int(sym), 'cmc': int(sym)}
+    parts = sym.split('/')
+    colors0 = [p for p in parts if p != 'P']
+    phyrexian = int(len(parts) > 1 and 'P' in parts)
+    hybrid = int(len(colors0) > 1)
+    if sym in ['X', 'Y', 'Z']:
+        cmc = 0
+    elif sym.startswith('H') and len(sym) == 2:
+        # half mana symbols
+        cmc = 0.5
+    else:
+        # monocolored hybrid such as {2/B} costs the larger of its halves
+        cmc = max([int(p) for p in colors0 if p.isdigit()] + [1])
+    return {sym.replace('/', ''): 1, 'hybrid': hybrid, 'phyrexian': phyrexian, 'cmc': cmc}
+
+
+def mana_symbols(col, prefix='mana_', totals=True, dtype='float64'):
+    """
+        Parses mana costs (e.g. '{2}{W/U}{G/P}') or lists of produced mana (e.g. ['G', 'U']) into a count matrix.
+        Each cost is tokenized into its {symbol}s once, every distinct symbol is classified once and the counts of
+        all rows are filled in a single vectorized pass.
+
+        Args:
+            col (Series): pandas Series of mana cost strings or lists of symbols, missing values give zeros
+            prefix (string): prefix added to every new column name
+            totals (bool): whether to add the generic, hybrid, Phyrexian and converted cost (cmc) columns
+            dtype (string): numpy dtype of the output
+
+        Returns:
+            Pandas dataframe with the same index as `col`, one count column per non-numeric symbol (sorted) followed
+            by the total columns
+    """
+    col0 = col.reset_index(drop=True)
+    tokens = col0.map(lambda x: x if isinstance(x, list) else (MANA.findall(x) if isinstance(x, str) else []))
+    ex0 = tokens.explode().dropna()
+    codes, uniques = pd.factorize(ex0.astype(str))
+
+    # contribution of every distinct symbol to every output column
+    contrib = pd.DataFrame([mana_symbol(u) for u in uniques]).fillna(0)
+    totcol = ['generic', 'hybrid', 'phyrexian', 'cmc']
+    symcol = sorted([c for c in contrib.columns if c not in totcol])
+    outcol = symcol + (totcol if totals else [])
+    contrib = contrib.reindex(columns=outcol, fill_value=0).values
+
+    mat0 = np.zeros((len(col0), len(outcol)), dtype=dtype)
+    if len(codes):
+        np.add.at(mat0, ex0.index.values.astype(np.int64), contrib[codes].astype(dtype))
+    return pd.DataFrame(mat0, index=col.index, columns=[prefix + c for c in outcol])
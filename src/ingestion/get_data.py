@@ -1,125 +1,500 @@
+import os
+import json
+import glob
 import time
-import re
+import datetime
+import functools
+import tempfile
 import logging.config
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from bs4 import BeautifulSoup
+import lxml.html
 
 
 try:
-    from src.utils import minifuncs as minif
+    from src.utils import minifuncs as minif, profiling, dtypes
+    from src.ingestion import jsonstream, httpcache, httpsession, encoders, snapshots
+    from src.storage import pricehistory, pricestore
 except ModuleNotFoundError:
-    from utils import minifuncs as minif
+    from utils import minifuncs as minif, profiling, dtypes
+    from storage import pricehistory
+    from storage import pricestore
+    import jsonstream
+    import httpcache
+    import httpsession
+    import encoders
+    import snapshots
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel("INFO")
 
 
-def url_wait(func, wait=200, **kwargs):
+def scryfall_keep(card):
     """
-        Helper function used to automatically re-run the requests.get function in the event a connection error happens.
+        Filter applied to a single Scryfall card object: standard legal, English, expansion or core set printings
+        that are not basic lands.
 
         Args:
-            func = the function to loop
-            wait = number of loops to re-try
-            kwargs = additional inputs needed by the `func` function
+            card (dict): one card object from the Scryfall bulk download
 
         Returns:
-            The function result object
+            True if the card should be kept
     """
-    t0 = 0
-    for i in range(wait):
+    legal0 = card.get('legalities') or {}
+    return legal0.get('standard') == 'legal' and card.get('set_type') in ['expansion', 'core'] and \
+        card.get('lang') == 'en' and 'Basic Land' not in (card.get('type_line') or '')
+
+
+def paper_normal(prices):
+    """
+        Prunes a single card entry of MTGJSON AllPrices.json down to its non-foil paper prices. The `mtgo` branch,
+        foil prices and currency keys are dropped. Price providers are all kept (even when emptied) so that their
+        order stays the same as in the original file.
+
+        Args:
+            prices (dict): value of one uuid key inside the AllPrices.json `data` object
+
+        Returns:
+            dictionary of {provider: {'buylist'/'retail': {'normal': {date: price}}}}
+    """
+    paper0 = prices.get('paper') or {}
+    return {src: {k: {'normal': v['normal']} for k, v in p.items()
+                  if k in ['buylist', 'retail'] and isinstance(v, dict) and 'normal' in v}
+            for src, p in paper0.items()}
+
+
+def span(cell, attr):
+    # colspan / rowspan of a table cell, 1 when missing or malformed
+    try:
+        return max(int(cell.get(attr, 1)), 1)
+    except ValueError:
+        return 1
+
+
+def table_rows(table):
+    """
+        Args:
+            table (obj): lxml table element
+
+        Returns:
+            list of the text of the cells of every row. Cells spanning several columns or rows are repeated in every
+            column and row they cover, like pandas.read_html does
+    """
+    rows, spans = [], {}
+    for r in table.xpath('.//tr'):
+        row, below = [], {}
+
+        def carried():
+            # cells of rows above reaching into this row
+            while len(row) in spans:
+                text, left = spans.pop(len(row))
+                if left > 1:
+                    below[len(row)] = (text, left - 1)
+                row.append(text)
+
+        for c in r.xpath('./th|./td'):
+            carried()
+            text = ' '.join(c.text_content().split())
+            for _ in range(span(c, 'colspan')):
+                if span(c, 'rowspan') > 1:
+                    below[len(row)] = (text, span(c, 'rowspan') - 1)
+                row.append(text)
+        carried()
+        spans.update(below)
+        rows.append(row)
+    return rows
+
+
+def html_table(content):
+    """
+        Parses the first table of an HTML page straight from the response bytes. Header cells without text are
+        named 'Unnamed: i', cells spanning several columns or rows are repeated, short rows are padded with missing
+        values and columns whose cells are all numbers (thousands separators allowed) are converted to numbers,
+        like pandas.read_html does.
+
+        Args:
+            content (bytes): HTML page
+
+        Returns:
+            Pandas dataframe
+    """
+    tab0 = lxml.html.fromstring(content).xpath('(//table)[1]')[0]
+    rows = table_rows(tab0)
+    width = max(len(r) for r in rows)
+    head0 = [h if h else 'Unnamed: {}'.format(i) for i, h in enumerate(rows[0] + [''] * (width - len(rows[0])))]
+    # short rows are padded with missing values
+    tab1 = pd.DataFrame([r + [np.nan] * (width - len(r)) for r in rows[1:] if r], columns=head0)
+    for c in tab1.columns:
         try:
-            response = func(**kwargs)
-            return response
-        except requests.exceptions.ConnectionError:
-            time.sleep(0.1)
-            t0 += 0.1
-    print('Error! Retried for {0} seconds, but url is unresponsive!'.format(t0))
-    logging.error('Warning! Retried for {0} seconds, but url is unresponsive!'.format(t0))
+            tab1[c] = pd.to_numeric(tab1[c].str.replace(',', '', regex=False))
+        except ValueError:
+            pass
+    return tab1
+
+
+def scryfall_frame(card1, hotdtype='int64', sparse=False):
+    """
+        Turns the filtered Scryfall card objects into the card characteristics dataframe: url and description
+        columns are dropped, mana costs and produced mana are split into symbol counts and list columns (color
+        identity, keywords) are expanded into indicator columns.
+
+        Args:
+            card1 (dataframe): one row per kept card object, as parsed from the Scryfall bulk download
+            hotdtype (string): numpy dtype of the indicator columns
+            sparse (bool): whether the keyword and color identity indicators are pandas sparse columns
+
+        Returns:
+            Pandas dataframe
+    """
+    # columns only found on filtered out cards are still expected below
+    for c in ['all_parts', 'preview', 'card_faces', 'promo_types', 'frame_effects', 'arena_id', 'produced_mana',
+              'image_uris']:
+        if c not in card1.columns:
+            card1[c] = np.nan
+
+    # drop url and card description columns, keep image uri
+    dropcol0 = [c for c in card1.columns if 'uri' in c and c != 'image_uris'] + \
+               ['all_parts', 'preview', 'card_faces']
+    card1 = card1.drop(dropcol0, axis=1)
+    # fill na with empty list to avoid TypeError
+    card1['image_uris'] = card1['image_uris'].apply(lambda x: {x} if not isinstance(x, dict) else x)
+    card1['image_url'] = card1['image_uris'].apply(lambda x: x['normal'] if 'normal' in x
+                                                   else (x['large'] if 'large' in x
+                                                         else (x['small'] if 'small' in x else np.nan)
+                                                         ))
+
+    # split mana cost into symbol counts (colored, hybrid, Phyrexian, X) plus generic and converted cost
+    colors = encoders.mana_symbols(card1['mana_cost'], 'colors_')
+    card1 = pd.concat([card1, colors], axis=1)
+    # split identity color and keyword cols
+    icolor = encoders.multihot(card1['color_identity'], 'icolor_', clean=r"\{|\}|/|\s+", dtype=hotdtype,
+                               sparse=sparse)
+    keyw0 = encoders.multihot(card1['keywords'], 'kw_', dtype=hotdtype, sparse=sparse)
+    card1 = pd.concat([card1, icolor, keyw0], axis=1)
+    # recode a few columns (mostly from lists/dicts)
+    card1['ispromo'] = np.where(card1['promo_types'].isna(), 0, 1)
+    card1['difframe'] = np.where(card1['frame_effects'].isna(), 0, 1)
+    card1['arenahas'] = np.where(card1['arena_id'].isna(), 0, 1)
+    # recode produced mana
+    pmana = encoders.mana_symbols(card1['produced_mana'], 'pmana_', totals=False, dtype=hotdtype)
+    card1 = pd.concat([card1, pmana], axis=1)
+
+    # drop additional columns
+    dropcol1 = ['multiverse_ids', 'games', 'legalities', 'prices', 'artist_ids', 'colors', 'mana_cost',
+                'color_identity', 'illustration_id', 'card_back_id', 'produced_mana', 'promo_types',
+                'frame_effects', 'keywords', 'arena_id', 'image_uris']
+    card1 = card1.drop(dropcol1, axis=1)
+
+    return card1
+
+
+def identifier_frame(iden1, hotdtype='int64', sparse=False):
+    """
+        Filters the MTGJSON identifier table to standard legal paper cards that are not basic lands and expands
+        the subtypes, supertypes and types into indicator columns.
+
+        Args:
+            iden1 (dataframe): one row per uuid of AllIdentifiers.json
+            hotdtype (string): numpy dtype of the indicator columns
+            sparse (bool): whether the indicators are pandas sparse columns
+
+        Returns:
+            Pandas dataframe, list of columns that contain keys used for joining and the indicator columns
+    """
+    # filter df to make it smaller
+    mask0 = (iden1['availability'].apply(lambda x: 'paper' in x if isinstance(x, list) else False)) & \
+            (iden1['legalities'].apply(lambda x: 'standard' in x if isinstance(x, dict) else False))
+    iden2 = iden1[mask0]
+    iden2 = iden2[~iden2['type'].str.contains('Basic Land')]
+
+    # recode rulings from list of dicts
+    iden2['newrules'] = iden2['rulings'].apply(lambda x: len(x) if isinstance(x, list) else 0)
+    # expand subtypes, supertypes and types
+    expand0 = [encoders.multihot(iden2[c], p, dtype=hotdtype, sparse=sparse)
+               for c, p in [('subtypes', 'subtype_'), ('supertypes', 'supertype_'), ('types', 'types_')]]
+    keepcol = [c for e in expand0 for c in e.columns]
+    iden2 = pd.concat([iden2] + expand0, axis=1)
+
+    logging.info('MTGJSON ID finished all column expansions.')
+
+    # remove columns that are not used
+    iden2 = iden2[['name', 'uuid', 'identifiers'] + keepcol]
+
+    # get id columns
+    idkey0 = [i for i in iden2['identifiers'].iloc[0].keys() if any(s in i for s in ['mtgjson', 'scryfall'])]
+    iddf0 = pd.DataFrame(
+        iden2['identifiers'].apply(lambda x: {key: x[key] if key in x else '' for key in idkey0}).tolist())
+    iden3 = pd.concat([iden2.reset_index(drop=True), iddf0], axis=1)
+    iden3 = iden3.drop('identifiers', axis=1)
+
+    idkey1 = idkey0 + keepcol
+    return iden3, idkey1
+
+
+def price_frame(price2, idkey0, buy0, sel0):
+    """
+        Stacks the buy and sell prices of each card into the long price dataframe returned by MTGAPI.mtgjson_api,
+        with one pd0, pd1, ... column per day (padded to the number of days in the last 3 months).
+
+        Args:
+            price2 (dataframe): identifier rows of the cards with prices
+            idkey0 (list): identifier columns kept with the prices
+            buy0 (dataframe): buylist prices, one p_YYYY-MM-DD column per day and rows aligned with `price2`
+            sel0 (dataframe): retail prices, aligned the same way
+
+        Returns:
+            Pandas dataframe
+    """
+    # days are in the order they are first found in the price file, a card released within the window lists
+    # fewer days, so the columns are sorted before they are numbered
+    buy0 = buy0[sorted(buy0.columns)]
+    sel0 = sel0[sorted(sel0.columns)]
+    buydcol = buy0.columns.tolist()
+    seldcol = sel0.columns.tolist()
+
+    # add price type and min/max dates
+    buy0['pricetype'] = 'buy'
+    sel0['pricetype'] = 'sell'
+    buy0['minday'] = min(buydcol)
+    buy0['maxday'] = max(buydcol)
+    sel0['minday'] = min(seldcol)
+    sel0['maxday'] = max(seldcol)
+    # rename columns
+    buy0.columns = ['pd' + str(i) for i in range(len(buydcol))] + ['pricetype', 'minday', 'maxday']
+    sel0.columns = ['pd' + str(i) for i in range(len(seldcol))] + ['pricetype', 'minday', 'maxday']
+
+    # missing day columns imputation
+    ndays = minif.ndays()
+    dcols = ['pd{}'.format(i) for i in range(ndays)]
+
+    # in day order, the column order must not depend on the hash seed (the stage cache fingerprints it)
+    bscol = list(dict.fromkeys(buy0.columns.tolist() + sel0.columns.tolist() + dcols))
+    nobuy = [i for i in bscol if i not in buy0.columns.tolist()]
+    nosel = [i for i in bscol if i not in sel0.columns.tolist()]
+
+    for c in nobuy:
+        buy0[c] = np.nan
+    for c in nosel:
+        sel0[c] = np.nan
+
+    pricebuy = pd.concat([price2[['uuid'] + idkey0], buy0], axis=1)
+    pricesel = pd.concat([price2[['uuid'] + idkey0], sel0], axis=1)
+    price3 = pd.concat([pricebuy, pricesel], axis=0).reset_index(drop=True)
+
+    return price3
 
 
 class MTGAPI:
-    """Class to obtain MTG data using APIs. All APIs / mini-scrapers do not need a key to access."""
-    def __init__(self):
+    """
+        Class to obtain MTG data using APIs. All APIs / mini-scrapers do not need a key to access.
+
+        Args:
+            cachedir (string): directory of the on-disk download cache, downloads are not cached if None
+            maxbytes (int): size cap of the download cache in bytes
+            budget (float): seconds each source may spend retrying failed requests before giving up
+            timeout (float): connect and read timeout of each request in seconds
+            hotdtype (string): dtype of the indicator columns expanded from list columns, e.g. 'int64' or 'uint8'
+            sparse (bool): whether the indicator columns are stored as pandas sparse columns
+            historydir (string): directory of the local price history, prices are ingested incrementally from the
+                                 daily MTGJSON price file when set and fully downloaded every time if None
+            codec (string): compressed variant of the MTGJSON files to download ('gz', 'bz2' or 'xz'), decompressed
+                            while streaming into the parser. The uncompressed files are downloaded if None
+            snapshotdir (string): directory of the dated archive every raw download is saved to, nothing is archived
+                                  if None
+            snapshotkeep (int): number of most recent days kept in the archive, all of them if None
+            replay (string): date (YYYY-MM-DD) of an archived day to read every download from instead of the APIs
+    """
+    def __init__(self, cachedir=None, maxbytes=4 * 1024 ** 3, budget=300, timeout=60, hotdtype='int64', sparse=False,
+                 historydir=None, codec='gz', snapshotdir=None, snapshotkeep=7, replay=None):
         self.scryfall = 'https://api.scryfall.com/bulk-data/default-cards'
         self.mtgjson = 'https://mtgjson.com/api/v5/AllPrices.json'
+        self.today = 'https://mtgjson.com/api/v5/AllPricesToday.json'
         self.identifier = 'https://mtgjson.com/api/v5/AllIdentifiers.json'
         self.creatures = 'https://www.mtggoldfish.com/format-staples/standard/full/creatures'
         self.spells = 'https://www.mtggoldfish.com/format-staples/standard/full/spells'
+        # bytes read from the response at a time when streaming
+        self.chunksize = 1024 * 1024
+        # keep-alive connection pool with retries shared by all sources
+        self.session = httpsession.RetrySession(budget=budget, timeout=timeout)
+        self.hotdtype = hotdtype
+        self.sparse = sparse
+        self.historydir = historydir
+        if codec is not None and codec not in jsonstream.CODECS:
+            raise ValueError('codec must be one of {0} or None, got {1}'.format(list(jsonstream.CODECS), codec))
+        self.codec = codec
+        self.replay = replay
+        if snapshotdir or replay:
+            self.archive = snapshots.SnapshotArchive(snapshotdir or 'data/snapshots', chunksize=self.chunksize,
+                                                     keep=snapshotkeep)
+        else:
+            self.archive = None
+        # card x day PriceStore of the prices returned by the last mtgjson_api call
+        self.store = None
+        if cachedir:
+            self.cache = httpcache.DownloadCache(cachedir, maxbytes=maxbytes, chunksize=self.chunksize)
+        else:
+            self.cache = None
+        # downloads started ahead of time by ingest_all, {url: future}
+        self.pending = {}
+        self.spooldir = None
+
+    def fetch(self, url, stream=False, key=None, version=None, source='default'):
+        """
+            Sends a GET request, going through the download cache when one is set up. Cached bodies are revalidated
+            with conditional requests and served from disk when upstream has not changed.
+
+            Args:
+                url (string): url to download
+                stream (bool): whether the body should be read incrementally (only used without a cache)
+                source (string): name of the data source, used for the retry budget and request statistics
+                key (string): cache key if it should differ from the url
+                version (string): upstream version string, the request is skipped when it matches the cached copy
+
+            Returns:
+                requests.Response or httpcache.CachedResponse object
+        """
+        if url in self.pending:
+            return self.pending.pop(url).result()
+        return self.request(url, stream=stream, key=key, version=version, source=source)
+
+    def request(self, url, stream=False, key=None, version=None, source='default'):
+        """Sends the request of `fetch` (or reads the archived body when replaying), ignoring pending downloads."""
+        if self.replay is not None:
+            return self.archive.open(url, self.replay)
+        if self.cache is None:
+            return self.keep(url, self.session.get(url, source=source, stream=stream))
+        return self.keep(url, self.cache.get(url, key=key, version=version,
+                                             getfunc=functools.partial(self.session.get, source=source)))
+
+    def keep(self, url, resp):
+        """Saves a successful download to the snapshot archive (when there is one) and returns the archived body."""
+        if self.archive is None or resp.status_code not in [200, 304]:
+            return resp
+        return self.archive.save(url, resp)
+
+    def variant(self, url):
+        """Returns the url of the compressed variant of an MTGJSON file, `url` itself when no codec is set."""
+        return url if self.codec is None else '{0}.{1}'.format(url, self.codec)
+
+    def body(self, resp):
+        """Generator of the decompressed body of an MTGJSON response, see `variant`."""
+        return jsonstream.decompress(resp.iter_content(chunk_size=self.chunksize), self.codec)
+
+    def download(self, url, source='default'):
+        """
+            Downloads the whole body of `url` to disk (download cache or temporary spool file), so the download does
+            not have to wait for the parser to read it.
+
+            Args:
+                url (string): url to download
+                source (string): name of the data source
+
+            Returns:
+                httpcache.CachedResponse object
+        """
+        # the download workers never pick up pending downloads, that would wait on their own future
+        if self.cache is not None or self.replay is not None:
+            return self.request(url, source=source)
+        return self.keep(url, httpcache.spool(url, self.spooldir,
+                                              getfunc=functools.partial(self.session.get, source=source),
+                                              chunksize=self.chunksize))
+
+    @profiling.track('ingest_all')
+    def ingest_all(self, sources=('scryfall', 'mtgjson'), workers=8):
+        """
+            Downloads all independent payloads at the same time and parses each source as soon as its downloads
+            finish. The MTGJSON identifier and price files and both MTGGoldfish pages are downloaded in parallel
+            instead of one after the other, so wall time approaches that of the slowest single download.
+
+            Args:
+                sources (list): sources to ingest, any of 'scryfall', 'mtgjson' and 'mtggoldfish'
+                workers (int): maximum number of concurrent downloads
 
-    def scryfall_api(self):
+            Returns:
+                dictionary of {source: dataframe returned by the source's MTGAPI function}
+        """
+        start_time = time.time()
+        # the scryfall download uri is only known after its metadata request, so scryfall_api downloads it itself
+        # the full price file is only needed every day without a price history (it is fetched on demand after a gap)
+        urls = {'scryfall': [], 'mtgjson': [self.variant(u) for u in
+                                            [self.identifier, self.mtgjson if self.historydir is None else self.today]],
+                'mtggoldfish': [] if self.goldfish_path() and os.path.isfile(self.goldfish_path())
+                else [self.creatures, self.spells]}
+        funcs = {'scryfall': self.scryfall_api, 'mtgjson': self.mtgjson_api, 'mtggoldfish': self.mtggoldfish}
+
+        with tempfile.TemporaryDirectory() as tmp0, ThreadPoolExecutor(max_workers=workers) as downpool, \
+                ThreadPoolExecutor(max_workers=len(sources)) as parsepool:
+            self.spooldir = tmp0
+            try:
+                # the download workers go through request(), they never wait on the futures in `pending`
+                self.pending = {u: downpool.submit(self.download, u, s) for s in sources for u in urls[s]}
+                parsed = {s: parsepool.submit(funcs[s]) for s in sources}
+                result = {s: f.result() for s, f in parsed.items()}
+            finally:
+                # a failed parser must not leave the next call waiting on downloads of this one
+                self.pending = {}
+                self.spooldir = None
+                if self.cache is not None:
+                    # last use times of the cache hits of this run
+                    self.cache.flush()
+
+        logging.info('Ingestion of {0} ran for {1} seconds'.format(', '.join(sources),
+                                                                  round(time.time() - start_time, 2)))
+        logging.info('Request statistics:\n{}'.format(self.session.report().to_string(index=False)))
+        return result
+
+    @profiling.track('scryfall_api')
+    def scryfall_api(self, stream=True):
         """
             Obtains data from the Scryfall bulk download API. Does a simple filtering to keep only standard legal
             non-basic land cards so that subsequent operations will be more efficient. Promotional and non-English
             cards are also filtered out.
 
+            Args:
+                stream (bool): whether to parse the bulk download incrementally and filter each card as it is
+                               parsed, so that only the kept cards are ever held in memory
+
             Returns:
                 Pandas dataframe
         """
 
         start_time = time.time()
 
-        re0 = url_wait(requests.get, wait=200, url=self.scryfall)
+        re0 = self.fetch(self.scryfall, source='scryfall')
         logging.info('Status code for scryfall bulk data url: {}'.format(re0.status_code))
         bulk0 = re0.json()
+        # download_uri changes with every release, so the bulk file is cached under a fixed key and only
+        # downloaded again when updated_at or size change
+        bulkver = '{0}|{1}'.format(bulk0.get('updated_at'), bulk0.get('size'))
+
+        if stream:
+            # parse the bulk file one card at a time and only keep the cards that pass the filter
+            re1 = self.fetch(bulk0['download_uri'], stream=True, key='scryfall-default-cards', version=bulkver,
+                             source='scryfall')
+            logging.info('Status code for scryfall data download: {}'.format(re1.status_code))
+            cards = [c for c in jsonstream.iter_array(re1.iter_content(chunk_size=self.chunksize))
+                     if scryfall_keep(c)]
+            re1.close()
+            card1 = pd.DataFrame.from_dict(cards)
+        else:
+            re1 = self.fetch(bulk0['download_uri'], key='scryfall-default-cards', version=bulkver,
+                             source='scryfall')
+            logging.info('Status code for scryfall data download: {}'.format(re1.status_code))
+            js0 = re1.json()
+
+            card0 = pd.DataFrame.from_dict(js0)
+            card1 = card0[(card0['legalities'].apply(lambda x: x['standard']) == 'legal') &
+                          (card0['set_type'].isin(['expansion', 'core'])) & (card0['lang'] == 'en')]
+            card1 = card1[~card1['type_line'].str.contains('Basic Land')]
+
+        card1 = scryfall_frame(card1, hotdtype=self.hotdtype, sparse=self.sparse)
 
-        re1 = url_wait(requests.get, wait=200, url=bulk0['download_uri'])
-        logging.info('Status code for scryfall data download: {}'.format(re1.status_code))
-        js0 = re1.json()
-
-        card0 = pd.DataFrame.from_dict(js0)
-        card1 = card0[(card0['legalities'].apply(lambda x: x['standard']) == 'legal') &
-                      (card0['set_type'].isin(['expansion', 'core'])) & (card0['lang'] == 'en')]
-        card1 = card1[~card1['type_line'].str.contains('Basic Land')]
-        # drop url and card description columns, keep image uri
-        dropcol0 = [c for c in card1.columns if 'uri' in c and c != 'image_uris'] + \
-                   ['all_parts', 'preview', 'card_faces']
-        card1 = card1.drop(dropcol0, axis=1)
-        # fill na with empty list to avoid TypeError
-        card1['image_uris'] = card1['image_uris'].apply(lambda x: {x} if not isinstance(x, dict) else x)
-        card1['image_url'] = card1['image_uris'].apply(lambda x: x['normal'] if 'normal' in x
-                                                       else (x['large'] if 'large' in x
-                                                             else (x['small'] if 'small' in x else np.nan)
-                                                             ))
-
-        # split color cols
-        colors = list(set(re.sub(r"\{|\}|[0-9]|/|\s+", '', ''.join([i for i in card1['mana_cost'].values.tolist()
-                                                                    if str(i) != 'nan']))))
-        for c in colors:
-            card1['colors_' + c] = card1['mana_cost'].str.count(c).fillna(0)
-        # split identity color cols
-        icolor = list(set(re.sub(r"\{|\}|'|\]|\[|,|/|\s+", '', ''.join([str(i) for i in
-                                                                        card1['color_identity'].values.tolist()]))))
-        for ic in icolor:
-            card1['icolor_' + ic] = card1['color_identity'].apply(lambda x: 1 if ic in x else 0)
-        # split keywords
-        keyw0 = list(set([i for j in card1['keywords'].values.tolist() for i in j]))
-        for k in keyw0:
-            card1['kw_' + re.sub(r'-|,|/|\s+', '', k)] = card1['keywords'].apply(lambda x: 1 if k in x else 0)
-        # recode a few columns (mostly from lists/dicts)
-        card1['ispromo'] = np.where(card1['promo_types'].isna(), 0, 1)
-        card1['difframe'] = np.where(card1['frame_effects'].isna(), 0, 1)
-        card1['arenahas'] = np.where(card1['arena_id'].isna(), 0, 1)
-        # recode produced mana
-        pmana = list(set(re.sub(r"\{|\}|'|\]|\[|,|/|\s+", '',
-                                ''.join([str(i) for i in card1['produced_mana'].values.tolist() if str(i) != 'nan']))))
-        for pm in pmana:
-            card1['pmana_' + pm] = card1['produced_mana'].apply(lambda x: x.count(pm) if isinstance(x, list) else 0)
-
-        # drop additional columns
-        dropcol1 = ['multiverse_ids', 'games', 'legalities', 'prices', 'artist_ids', 'colors', 'mana_cost',
-                    'color_identity', 'illustration_id', 'card_back_id', 'produced_mana', 'promo_types',
-                    'frame_effects', 'keywords', 'arena_id', 'image_uris']
-        card1 = card1.drop(dropcol1, axis=1)
-
-        print("Scryfall ran for: {0} seconds ({1} mins)".format(str(round(time.time() - start_time, 2)),
-                                                                str(round((time.time() - start_time) / 60))))
         logging.info('Scryfall ran for {} seconds'.format(round(time.time() - start_time, 2)))
-        return card1
+        return dtypes.downcast(card1, 'scryfall_api')
 
+    @profiling.track('mtgjson_id')
     def mtgjson_id(self, keepraw=False):
         """
             Obtains the identifier json file from the MTGJSON API. This file allows the MTGJSON historical price data
@@ -129,166 +504,204 @@ class MTGAPI:
                 Pandas dataframe, list of columns that contain keys used for joining
         """
 
-        re0 = url_wait(requests.get, wait=200, url=self.identifier)
+        re0 = self.fetch(self.variant(self.identifier), stream=True, source='mtgjson')
         logging.info('Status code for mtgjson identifier: {}'.format(re0.status_code))
 
-        iden0 = re0.json()
-        iden0 = iden0['data']
+        iden0 = dict(jsonstream.iter_object(self.body(re0), path=('data',)))
+        re0.close()
         iden1 = pd.DataFrame.from_dict(iden0).T
 
-        # filter df to make it smaller
-        mask0 = (iden1['availability'].apply(lambda x: 'paper' in x if isinstance(x, list) else False)) & \
-                (iden1['legalities'].apply(lambda x: 'standard' in x if isinstance(x, dict) else False))
-        iden2 = iden1[mask0]
-        iden2 = iden2[~iden2['type'].str.contains('Basic Land')]
-
-        # recode rulings from list of dicts
-        iden2['newrules'] = iden2['rulings'].apply(lambda x: len(x) if isinstance(x, list) else 0)
-        # expand subtypes
-        keepcol = []
-        subtype = list(set([i for j in iden2['subtypes'].values.tolist() for i in j]))
-        for bt in subtype:
-            newcol = 'subtype_' + re.sub(r'-|,|/|\s+', '', bt)
-            iden2[newcol] = iden2['subtypes'].apply(lambda x: 1 if isinstance(x, list) and bt in x else 0)
-            keepcol.append(newcol)
-        # expand supertypes
-        supertype = list(set([i for j in iden2['supertypes'].values.tolist() for i in j]))
-        for ut in supertype:
-            newcol = 'supertype_' + re.sub(r'-|,|/|\s+', '', ut)
-            iden2[newcol] = iden2['supertypes'].apply(lambda x: 1 if isinstance(x, list) and ut in x else 0)
-            keepcol.append(newcol)
-        # expand types
-        types0 = list(set([i for j in iden2['types'].values.tolist() for i in j]))
-        for typ in types0:
-            newcol = 'types_' + re.sub(r'-|,|/|\s+', '', typ)
-            iden2[newcol] = iden2['types'].apply(lambda x: 1 if isinstance(x, list) and typ in x else 0)
-            keepcol.append(newcol)
-
-        logging.info('MTGJSON ID finished all column expansions.')
-
-        # remove columns that are not used
-        iden2 = iden2[['name', 'uuid', 'identifiers'] + keepcol]
-
-        # get id columns
-        idkey0 = [i for i in iden2['identifiers'].iloc[0].keys() if any(s in i for s in ['mtgjson', 'scryfall'])]
-        iddf0 = pd.DataFrame(
-            iden2['identifiers'].apply(lambda x: {key: x[key] if key in x else '' for key in idkey0}).tolist())
-        iden3 = pd.concat([iden2.reset_index(drop=True), iddf0], axis=1)
-        iden3 = iden3.drop('identifiers', axis=1)
-
-        idkey1 = idkey0 + keepcol
+        iden3, idkey1 = identifier_frame(iden1, hotdtype=self.hotdtype, sparse=self.sparse)
+        iden3 = dtypes.downcast(iden3, 'mtgjson_id')
         if keepraw:
             return iden3, idkey1, iden1
         else:
             return iden3, idkey1
 
-    def mtgjson_api(self):
+    def mtgjson_prices(self, url, uuid0):
+        """
+            Streams an MTGJSON price file (AllPrices.json or AllPricesToday.json) one uuid at a time, skipping uuids
+            that are not in `uuid0` and pruning mtgo and foil prices while parsing.
+
+            Args:
+                url (string): url of the price file
+                uuid0 (set): uuids kept by mtgjson_id
+
+            Returns:
+                list of (uuid, non-foil paper prices) tuples of the uuids with paper prices
+        """
+        rejson = self.fetch(self.variant(url), stream=True, source='mtgjson')
+        logging.info('Status code for mtgjson prices {0}: {1}'.format(url, rejson.status_code))
+        price0 = [(k, paper_normal(v)) for k, v in jsonstream.iter_object(self.body(rejson), path=('data',))
+                  if k in uuid0 and v.get('paper')]
+        rejson.close()
+        return price0
+
+    def mtgjson_history(self, iden3):
+        """
+            Updates the local price history with the daily MTGJSON price file instead of downloading the full 90 day
+            file. The full file is only downloaded when there is no history yet, when days are missing between the
+            history and the daily file or when the daily file has cards the history does not (only those are then
+            read from it). Days older than the window are expired before the history is saved. The
+            history is archived with the raw downloads, replays start from the archived copy and leave the local
+            history untouched.
+
+            Args:
+                iden3 (dataframe): identifier dataframe returned by mtgjson_id
+
+            Returns:
+                identifier dataframe of the cards with buy and sell prices, buy price dataframe, sell price dataframe
+        """
+        histdir = self.historydir or 'data/prices'
+        with tempfile.TemporaryDirectory() as tmp0:
+            if self.replay is not None:
+                histdir = tmp0
+                self.archive.restore_dir('pricehistory', self.replay, histdir)
+            elif self.archive is not None:
+                self.archive.save_dir('pricehistory', histdir)
+
+            hist0 = pricehistory.PriceHistory(histdir, window=minif.ndays()).load()
+            uuid0 = set(iden3['uuid'].values.tolist())
+            today0 = self.mtgjson_prices(self.today, uuid0)
+            if hist0.gap(hist0.dates(today0)):
+                logging.info('No price history up to {} or days are missing, downloading the full price file'
+                             ''.format(hist0.lastdate()))
+                hist0.replace(self.mtgjson_prices(self.mtgjson, uuid0))
+            elif hist0.new(today0):
+                # cards that joined the identifiers since (e.g. a new set) get the prices of the whole window
+                new0 = hist0.new(today0)
+                logging.info('{} cards are not in the price history yet, backfilling them from the full price file'
+                             ''.format(len(new0)))
+                hist0.update(self.mtgjson_prices(self.mtgjson, new0))
+            hist0.update(today0)
+            hist0.expire()
+            store0 = hist0.save()
+
+        keep0 = hist0.complete()
+        price2 = iden3[iden3['uuid'].isin(keep0)].reset_index(drop=True)
+        self.store = store0.subset(price2['uuid'])
+        # prices are read back from the saved float32 store so every run gives the same values, rounded to cents so
+        # they are the float64 prices parsed from the full file
+        buy0 = self.store.frame('buy', prefix='p_').reset_index(drop=True).astype(float).round(2)
+        sel0 = self.store.frame('sell', prefix='p_').reset_index(drop=True).astype(float).round(2)
+        return price2, buy0, sel0
+
+    @profiling.track('mtgjson_api')
+    def mtgjson_api(self, stream=True, incremental=None):
         """
             Combines historical price data for the past 3 months with the identifier dataframe. The output has one
             column for each day's price data. Each card has 2 rows of price data, one for retail and the other for
             buylist. Cards without non-foil paper prices are dropped.
 
+            Args:
+                stream (bool): whether to parse the price file one uuid at a time, skipping uuids that are not in the
+                               identifier dataframe and pruning mtgo and foil prices while parsing
+                incremental (bool): whether to only download today's prices and append them to the local price
+                                    history (see mtgjson_history), defaults to True when `historydir` is set
+
             Returns:
-                Pandas dataframe
+                Pandas dataframe. The same prices are kept as a card x day PriceStore in `self.store`
         """
 
         start_time = time.time()
         iden3, idkey0 = self.mtgjson_id()
         logging.info('MTGjson identifier ran for {} seconds'.format(round(time.time() - start_time, 2)))
+        incremental = self.historydir is not None if incremental is None else incremental
+
+        if incremental:
+            price2, buy0, sel0 = self.mtgjson_history(iden3)
+        else:
+            if stream:
+                # only uuids kept by mtgjson_id with paper prices are held in memory
+                price0 = self.mtgjson_prices(self.mtgjson, set(iden3['uuid'].values.tolist()))
+                price1 = pd.DataFrame(price0, columns=['uuid', 'paper'])
+            else:
+                rejson = self.fetch(self.variant(self.mtgjson), stream=True, source='mtgjson')
+                logging.info('Status code for mtgjson prices: {}'.format(rejson.status_code))
+                price0 = json.loads(b''.join(self.body(rejson)))
+
+                # get what is inside data key
+                price0 = price0['data']
+                price1 = pd.DataFrame.from_dict(price0).T
+                price1['uuid'] = price1.index
+                price1 = price1.reset_index(drop=True).drop('mtgo', axis=1)
+
+            price2 = pd.merge(iden3, price1, on='uuid', how='inner')
+            # price2['pricesource'] = price2['paper'].apply(lambda x: [i for i in x.keys()
+            #                                               if any(s in i for s in ['cardkingdom', 'tcgplayer'])])
+            # drill down to get price of non-foil paper cards
+            price2['pricesource'] = price2['paper'].apply(lambda x: list(x.keys())[0])
+            price2 = price2.dropna(subset=['pricesource'], how='any')
+            price2['buy'] = price2['paper'].apply(
+                lambda x: x[list(x.keys())[0]]['buylist'] if 'buylist' in x[list(x.keys())[0]] else np.nan)
+            price2['sell'] = price2['paper'].apply(
+                lambda x: x[list(x.keys())[0]]['retail'] if 'retail' in x[list(x.keys())[0]] else np.nan)
+            price2 = price2.dropna(subset=['buy', 'sell'], how='any')
+            price2['buynormal'] = price2['buy'].apply(lambda x: x['normal'] if 'normal' in x else np.nan)
+            price2['sellnormal'] = price2['sell'].apply(lambda x: x['normal'] if 'normal' in x else np.nan)
+            price2 = price2.dropna(subset=['buynormal', 'sellnormal'], how='any')
+            price2 = price2.reset_index(drop=True)
+
+            logging.info('MTGJSON price function finished extracting non-foil paper prices.')
+
+            # expand dict of daily prices
+            buy0 = pd.DataFrame(price2['buynormal'].values.tolist(), price2.index).add_prefix('p_')
+            sel0 = pd.DataFrame(price2['sellnormal'].values.tolist(), price2.index).add_prefix('p_')
+            self.store = pricestore.PriceStore.from_frames(
+                *[f.set_axis(price2['uuid'], axis=0).rename(columns=lambda c: c[len('p_'):]) for f in [buy0, sel0]])
+        price3 = price_frame(price2, idkey0, buy0, sel0)
 
-        rejson = url_wait(requests.get, wait=200, url=self.mtgjson)
-        logging.info('Status code for mtgjson prices: {}'.format(rejson.status_code))
-        price0 = rejson.json()
-
-        # get what is inside data key
-        price0 = price0['data']
-        price1 = pd.DataFrame.from_dict(price0).T
-        price1['uuid'] = price1.index
-        price1 = price1.reset_index(drop=True).drop('mtgo', axis=1)
-
-        price2 = pd.merge(iden3, price1, on='uuid', how='inner')
-        # price2['pricesource'] = price2['paper'].apply(lambda x: [i for i in x.keys()
-        #                                               if any(s in i for s in ['cardkingdom', 'tcgplayer'])])
-        # drill down to get price of non-foil paper cards
-        price2['pricesource'] = price2['paper'].apply(lambda x: list(x.keys())[0])
-        price2 = price2.dropna(subset=['pricesource'], how='any')
-        price2['buy'] = price2['paper'].apply(
-            lambda x: x[list(x.keys())[0]]['buylist'] if 'buylist' in x[list(x.keys())[0]] else np.nan)
-        price2['sell'] = price2['paper'].apply(
-            lambda x: x[list(x.keys())[0]]['retail'] if 'retail' in x[list(x.keys())[0]] else np.nan)
-        price2 = price2.dropna(subset=['buy', 'sell'], how='any')
-        price2['buynormal'] = price2['buy'].apply(lambda x: x['normal'] if 'normal' in x else np.nan)
-        price2['sellnormal'] = price2['sell'].apply(lambda x: x['normal'] if 'normal' in x else np.nan)
-        price2 = price2.dropna(subset=['buynormal', 'sellnormal'], how='any')
-        price2 = price2.reset_index(drop=True)
-
-        logging.info('MTGJSON price function finished extracting non-foil paper prices.')
-
-        # expand dict of daily prices
-        buy0 = pd.DataFrame(price2['buynormal'].values.tolist(), price2.index).add_prefix('p_')
-        sel0 = pd.DataFrame(price2['sellnormal'].values.tolist(), price2.index).add_prefix('p_')
-        buydcol = buy0.columns.tolist()
-        seldcol = sel0.columns.tolist()
-
-        # add price type and min/max dates
-        buy0['pricetype'] = 'buy'
-        sel0['pricetype'] = 'sell'
-        buy0['minday'] = min(buydcol)
-        buy0['maxday'] = max(buydcol)
-        sel0['minday'] = min(seldcol)
-        sel0['maxday'] = max(seldcol)
-        # rename columns
-        buy0.columns = ['pd' + str(i) for i in range(len(buydcol))] + ['pricetype', 'minday', 'maxday']
-        sel0.columns = ['pd' + str(i) for i in range(len(seldcol))] + ['pricetype', 'minday', 'maxday']
-
-        # missing day columns imputation
-        ndays = minif.ndays()
-        dcols = ['pd{}'.format(i) for i in range(ndays)]
-
-        bscol = list(set(buy0.columns.tolist() + sel0.columns.tolist() + dcols))
-        nobuy = [i for i in bscol if i not in buy0.columns.tolist()]
-        nosel = [i for i in bscol if i not in sel0.columns.tolist()]
-
-        for c in nobuy:
-            buy0[c] = np.nan
-        for c in nosel:
-            sel0[c] = np.nan
-
-        pricebuy = pd.concat([price2[['uuid'] + idkey0], buy0], axis=1)
-        pricesel = pd.concat([price2[['uuid'] + idkey0], sel0], axis=1)
-        price3 = pd.concat([pricebuy, pricesel], axis=0).reset_index(drop=True)
-
-        print("MTGJSON ran for: {0} seconds ({1} mins)".format(str(round(time.time() - start_time, 2)),
-                                                               str(round((time.time() - start_time) / 60))))
         logging.info('MTGjson data ran for {} seconds'.format(round(time.time() - start_time, 2)))
-        return price3
+        return dtypes.downcast(price3, 'mtgjson_api')
 
-    def mtggoldfish(self):
+    def goldfish_path(self, day=None):
+        """
+            Returns the path of the MTGGoldfish results cached for `day` (a datetime.date, defaults to today), None
+            when there is no download cache.
+        """
+        if self.cache is None or self.replay is not None:
+            return None
+        day = datetime.date.today() if day is None else day
+        return os.path.join(self.cache.cachedir, 'mtggoldfish-{}.pkl'.format(day.isoformat()))
+
+    @profiling.track('mtggoldfish')
+    def mtggoldfish(self, day=None):
         """
             HTML parser function to obtain usage data for the most popular creature and spell cards within Standard.
-            Only obtains the most up to date data.
+            Only obtains the most up to date data. Both pages are downloaded at the same time and each table is
+            parsed once with lxml. With a download cache, the result is kept for the rest of the calendar day so
+            later refreshes do not request the pages again.
+
+            Args:
+                day (datetime.date): calendar day the results are cached under, defaults to today
 
             Returns:
                 Pandas dataframe
         """
 
+        path0 = self.goldfish_path(day)
+        if path0 is not None and os.path.isfile(path0):
+            logging.info('Using MTGGoldfish staples cached in {}'.format(path0))
+            return pd.read_pickle(path0)
+
+        urls = [self.creatures, self.spells]
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            pages = list(pool.map(functools.partial(self.fetch, source='mtggoldfish'), urls))
         top0 = []
-        for u in [self.creatures, self.spells]:
-            gold0 = url_wait(requests.get, wait=200, url=u)
+        for u, gold0 in zip(urls, pages):
             logging.info('Status code for mtggoldfish url {0}: {1}'.format(u, gold0.status_code))
-
-            gold1 = gold0.content
-            soup0 = BeautifulSoup(gold1, 'html.parser')
-            # get all data in html table
-            tab0 = soup0.find_all('table')
-            tab1 = pd.read_html(str(tab0[0]))[0]
-            top0.append(tab1)
+            top0.append(html_table(gold0.content))
         top1 = pd.concat(top0)
 
         # drop index column and columns with no value
         top1 = top1.drop([c for c in top1.columns if 'Unnamed' in c], axis=1)
         top1 = top1.dropna(axis=1, how='all')
 
+        if path0 is not None:
+            # only the current day is kept
+            for old0 in glob.glob(os.path.join(self.cache.cachedir, 'mtggoldfish-*.pkl')):
+                os.remove(old0)
+            top1.to_pickle(path0)
         return top1
 
 
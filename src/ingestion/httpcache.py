@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import logging.config
+import requests
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+class CachedResponse:
+    def __init__(self, path, status_code, fromcache, opener=open, sha256=None):
+        """
+            Minimal stand-in for a requests.Response whose body is read from a file inside the download cache.
+            Only the parts of the response interface used by MTGAPI are provided.
+
+            Args:
+                path (string): path to the cached body
+                status_code (int): status code returned by upstream (304 if the cached copy was revalidated)
+                fromcache (bool): whether the body was served without downloading it again
+                opener (function): function opening `path` for reading, e.g. gzip.open for a compressed body
+                sha256 (string): hex sha256 digest of the body as downloaded, None if unknown
+        """
+        self.path = path
+        self.opener = opener
+        self.sha256 = sha256
+        self.status_code = status_code
+        self.fromcache = fromcache
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        """Generator yielding the cached body in chunks of `chunk_size` bytes."""
+        with self.opener(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    @property
+    def content(self):
+        with self.opener(self.path, 'rb') as f:
+            return f.read()
+
+    def json(self):
+        with self.opener(self.path, 'rb') as f:
+            return json.load(f)
+
+    def close(self):
+        pass
+
+
+def spool(url, spooldir, getfunc=None, chunksize=1024 * 1024, **kwargs):
+    """
+        Downloads the body of `url` into a temporary file so that the download can finish independently of whoever
+        parses it. Used for concurrent downloads when no DownloadCache is set up.
+
+        Args:
+            url (string): url to download
+            spooldir (string): directory of the temporary file, the caller is responsible for removing it
+            getfunc (function): function sending the GET request, defaults to requests.get
+            chunksize (int): bytes written to disk at a time
+            kwargs: additional inputs passed to `getfunc`
+
+        Returns:
+            CachedResponse object, or the original response if the status code is not 200
+    """
+    getfunc = requests.get if getfunc is None else getfunc
+    resp = getfunc(url=url, stream=True, **kwargs)
+    if resp is None:
+        raise requests.exceptions.ConnectionError('Unable to download {}'.format(url))
+    if resp.status_code != 200:
+        return resp
+    fd0, path0 = tempfile.mkstemp(dir=spooldir, suffix='.part')
+    sha0 = hashlib.sha256()
+    with os.fdopen(fd0, 'wb') as f:
+        for chunk in resp.iter_content(chunk_size=chunksize):
+            sha0.update(chunk)
+            f.write(chunk)
+    resp.close()
+    return CachedResponse(path0, resp.status_code, fromcache=False, sha256=sha0.hexdigest())
+
+
+class DownloadCache:
+    def __init__(self, cachedir='data/cache', maxbytes=4 * 1024 ** 3, chunksize=1024 * 1024):
+        """
+            On-disk, content addressed cache for API downloads. Bodies are stored once per sha256 digest and an
+            index maps each url (or custom key) to its digest and validators (ETag, Last-Modified and an optional
+            caller supplied version string). Unchanged payloads are revalidated with conditional requests and
+            served from disk. The least recently used entries are evicted once the cache grows past `maxbytes`.
+            Hits only update the index in memory, it is written when an entry is added or evicted and by flush().
+
+            Args:
+                cachedir (string): directory holding the cached bodies and the index file
+                maxbytes (int): size cap of all cached bodies in bytes
+                chunksize (int): bytes written to disk at a time while downloading
+        """
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.chunksize = chunksize
+        self.indexpath = os.path.join(cachedir, 'index.json')
+        self.lock = threading.Lock()
+        # whether the index in memory has changes (last use times) that are not written yet
+        self.dirty = False
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0, 'evicted': 0,
+                      'bytes_served': 0, 'bytes_downloaded': 0}
+        os.makedirs(cachedir, exist_ok=True)
+        if os.path.isfile(self.indexpath):
+            with open(self.indexpath, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def blobpath(self, digest):
+        return os.path.join(self.cachedir, digest + '.bin')
+
+    def save_index(self):
+        tmp0 = self.indexpath + '.tmp'
+        with open(tmp0, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp0, self.indexpath)
+        self.dirty = False
+
+    def flush(self):
+        """Writes the index if hits changed it since it was last written."""
+        with self.lock:
+            if self.dirty:
+                self.save_index()
+
+    def cached(self, key):
+        """
+            Returns the index entry of `key` if its body is still on disk, otherwise None.
+        """
+        entry = self.index.get(key)
+        if entry is not None and os.path.isfile(self.blobpath(entry['sha256'])):
+            return entry
+        return None
+
+    def serve(self, key, entry, status_code, counter, changed=False):
+        """
+            Marks an entry as recently used, updates the statistics and returns its body as a CachedResponse. The
+            index is only written right away if the entry `changed` otherwise (e.g. a new version).
+        """
+        with self.lock:
+            entry['lastused'] = time.time()
+            self.stats[counter] += 1
+            self.stats['bytes_served'] += entry['size']
+            if changed:
+                self.save_index()
+            else:
+                self.dirty = True
+        logger.info('Download cache hit ({0}) for {1}'.format(counter, key))
+        return CachedResponse(self.blobpath(entry['sha256']), status_code, fromcache=True, sha256=entry['sha256'])
+
+    def get(self, url, key=None, version=None, getfunc=None, **kwargs):
+        """
+            Returns the body of `url`, downloading it only when the cached copy is missing or has changed upstream.
+
+            Args:
+                url (string): url to download
+                key (string): cache key, defaults to the url. Useful when the url itself changes between releases
+                version (string): caller supplied version (e.g. Scryfall `updated_at` and `size`). When it matches the
+                                  cached entry the body is served without sending any request
+                getfunc (function): function sending the GET request, defaults to requests.get
+                kwargs: additional inputs passed to `getfunc`
+
+            Returns:
+                CachedResponse object
+        """
+        key = url if key is None else key
+        getfunc = requests.get if getfunc is None else getfunc
+        entry = self.cached(key)
+
+        if entry is not None and version is not None and entry.get('version') == version:
+            return self.serve(key, entry, 200, 'hits')
+
+        # conditional request using the validators of the cached copy
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            resp = getfunc(url=url, headers=headers, stream=True, **kwargs)
+        except requests.exceptions.RequestException as e:
+            resp = None
+            logger.warning('Download of {0} failed: {1}'.format(url, e))
+
+        if resp is None:
+            if entry is not None:
+                logger.warning('Serving stale cached copy of {}'.format(key))
+                return self.serve(key, entry, 200, 'stale')
+            raise requests.exceptions.ConnectionError('Unable to download {} and nothing is cached'.format(url))
+
+        if resp.status_code == 304 and entry is not None:
+            resp.close()
+            changed = version is not None and entry.get('version') != version
+            if changed:
+                entry['version'] = version
+            return self.serve(key, entry, 304, 'revalidated', changed=changed)
+
+        if resp.status_code != 200:
+            # errors are not cached, hand the response back to the caller as is
+            return resp
+
+        # stream the body to disk while hashing it, the file is renamed to its digest afterwards
+        sha0 = hashlib.sha256()
+        tmp0 = os.path.join(self.cachedir, '{0}.{1}.part'.format(os.getpid(), threading.get_ident()))
+        size0 = 0
+        with open(tmp0, 'wb') as f:
+            for chunk in resp.iter_content(chunk_size=self.chunksize):
+                sha0.update(chunk)
+                size0 += len(chunk)
+                f.write(chunk)
+        resp.close()
+        digest = sha0.hexdigest()
+
+        with self.lock:
+            if os.path.isfile(self.blobpath(digest)):
+                os.remove(tmp0)
+            else:
+                os.replace(tmp0, self.blobpath(digest))
+            entry = {'sha256': digest, 'size': size0, 'etag': resp.headers.get('ETag'),
+                     'last_modified': resp.headers.get('Last-Modified'), 'version': version,
+                     'lastused': time.time()}
+            self.index[key] = entry
+            self.stats['misses'] += 1
+            self.stats['bytes_downloaded'] += size0
+            self.evict(keep=key)
+            self.save_index()
+        logger.info('Download cache miss for {0}, stored {1} bytes'.format(key, size0))
+        return CachedResponse(self.blobpath(digest), resp.status_code, fromcache=False, sha256=digest)
+
+    def evict(self, keep=None):
+        """
+            Removes least recently used entries until the cached bodies fit within `maxbytes`. Bodies shared by
+            several keys are only deleted once no key refers to them. Must be called while holding the lock.
+
+            Args:
+                keep (string): key that must not be evicted (the one that was just stored)
+        """
+        sizes = {e['sha256']: e['size'] for e in self.index.values()}
+        total = sum(sizes.values())
+        for k in sorted(self.index, key=lambda x: self.index[x]['lastused']):
+            if total <= self.maxbytes:
+                break
+            if k == keep:
+                continue
+            digest = self.index.pop(k)['sha256']
+            self.stats['evicted'] += 1
+            if all(e['sha256'] != digest for e in self.index.values()):
+                if os.path.isfile(self.blobpath(digest)):
+                    os.remove(self.blobpath(digest))
+                total -= sizes[digest]
+            logger.debug('Evicted {} from the download cache'.format(k))
+
+    def size(self):
+        """Returns the total size in bytes of the bodies currently referenced by the index."""
+        return sum({e['sha256']: e['size'] for e in self.index.values()}.values())
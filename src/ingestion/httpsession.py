@@ -0,0 +1,146 @@
+import time
+import random
+import threading
+import logging.config
+import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+class RetrySession:
+    def __init__(self, backoff=0.5, maxbackoff=30, budget=300, timeout=(10, 60), poolsize=16,
+                 retrystatus=(429, 500, 502, 503, 504)):
+        """
+            Shared HTTP session for all API downloads. Connections are kept alive and pooled, failed requests
+            (connection errors, timeouts and retryable status codes) are retried with exponential backoff and jitter,
+            and every source has a total retry time budget. Latency, retries and bytes transferred are recorded for
+            each request.
+
+            Args:
+                backoff (float): base wait in seconds, doubled after every failed attempt
+                maxbackoff (float): upper bound of a single wait in seconds
+                budget (float): seconds each source may spend on failed attempts and waits before giving up
+                timeout (tuple): connect and read timeouts in seconds passed to requests
+                poolsize (int): number of connections kept alive per host
+                retrystatus (tuple): status codes that are retried
+        """
+        self.backoff = backoff
+        self.maxbackoff = maxbackoff
+        self.budget = budget
+        self.timeout = timeout
+        self.retrystatus = retrystatus
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        # seconds of the retry budget used by each source
+        self.spent = {}
+        self.records = []
+
+    def wait(self, attempt, resp=None):
+        """
+            Returns the number of seconds to wait before the next attempt. Uses "equal jitter" (half fixed, half
+            random) exponential backoff and honours the Retry-After header of 429/503 responses.
+        """
+        cap = min(self.maxbackoff, self.backoff * 2 ** attempt)
+        wait0 = cap / 2 + random.uniform(0, cap / 2)
+        if resp is not None and str(resp.headers.get('Retry-After', '')).isdigit():
+            wait0 = max(wait0, float(resp.headers['Retry-After']))
+        return wait0
+
+    def get(self, url, source='default', stream=False, **kwargs):
+        """
+            Sends a GET request through the pooled session, retrying until it succeeds or the source's retry budget
+            is used up.
+
+            Args:
+                url (string): url to request
+                source (string): name of the data source the retry budget and statistics are kept under
+                stream (bool): whether the body is read later by the caller (bytes are counted as they are read)
+                kwargs: additional inputs passed to requests.Session.get
+
+            Returns:
+                requests.Response object (status codes that are not retried are returned as is)
+
+            Raises:
+                requests.exceptions.RetryError once the retry budget of the source is used up
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        start_time = time.time()
+        attempt = 0
+        while True:
+            attempt_time = time.time()
+            resp = None
+            try:
+                resp = self.session.get(url, stream=stream, **kwargs)
+                if resp.status_code not in self.retrystatus:
+                    break
+                error = 'status code {}'.format(resp.status_code)
+                resp.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = repr(e)
+
+            wait0 = self.wait(attempt, resp)
+            with self.lock:
+                spent0 = self.spent.get(source, 0) + time.time() - attempt_time
+                if spent0 + wait0 > self.budget:
+                    self.spent[source] = spent0
+                    self.record(source, url, resp, start_time, attempt, 0)
+                    logger.error('Retry budget of {0} seconds used up for {1} ({2}), last error: {3}'
+                                 ''.format(self.budget, source, url, error))
+                    raise requests.exceptions.RetryError('Giving up on {0} after {1} retries: {2}'
+                                                         ''.format(url, attempt, error))
+                self.spent[source] = spent0 + wait0
+            logger.warning('Attempt {0} for {1} failed ({2}), retrying in {3} seconds'
+                           ''.format(attempt + 1, url, error, round(wait0, 2)))
+            time.sleep(wait0)
+            attempt += 1
+
+        record0 = self.record(source, url, resp, start_time, attempt, 0 if stream else len(resp.content))
+        if stream:
+            # count bytes as the caller reads them, `content` also reads through iter_content
+            iter0 = resp.iter_content
+
+            def iter_counted(chunk_size=1, decode_unicode=False):
+                for chunk in iter0(chunk_size=chunk_size, decode_unicode=decode_unicode):
+                    record0['bytes'] += len(chunk)
+                    yield chunk
+            resp.iter_content = iter_counted
+        return resp
+
+    def record(self, source, url, resp, start_time, retries, nbytes):
+        """
+            Stores the statistics of a finished request.
+
+            Returns:
+                dictionary with source, url, status, latency (seconds of the last attempt up to the response
+                headers), elapsed (seconds including retries and waits), retries and bytes
+        """
+        record0 = {'source': source, 'url': url, 'status': None if resp is None else resp.status_code,
+                   'latency': None if resp is None else resp.elapsed.total_seconds(),
+                   'elapsed': time.time() - start_time, 'retries': retries, 'bytes': nbytes}
+        self.records.append(record0)
+        return record0
+
+    def report(self):
+        """
+            Summarises the recorded requests per source.
+
+            Returns:
+                Pandas dataframe with number of requests, retries, summed latency and elapsed seconds, and bytes
+        """
+        df0 = pd.DataFrame(self.records, columns=['source', 'url', 'status', 'latency', 'elapsed', 'retries',
+                                                  'bytes'])
+        report0 = df0.groupby('source', as_index=False).agg(requests=('url', 'count'), retries=('retries', 'sum'),
+                                                            latency=('latency', 'sum'), elapsed=('elapsed', 'sum'),
+                                                            bytes=('bytes', 'sum'))
+        report0['budget_used'] = report0['source'].map(self.spent).fillna(0)
+        return report0
+
+    def close(self):
+        self.session.close()
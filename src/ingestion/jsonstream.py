@@ -0,0 +1,199 @@
+import bz2
+import json
+import lzma
+import zlib
+import codecs
+import logging.config
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+DECODER = json.JSONDecoder()
+# streaming decompressors of the compressed variants of a file, by file extension
+CODECS = {'gz': lambda: zlib.decompressobj(wbits=zlib.MAX_WBITS | 16), 'bz2': bz2.BZ2Decompressor,
+          'xz': lzma.LZMADecompressor}
+
+
+class JSONStream:
+    def __init__(self, chunks):
+        """
+            Minimal event based JSON reader. Text is pulled from an iterator of chunks only when the value being
+            decoded needs it, so memory follows the size of a single value and not the size of the whole document.
+
+            Args:
+                chunks (iterable): bytes (utf-8) or string pieces of a JSON document, e.g. response.iter_content()
+        """
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """
+            Reads the next chunk into the buffer and drops the text that has already been consumed.
+
+            Returns:
+                False once the input is exhausted, True otherwise
+        """
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            self.buf += self.decoder.decode(b'', final=True)
+            return False
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+            Returns the next non-whitespace character without consuming it (empty string at the end of the input).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, char):
+        """
+            Consumes the next non-whitespace character and raises a ValueError if it is not `char`.
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected {0!r} but found {1!r} in JSON stream'.format(char, found))
+        self.pos += 1
+
+    def value(self):
+        """
+            Decodes one complete JSON value (object, array, string, number or literal) at the current position.
+
+            Returns:
+                The decoded Python object
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # value is cut off by the end of the buffer, read more and try again
+                if not self.more():
+                    raise
+                continue
+            # a number cut off by the end of the buffer decodes early (e.g. "56" out of "56.78"), so the value is
+            # only accepted once the character that follows it is also in the buffer
+            if not self.eof and (end == len(self.buf) or self.buf[end] not in DELIMITERS) and self.more():
+                continue
+            self.pos = end
+            return obj
+
+    def seek(self, path=()):
+        """
+            Moves to the value reached by following the object keys inside `path`, skipping sibling values.
+
+            Args:
+                path (tuple): object keys from the document root, e.g. ('data',)
+        """
+        for key in path:
+            self.expect('{')
+            while True:
+                if self.peek() == '}':
+                    raise KeyError('Key {} not found in JSON stream'.format(key))
+                name = self.value()
+                self.expect(':')
+                if name == key:
+                    break
+                self.value()
+                if self.peek() == ',':
+                    self.pos += 1
+
+
+def iter_array(chunks, path=()):
+    """
+        Generator yielding the elements of a JSON array one at a time.
+
+        Args:
+            chunks (iterable): bytes or string pieces of a JSON document
+            path (tuple): object keys leading to the array, empty if the document itself is the array
+
+        Returns:
+            Generator of decoded elements
+    """
+    stream = JSONStream(chunks)
+    stream.seek(path)
+    stream.expect('[')
+    if stream.peek() == ']':
+        return
+    while True:
+        yield stream.value()
+        sep = stream.peek()
+        stream.pos += 1
+        if sep == ']':
+            return
+        if sep != ',':
+            raise ValueError('Expected \',\' or \']\' but found {!r} in JSON array'.format(sep))
+
+
+def iter_object(chunks, path=()):
+    """
+        Generator yielding the members of a JSON object one at a time, so large mappings such as the `data` key of
+        MTGJSON files never have to be decoded as a whole.
+
+        Args:
+            chunks (iterable): bytes or string pieces of a JSON document
+            path (tuple): object keys leading to the object, empty if the document itself is the object
+
+        Returns:
+            Generator of (key, decoded value) tuples
+    """
+    stream = JSONStream(chunks)
+    stream.seek(path)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        yield key, stream.value()
+        sep = stream.peek()
+        stream.pos += 1
+        if sep == '}':
+            return
+        if sep != ',':
+            raise ValueError('Expected \',\' or \'}}\' but found {!r} in JSON object'.format(sep))
+
+
+def decompress(chunks, codec=None):
+    """
+        Decompresses a stream of compressed chunks as they arrive, so the inflated document is never held in memory
+        or written to disk as a whole.
+
+        Args:
+            chunks (iterable): bytes of a compressed file, e.g. response.iter_content()
+            codec (string): 'gz', 'bz2' or 'xz', chunks are passed through unchanged if None
+
+        Returns:
+            generator of decompressed bytes
+    """
+    if codec is None:
+        yield from chunks
+        return
+    dec0 = CODECS[codec]()
+    for chunk in chunks:
+        out0 = dec0.decompress(chunk)
+        if out0:
+            yield out0
+    if codec == 'gz':
+        out0 = dec0.flush()
+        if out0:
+            yield out0
@@ -0,0 +1,178 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import datetime
+import threading
+import logging.config
+
+
+try:
+    from src.ingestion import httpcache
+except ModuleNotFoundError:
+    import httpcache
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+# extensions of bodies that are already compressed and archived as they are
+COMPRESSED = ('.gz', '.bz2', '.xz')
+
+
+class SnapshotArchive:
+    def __init__(self, archivedir='data/snapshots', chunksize=1024 * 1024, keep=7, compresslevel=1):
+        """
+            Local archive of raw API downloads, one directory per calendar day (YYYY-MM-DD). Every body is stored
+            gzip compressed (bodies that are already compressed are stored as they are) and a manifest maps each
+            url to its file, so a day can be replayed through the same parsing code without any network access.
+            Bodies are stored once per sha256 digest in a shared `blobs` directory, so a payload that did not change
+            from one day to the next (e.g. revalidated by the download cache) takes no extra space, and is not read
+            again when its digest is already known.
+
+            Args:
+                archivedir (string): directory holding one sub directory per day
+                chunksize (int): bytes written to disk at a time
+                keep (int): number of most recent days kept, older days and the bodies only they use are removed
+                            when a new day is archived. Every day is kept if None
+                compresslevel (int): gzip level of the archived bodies, low levels trade size for speed
+        """
+        self.archivedir = archivedir
+        self.chunksize = chunksize
+        self.keep = keep
+        self.compresslevel = compresslevel
+        self.blobdir = os.path.join(archivedir, 'blobs')
+        self.lock = threading.Lock()
+
+    def daydir(self, date=None):
+        date = datetime.date.today().isoformat() if date is None else date
+        return os.path.join(self.archivedir, date)
+
+    def manifest(self, date=None):
+        """Returns the {url: file name} manifest of a day, empty if nothing was archived that day."""
+        path0 = os.path.join(self.daydir(date), 'manifest.json')
+        if not os.path.isfile(path0):
+            return {}
+        with open(path0, 'r') as f:
+            return json.load(f)
+
+    def dates(self):
+        """Returns the sorted days that have an archive."""
+        if not os.path.isdir(self.archivedir):
+            return []
+        return sorted(d for d in os.listdir(self.archivedir) if os.path.isfile(os.path.join(self.daydir(d),
+                                                                                             'manifest.json')))
+
+    def save(self, url, resp, date=None):
+        """
+            Archives the body of a response under `date` (YYYY-MM-DD), today by default. The body is only read when
+            its digest is unknown (a streamed response) or the archive does not hold it yet.
+
+            Args:
+                url (string): url the body was downloaded from
+                resp (object): requests.Response or httpcache.CachedResponse, closed after its body is archived
+
+            Returns:
+                `resp` itself if it is a httpcache.CachedResponse, its body is still on disk. Otherwise a
+                httpcache.CachedResponse reading the archived body
+        """
+        daydir = self.daydir(date)
+        newday = not os.path.isdir(daydir)
+        os.makedirs(daydir, exist_ok=True)
+        os.makedirs(self.blobdir, exist_ok=True)
+        compressed = url.endswith(COMPRESSED)
+        ext0 = '.' + url.rsplit('.', 1)[-1] if compressed else '.gz'
+        digest = getattr(resp, 'sha256', None)
+        tmp0 = None
+        if digest is None or not os.path.isfile(os.path.join(self.blobdir, digest + ext0)):
+            tmp0 = os.path.join(self.blobdir, '{0}.{1}.part'.format(os.getpid(), threading.get_ident()))
+            sha0 = hashlib.sha256() if digest is None else None
+            with (open(tmp0, 'wb') if compressed else gzip.open(tmp0, 'wb', compresslevel=self.compresslevel)) as f:
+                for chunk in resp.iter_content(chunk_size=self.chunksize):
+                    if sha0 is not None:
+                        sha0.update(chunk)
+                    f.write(chunk)
+            digest = digest or sha0.hexdigest()
+        resp.close()
+        name0 = digest + ext0
+        path0 = os.path.join(self.blobdir, name0)
+
+        with self.lock:
+            if tmp0 is not None and os.path.isfile(path0):
+                # same body as an earlier download
+                os.remove(tmp0)
+            elif tmp0 is not None:
+                os.replace(tmp0, path0)
+            manifest0 = self.manifest(date)
+            manifest0[url] = name0
+            with open(os.path.join(daydir, 'manifest.json.tmp'), 'w') as f:
+                json.dump(manifest0, f, indent=1)
+            os.replace(os.path.join(daydir, 'manifest.json.tmp'), os.path.join(daydir, 'manifest.json'))
+            if newday:
+                self.prune()
+        logger.debug('Archived {0} as {1}'.format(url, path0))
+        if isinstance(resp, httpcache.CachedResponse):
+            return resp
+        return httpcache.CachedResponse(path0, 200, fromcache=False, opener=open if compressed else gzip.open,
+                                        sha256=digest)
+
+    def prune(self):
+        """
+            Removes the days older than the `keep` most recent ones and the bodies no remaining day uses. Called
+            with the lock held.
+        """
+        if self.keep is None:
+            return
+        dates = self.dates()
+        # the day being archived is always kept
+        for d in dates[:-max(self.keep, 1)]:
+            shutil.rmtree(self.daydir(d), ignore_errors=True)
+            logger.info('Removed the archive of {} from {}'.format(d, self.archivedir))
+        used = {n for d in self.dates() for n in self.manifest(d).values()}
+        if os.path.isdir(self.blobdir):
+            for n in os.listdir(self.blobdir):
+                if n not in used and not n.endswith('.part'):
+                    os.remove(os.path.join(self.blobdir, n))
+
+    def open(self, url, date):
+        """
+            Returns the body of `url` archived on `date` (YYYY-MM-DD).
+
+            Returns:
+                httpcache.CachedResponse reading the archived body
+
+            Raises:
+                FileNotFoundError if the url was not archived that day
+        """
+        name0 = self.manifest(date).get(url)
+        if name0 is None:
+            raise FileNotFoundError('{0} was not archived on {1}, archived days: {2}'.format(url, date,
+                                                                                             self.dates()))
+        opener = open if url.endswith(COMPRESSED) else gzip.open
+        return httpcache.CachedResponse(os.path.join(self.blobdir, name0), 200, fromcache=True, opener=opener)
+
+    def save_dir(self, name, srcdir):
+        """
+            Copies the files of a local directory (e.g. the price history before it is updated) into today's archive.
+            Existing copies are kept so the archive holds the state from before the first run of the day.
+        """
+        dest0 = os.path.join(self.daydir(), name)
+        if os.path.isdir(srcdir) and not os.path.isdir(dest0):
+            shutil.copytree(srcdir, dest0)
+
+    def restore_dir(self, name, date, destdir):
+        """
+            Copies the files of a directory archived with save_dir on `date` into `destdir`.
+
+            Returns:
+                True if the directory was archived that day
+        """
+        src0 = os.path.join(self.daydir(date), name)
+        if not os.path.isdir(src0):
+            return False
+        os.makedirs(destdir, exist_ok=True)
+        # file by file, copytree into an existing directory needs Python 3.8
+        for n in os.listdir(src0):
+            shutil.copy2(os.path.join(src0, n), os.path.join(destdir, n))
+        return True
@@ -0,0 +1,88 @@
+import datetime
+import logging.config
+import pandas as pd
+
+try:
+    from src.ingestion import cleandata
+    from src.statistics import clustering, regression, pricestats
+    from src.utils import stagecache, dtypes
+except ModuleNotFoundError:
+    from ingestion import cleandata
+    from statistics import clustering, regression, pricestats
+    from utils import stagecache, dtypes
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+def clean(scryfall, mtgjson, **kwargs):
+    # the three Clean outputs, computed on one object so they share the merge
+    cclean = cleandata.Clean(scryfall, mtgjson, **kwargs)
+    return {'merge_raw': cclean.merge_all(), 'for_gee': cclean.for_gee(), 'for_kmeans': cclean.for_kmeans()}
+
+
+def kmeans(for_kmeans, **kwargs):
+    kcenter, clusters, score = clustering.run_kmeans(for_kmeans, **kwargs)
+    return {'centers': kcenter, 'clusters': clusters, 'score': score}
+
+
+def reg(data, modeltype='gee', **kwargs):
+    result, model = regression.run_reg(data, modeltype=modeltype, **kwargs)
+    return {'result': result, 'model': model}
+
+
+def cards(for_kmeans):
+    # all unique card names
+    return pd.DataFrame(list(set(for_kmeans['name'].values.tolist())), columns=['cardname'])
+
+
+def insert_all(chsql, replace=True, **tables):
+    for name, df in tables.items():
+        chsql.insert_df(df, name=name, replace=replace)
+
+
+def refresh(yaml0, scryfall, mtgjson, cache=None, chsql=None, replace=True, force=None):
+    """
+        Stages of a refresh (run.py s3rds / fgoogle / replay and the /refresh page) as a cached pipeline: cleaning,
+        k-means, GEE, OLS, the card names and, if `chsql` is given, the database writes. A stage is only run when its
+        raw data, its section of plebmtg.yaml or the code it runs changed since it was cached.
+
+        Args:
+            yaml0 (dict): contents of plebmtg.yaml
+            scryfall (obj): Pandas dataframe of raw scryfall data
+            mtgjson (obj): Pandas dataframe of raw mtgjson prices
+            cache (obj): stagecache.StageCache, nothing is cached if None
+            chsql (obj): tomysql.MysqlAll the results are written with, no database stage if None
+            replace (bool): whether to replace the existing tables
+            force (bool or list): stages to run even if cached, True for all of them
+
+        Returns:
+            stagecache.Pipeline with the stages added, call run() on it
+    """
+    cleankw = dict(yaml0['get_data']['merge_all'])
+    if cleankw.get('refdate') is None:
+        # card ages depend on the day, pin it so the key does too
+        cleankw['refdate'] = datetime.date.today()
+    kmkw = yaml0['clustering']['run_kmeans']
+    regkw = yaml0['regression']['run_reg']
+
+    pipe = stagecache.Pipeline(cache, inputs={'scryfall': scryfall, 'mtgjson': mtgjson}, force=force)
+    pipe.stage('clean', lambda **kw: clean(**kw, **cleankw), deps={'scryfall': 'scryfall', 'mtgjson': 'mtgjson'},
+               config={'merge_all': cleankw, 'dtypes': yaml0.get('dtypes')}, code=[cleandata, pricestats, dtypes])
+    pipe.stage('kmeans', lambda for_kmeans: kmeans(for_kmeans, **kmkw), deps={'for_kmeans': 'clean.for_kmeans'},
+               config=kmkw, code=[clustering])
+    pipe.stage('gee', lambda data: reg(data, modeltype='gee', **regkw), deps={'data': 'clean.for_gee'},
+               config=regkw, code=[regression])
+    pipe.stage('ols', lambda data: reg(data, modeltype='linear', **regkw), deps={'data': 'clean.for_kmeans'},
+               config=regkw, code=[regression])
+    pipe.stage('cards', cards, deps={'for_kmeans': 'clean.for_kmeans'}, code=[cards])
+    if chsql is not None:
+        # the password is left out, changing it does not change the tables
+        target = {'connstring': chsql.connstring, 'user': chsql.u, 'db': chsql.db, 'schema': chsql.sche,
+                  'replace': replace}
+        pipe.stage('database', lambda **tables: insert_all(chsql, replace=replace, **tables),
+                   deps={'cluster_result': 'kmeans.clusters', 'gee_result': 'gee.result', 'ols_result': 'ols.result',
+                         'merge_raw': 'clean.merge_raw', 'cards': 'cards'},
+                   config=target, code=[insert_all, type(chsql)], stored=False)
+    return pipe
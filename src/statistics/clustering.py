@@ -9,8 +9,10 @@ from sklearn.metrics.pairwise import euclidean_distances
 
 try:
     from src.statistics import scaling
+    from src.utils import profiling
 except ModuleNotFoundError:
     import scaling
+    from utils import profiling
 
 
 logger = logging.getLogger(__name__)
@@ -135,6 +137,7 @@ def clusterscore(data, label, method='silhouette', tolog=False):
     return score
 
 
+@profiling.track()
 def run_kmeans(df, method='silhouette', noplot=True):
     """
         Ensemble function that runs all K-means clustering related functions
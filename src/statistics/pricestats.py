@@ -0,0 +1,82 @@
+import warnings
+import numpy as np
+
+
+# summary statistics summarize() can compute
+FEATURES = ['count', 'max', 'min', 'mean', 'std', 'first', 'last', 'pct_change', 'slope']
+
+
+def edge(arr, valid, last=True):
+    """
+        Args:
+            arr (array): 2d array of prices
+            valid (array): boolean array of the prices that are not missing
+            last (bool): whether to take the last or the first non missing price
+
+        Returns:
+            1d array with the last (or first) non missing price of every row, NaN for rows without any
+    """
+    if not arr.shape[1]:
+        return np.full(arr.shape[0], np.nan)
+    pos = arr.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1) if last else np.argmax(valid, axis=1)
+    return np.where(valid.any(axis=1), arr[np.arange(arr.shape[0]), pos], np.nan)
+
+
+def summarize(arr, features=('max', 'min', 'mean'), days=None):
+    """
+        Summary statistics of every row of a price block (one row per card, one column per day in time order),
+        ignoring missing prices. All statistics are computed on the array itself, so no long format is needed.
+
+        Args:
+            arr (array): 2d array of prices, NaN when missing
+            features (list): statistics to compute, any of FEATURES. std is the sample standard deviation,
+                             pct_change the change from the first non zero to the last price relative to it and slope
+                             the least squares change of the price per day
+            days (array): day number of every column used for the slope, 0, 1, 2... by default
+
+        Returns:
+            dictionary of {feature: 1d array}. count, max, min, first and last keep the dtype of the prices. Every
+            statistic but count is NaN for rows without any price, std, pct_change and slope are 0 for rows with a
+            single price and pct_change is 0 for rows whose prices are all 0
+    """
+    unknown = [f for f in features if f not in FEATURES]
+    if unknown:
+        raise ValueError('Unknown price features {0}, choose from {1}'.format(unknown, FEATURES))
+    arr = np.asarray(arr)
+    valid = ~np.isnan(arr)
+    count = valid.sum(axis=1)
+    some = count > 0
+    x = np.arange(arr.shape[1], dtype=np.float64) if days is None else np.asarray(days, dtype=np.float64)
+    res0 = {}
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        # rows without any price give NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for f in features:
+            if f == 'count':
+                res0[f] = count
+            elif not arr.shape[1]:
+                res0[f] = np.full(arr.shape[0], np.nan)
+            elif f == 'max':
+                res0[f] = np.nanmax(arr, axis=1)
+            elif f == 'min':
+                res0[f] = np.nanmin(arr, axis=1)
+            elif f == 'mean':
+                res0[f] = np.nanmean(arr, axis=1, dtype=np.float64)
+            elif f == 'std':
+                std0 = np.nanstd(arr, axis=1, ddof=1, dtype=np.float64)
+                res0[f] = np.where(count > 1, std0, np.where(some, 0, np.nan))
+            elif f in ['first', 'last']:
+                res0[f] = edge(arr, valid, last=f == 'last').astype(arr.dtype)
+            elif f == 'pct_change':
+                # measured from the first non zero price so a card listed at 0 still gets a finite change
+                first, last = edge(arr, valid & (arr != 0), last=False), edge(arr, valid)
+                change = (last.astype(np.float64) - first) / first
+                res0[f] = np.where(np.isnan(first), np.where(some, 0, np.nan), change)
+            elif f == 'slope':
+                xv = np.where(valid, x, 0)
+                yv = np.where(valid, arr, 0).astype(np.float64)
+                sx, sy = xv.sum(axis=1), yv.sum(axis=1)
+                sxx, sxy = (xv * xv).sum(axis=1), (xv * yv).sum(axis=1)
+                den = count * sxx - sx * sx
+                res0[f] = np.where(den > 0, (count * sxy - sx * sy) / den, np.where(some, 0, np.nan))
+    return res0
@@ -9,8 +9,10 @@ from tabulate import tabulate
 
 try:
     from src.statistics import scaling
+    from src.utils import profiling
 except ModuleNotFoundError:
     import scaling
+    from utils import profiling
 
 
 logger = logging.getLogger(__name__)
@@ -153,6 +155,7 @@ def gee(data, formula, groupvar, family='gaussian', toprint=True):
     return res, conf.reset_index(drop=True)
 
 
+@profiling.track()
 def run_reg(df, modeltype='gee', groupvar='scryfallId', family='gaussian', scale=False):
     """
         Ensemble function that can be used to run either GEE or OLS
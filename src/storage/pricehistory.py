@@ -0,0 +1,155 @@
+import os
+import logging.config
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+
+try:
+    from src.storage import pricestore
+except ModuleNotFoundError:
+    from storage import pricestore
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+class PriceHistory:
+    def __init__(self, historydir='data/prices', window=90):
+        """
+            Local history of daily non-foil paper prices, used to ingest MTGJSON prices incrementally. Buylist (buy)
+            and retail (sell) prices are kept as two uuid x date dataframes together with the price provider of each
+            uuid, so that daily price files can be appended and days outside the window expired.
+
+            Args:
+                historydir (string): directory where the history is saved
+                window (int): number of days kept in the history
+        """
+        self.historydir = historydir
+        self.window = window
+        self.buy = pd.DataFrame(dtype=float)
+        self.sell = pd.DataFrame(dtype=float)
+        self.provider = pd.Series(dtype=object)
+
+    def load(self):
+        """
+            Reads the saved history if there is one. Prices are saved as a PriceStore (memory mapped float32 .npy
+            matrix) with the provider of each card next to it.
+
+            Returns:
+                the PriceHistory object itself
+        """
+        provpath = os.path.join(self.historydir, 'providers.npy')
+        if pricestore.PriceStore.exists(self.historydir) and os.path.isfile(provpath):
+            store0 = pricestore.PriceStore.load(self.historydir)
+            self.buy = store0.frame('buy').astype(float).rename_axis(None)
+            self.sell = store0.frame('sell').astype(float).rename_axis(None)
+            self.provider = pd.Series(np.load(provpath), index=self.buy.index, dtype=object)
+            logger.info('Loaded price history with {0} cards up to {1}'.format(len(self.provider), self.lastdate()))
+        return self
+
+    def store(self):
+        """Returns the history as a PriceStore with the cards in the order of `provider`."""
+        return pricestore.PriceStore.from_frames(self.buy.reindex(self.provider.index),
+                                                 self.sell.reindex(self.provider.index))
+
+    def save(self):
+        store0 = self.store()
+        store0.save(self.historydir)
+        provpath = os.path.join(self.historydir, 'providers.npy')
+        with open(provpath + '.tmp', 'wb') as f:
+            np.save(f, self.provider.reindex(store0.uuids).to_numpy(dtype=str))
+        os.replace(provpath + '.tmp', provpath)
+        logger.info('Saved price history with {0} cards up to {1}'.format(len(self.provider), self.lastdate()))
+        return store0
+
+    def lastdate(self):
+        """Returns the most recent date (YYYY-MM-DD) in the history, None if the history is empty."""
+        dates = self.buy.columns.tolist() + self.sell.columns.tolist()
+        return max(dates) if dates else None
+
+    def gap(self, dates):
+        """
+            Checks whether `dates` can be appended without leaving missing days.
+
+            Args:
+                dates (list): dates (YYYY-MM-DD) of a daily price file
+
+            Returns:
+                True if the history is empty or the first new date is more than one day after its last date
+        """
+        last0 = self.lastdate()
+        if last0 is None or not dates:
+            return True
+        nextday = (datetime.strptime(last0, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        return min(dates) > nextday
+
+    def frames(self, entries):
+        """
+            Turns pruned MTGJSON price entries into buy and sell dataframes. The provider already recorded for a uuid
+            is used again, new uuids use the first provider of their entry (like the full price file ingestion).
+
+            Args:
+                entries (list): (uuid, {provider: {'buylist'/'retail': {'normal': {date: price}}}}) tuples
+
+            Returns:
+                buy dataframe, sell dataframe, provider Series
+        """
+        buy0, sell0, prov0 = {}, {}, {}
+        for uuid, paper in entries:
+            if not paper:
+                continue
+            src = self.provider.get(uuid)
+            src = src if src in paper else list(paper.keys())[0]
+            prov0[uuid] = src
+            buy0[uuid] = paper[src].get('buylist', {}).get('normal', {})
+            sell0[uuid] = paper[src].get('retail', {}).get('normal', {})
+        return (pd.DataFrame.from_dict(buy0, orient='index', dtype=float),
+                pd.DataFrame.from_dict(sell0, orient='index', dtype=float), pd.Series(prov0, dtype=object))
+
+    def dates(self, entries):
+        """Returns the sorted dates found in pruned MTGJSON price entries."""
+        buy0, sell0, prov0 = self.frames(entries)
+        return sorted(set(buy0.columns.tolist() + sell0.columns.tolist()))
+
+    def new(self, entries):
+        """Returns the uuids of pruned MTGJSON price entries with prices that are not in the history yet."""
+        return {uuid for uuid, paper in entries if paper} - set(self.provider.index)
+
+    def replace(self, entries):
+        """Rebuilds the whole history from the entries of the full price file."""
+        self.provider = pd.Series(dtype=object)
+        self.buy, self.sell, self.provider = self.frames(entries)
+        self.sort()
+
+    def update(self, entries):
+        """
+            Appends the entries of a daily price file. Prices of dates already in the history are overwritten.
+        """
+        buy0, sell0, prov0 = self.frames(entries)
+        self.buy = buy0.combine_first(self.buy)
+        self.sell = sell0.combine_first(self.sell)
+        self.provider = prov0.combine_first(self.provider)
+        self.sort()
+
+    def sort(self):
+        self.buy = self.buy[sorted(self.buy.columns)]
+        self.sell = self.sell[sorted(self.sell.columns)]
+
+    def expire(self):
+        """
+            Drops the days that are older than the window (counted back from the most recent date) and the cards that
+            have no prices left.
+        """
+        last0 = self.lastdate()
+        if last0 is None:
+            return
+        first0 = (datetime.strptime(last0, '%Y-%m-%d') - timedelta(days=self.window - 1)).strftime('%Y-%m-%d')
+        self.buy = self.buy[[c for c in self.buy.columns if c >= first0]].dropna(how='all')
+        self.sell = self.sell[[c for c in self.sell.columns if c >= first0]].dropna(how='all')
+        self.provider = self.provider[self.provider.index.isin(self.buy.index.union(self.sell.index))]
+
+    def complete(self):
+        """Returns the uuids that have both buy and sell prices inside the window."""
+        return self.buy.index.intersection(self.sell.index)
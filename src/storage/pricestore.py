@@ -0,0 +1,148 @@
+import os
+import logging.config
+import numpy as np
+import pandas as pd
+
+try:
+    from src.statistics import pricestats
+except ModuleNotFoundError:
+    from statistics import pricestats
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+# price planes of the matrix
+PLANES = ['buy', 'sell']
+
+
+class PriceStore:
+    def __init__(self, prices, uuids, dates):
+        """
+            Compact card x day price matrix. Buylist (buy) and retail (sell) prices are held in one float32 array of
+            shape (2, number of cards, number of days) with a uuid index for the rows and a sorted date axis
+            (YYYY-MM-DD) for the columns. Saved stores are opened with memory mapping, so accessors only read the
+            parts of the history they need.
+
+            Args:
+                prices (array): float32 array (plane, card, day), missing prices are NaN
+                uuids (array): uuid of each card row
+                dates (array): sorted dates of the day columns
+        """
+        self.prices = prices
+        self.uuids = np.asarray(uuids, dtype=str)
+        self.dates = np.asarray(dates, dtype=str)
+        self.rows = pd.Index(self.uuids)
+
+    @classmethod
+    def from_frames(cls, buy, sell):
+        """
+            Builds a store from uuid x date dataframes of buy and sell prices. Cards and dates of both dataframes are
+            combined (cards in the order of `buy`), prices missing from either one are NaN.
+
+            Args:
+                buy (dataframe): buy prices with uuids as index and dates as columns
+                sell (dataframe): sell prices with uuids as index and dates as columns
+
+            Returns:
+                PriceStore object
+        """
+        uuids = buy.index.append(sell.index.difference(buy.index))
+        dates = sorted(set(buy.columns.tolist() + sell.columns.tolist()))
+        prices = np.stack([f.reindex(index=uuids, columns=dates).to_numpy(dtype=np.float32) for f in [buy, sell]])
+        return cls(prices.reshape(2, len(uuids), len(dates)), uuids.tolist(), dates)
+
+    @staticmethod
+    def paths(storedir):
+        return [os.path.join(storedir, f) for f in ['prices.npy', 'uuids.npy', 'dates.npy']]
+
+    @classmethod
+    def exists(cls, storedir):
+        return all(os.path.isfile(p) for p in cls.paths(storedir))
+
+    @classmethod
+    def load(cls, storedir, mmap=True):
+        """
+            Opens a saved store.
+
+            Args:
+                storedir (string): directory the store was saved in
+                mmap (bool): whether to memory map the price matrix (read only) instead of reading it into memory
+
+            Returns:
+                PriceStore object
+        """
+        pricepath, uuidpath, datepath = cls.paths(storedir)
+        prices = np.load(pricepath, mmap_mode='r' if mmap else None)
+        return cls(prices, np.load(uuidpath), np.load(datepath))
+
+    def save(self, storedir):
+        """Saves the price matrix, uuid index and date axis as .npy files in `storedir`."""
+        os.makedirs(storedir, exist_ok=True)
+        pricepath, uuidpath, datepath = self.paths(storedir)
+        # write next to the target and rename, a store opened with memory mapping may still be reading the old file
+        for path, arr in [(pricepath, self.prices), (uuidpath, self.uuids), (datepath, self.dates)]:
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, np.asarray(arr))
+            os.replace(path + '.tmp', path)
+        logger.info('Saved price store of {0} cards x {1} days to {2}'.format(len(self.uuids), len(self.dates),
+                                                                            storedir))
+
+    @property
+    def shape(self):
+        return self.prices.shape
+
+    def window(self, start=None, end=None):
+        """
+            Returns the days between `start` and `end` (both included, YYYY-MM-DD) as a new store. The price matrix
+            is sliced, not copied.
+        """
+        lo = 0 if start is None else np.searchsorted(self.dates, start, side='left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, end, side='right')
+        return PriceStore(self.prices[:, :, lo:hi], self.uuids, self.dates[lo:hi])
+
+    def last(self, ndays):
+        """Returns the last `ndays` days as a new store."""
+        return PriceStore(self.prices[:, :, max(len(self.dates) - ndays, 0):], self.uuids,
+                          self.dates[max(len(self.dates) - ndays, 0):])
+
+    def subset(self, uuids):
+        """
+            Returns the cards in `uuids` (in that order) as a new store, uuids that are not in the store are dropped.
+        """
+        pos = self.rows.get_indexer(pd.Index(uuids))
+        pos = pos[pos >= 0]
+        return PriceStore(self.prices[:, pos, :], self.uuids[pos], self.dates)
+
+    def plane(self, name):
+        """Returns the (card, day) array of the 'buy' or 'sell' plane."""
+        return self.prices[PLANES.index(name)]
+
+    def frame(self, name, prefix=''):
+        """
+            Returns one price plane as a uuid x date dataframe.
+
+            Args:
+                name (string): 'buy' or 'sell'
+                prefix (string): prefix added to the date column names, e.g. 'p_'
+
+            Returns:
+                Pandas dataframe
+        """
+        return pd.DataFrame(np.asarray(self.plane(name)), index=pd.Index(self.uuids, name='uuid'),
+                            columns=[prefix + d for d in self.dates])
+
+    def stats(self):
+        """
+            Summary statistics of every card over the days of the store, ignoring missing prices.
+
+            Returns:
+                Pandas dataframe indexed by uuid with count, mean, std, min, max and last (most recent price) columns
+                for each plane, e.g. 'buy_mean'
+        """
+        stats0 = {}
+        for name in PLANES:
+            arr0 = np.asarray(self.plane(name), dtype=np.float32)
+            res0 = pricestats.summarize(arr0, ['count', 'mean', 'std', 'min', 'max', 'last'])
+            stats0.update({name + '_' + k: v for k, v in res0.items()})
+        return pd.DataFrame(stats0, index=pd.Index(self.uuids, name='uuid'))
@@ -7,10 +7,17 @@ import boto3
 from botocore.exceptions import ParamValidationError, ClientError
 
 
+try:
+    from src.utils import profiling
+except ModuleNotFoundError:
+    from utils import profiling
+
+
 logger = logging.getLogger(__name__)
 logger.setLevel("INFO")
 
 
+@profiling.track()
 def to_s3(df, customname='raw_data1', bucket="2021-msia423-ke-chenghao",
           aws_access_key_id='', aws_secret_access_key=''):
     """
@@ -1,14 +1,13 @@
 import logging.config
 import time
 import sqlalchemy
-import mysql.connector
 import pandas as pd
 
 
 try:
-    from src.utils import minifuncs as minif
+    from src.utils import minifuncs as minif, profiling
 except ModuleNotFoundError:
-    from utils import minifuncs as minif
+    from utils import minifuncs as minif, profiling
 
 
 logger = logging.getLogger(__name__)
@@ -65,7 +64,8 @@ class MysqlAll:
             user = self.u
             pwd = self.p
             if want in ['cursor', 'conn', 'c']:
-                # connect to mysql
+                # connect to mysql, imported here so SQLite works without mysql-connector-python
+                import mysql.connector
                 conn = mysql.connector.connect(host="nw-msia423-ch.cpmox8xcm0d8.us-east-2.rds.amazonaws.com",
                                                user=user, password=pwd, database=self.db, port=self.port)
                 logging.info('Connection cursor object has been created using mysql connector')
@@ -102,6 +102,7 @@ class MysqlAll:
         cursor.execute(createsql)
         cursor.commit()
 
+    @profiling.track('insert_df')
     def insert_df(self, df, name='raw_table', replace=False, tojson=False):
         """
             Function to insert an entire dataframe into a database
@@ -127,8 +128,6 @@ class MysqlAll:
             else:
                 df.to_sql(name, con=eng1, schema=self.sche, if_exists='append', index=False)
 
-        print("Insertion ran for: {0} seconds ({1} mins)".format(str(round(time.time() - start_time, 2)),
-                                                                 str(round((time.time() - start_time) / 60))))
         logging.info('Table {0} has been created under schema {1} with replace as {2}. Ran for {3} seconds'
                      ''.format(name, self.sche, replace, round(time.time() - start_time, 2)))
 
@@ -0,0 +1,113 @@
+import re
+import logging.config
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+class DtypePolicy:
+    def __init__(self, enabled=False, indicator='uint8', price='float32', prices=r'^(pd[0-9]+|p_.+)$',
+                 categories=('rarity', 'set', 'set_name', 'set_type', 'layout', 'border_color', 'frame', 'lang',
+                             'image_status', 'pricetype', 'minday', 'maxday'), maxunique=0.5, report=True):
+        """
+            Central downcasting step applied to the frames handed from one pipeline stage to the next. Integer 0/1
+            indicator columns become `indicator`, daily price columns become `price` and repeated strings become
+            categoricals. Boolean columns are left as they are (they already take one byte per value).
+
+            Args:
+                enabled (bool): whether frames are downcast at all, configured from plebmtg.yaml
+                indicator (string): dtype of integer columns that only hold 0 and 1, e.g. 'uint8'
+                price (string): dtype of the price columns, e.g. 'float32'
+                prices (string): regex matching the names of the price columns
+                categories (list): string columns stored as categoricals
+                maxunique (float): categoricals are only used when the share of distinct values is at most this
+                report (bool): whether to measure the memory of every frame before and after downcasting
+        """
+        self.enabled = enabled
+        self.indicator = indicator
+        self.price = price
+        self.prices = prices
+        self.categories = list(categories)
+        self.maxunique = maxunique
+        self.report = report
+        self.reports = []
+
+    def configure(self, **kwargs):
+        """Changes the settings of the policy, e.g. from the `dtypes` section of plebmtg.yaml."""
+        for k, v in kwargs.items():
+            if not hasattr(self, k) or k == 'reports':
+                raise TypeError('Unknown dtype policy setting {}'.format(k))
+            setattr(self, k, list(v) if k == 'categories' else v)
+        return self
+
+    def casts(self, df):
+        """
+            Returns:
+                dictionary of {column: new dtype} for the columns of `df` that can be downcast
+        """
+        casts = {}
+        ints = [c for c, t in df.dtypes.items() if pd.api.types.is_integer_dtype(t)
+                and not isinstance(t, pd.SparseDtype) and t != np.dtype(self.indicator)]
+        if ints:
+            flags = df[ints].isin([0, 1]).all()
+            casts.update({c: self.indicator for c in flags[flags].index})
+
+        regex = re.compile(self.prices)
+        casts.update({c: self.price for c, t in df.dtypes.items() if isinstance(c, str) and regex.match(c)
+                      and pd.api.types.is_float_dtype(t) and t != np.dtype(self.price)})
+
+        for c in self.categories:
+            if c in df.columns and df[c].dtype == object and len(df) and \
+                    df[c].nunique() <= self.maxunique * len(df):
+                casts[c] = 'category'
+        return casts
+
+    def apply(self, df, name=''):
+        """
+            Downcasts a frame if the policy is enabled.
+
+            Args:
+                df (dataframe): frame handed to the next stage
+                name (string): stage name used in the memory report
+
+            Returns:
+                Pandas dataframe (`df` itself when the policy is disabled or nothing can be downcast)
+        """
+        if not self.enabled:
+            return df
+        casts = self.casts(df)
+        before = df.memory_usage(deep=True).sum() if self.report else None
+        df1 = df.astype(casts) if casts else df
+        if self.report:
+            after = df1.memory_usage(deep=True).sum()
+            self.reports.append({'frame': name, 'rows': len(df1), 'columns': df1.shape[1], 'downcast': len(casts),
+                                 'before_mb': before / 1024 ** 2, 'after_mb': after / 1024 ** 2,
+                                 'saved_pct': 100 * (1 - after / before) if before else 0.0})
+            logger.info('Downcast {0} columns of {1}: {2} MB -> {3} MB'.format(len(casts), name,
+                                                                               round(before / 1024 ** 2, 2),
+                                                                               round(after / 1024 ** 2, 2)))
+        return df1
+
+    def summary(self):
+        """
+            Returns:
+                Pandas dataframe with the memory of every downcast frame before and after, in MB
+        """
+        return pd.DataFrame(self.reports, columns=['frame', 'rows', 'columns', 'downcast', 'before_mb', 'after_mb',
+                                                   'saved_pct'])
+
+    def table(self):
+        """Returns the summary as a printable table."""
+        return tabulate(self.summary().round(3), headers='keys', tablefmt='psql', showindex=False)
+
+    def reset(self):
+        self.reports = []
+
+
+# policy shared by the whole pipeline, disabled until configured
+POLICY = DtypePolicy()
+downcast = POLICY.apply
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import tracemalloc
+import logging.config
+import pandas as pd
+from tabulate import tabulate
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+def rss():
+    """Returns the current resident set size of the process in bytes (peak so far where it is not available)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def reset_peak():
+    """
+        Resets the tracemalloc peak to the memory traced now. tracemalloc.reset_peak needs Python 3.9, with older
+        versions nothing is reset and stages report the peak reached since tracing started.
+    """
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+class Profiler:
+    def __init__(self, trace=False, interval=0.05, outfile=None):
+        """
+            Records wall time, CPU time, peak resident memory (RSS) and, optionally, the tracemalloc peak of each
+            pipeline stage. Stages are timed with the `stage` context manager or the `track` decorator and can be
+            nested. Every finished stage is logged as one JSON record.
+
+            Note that CPU time and memory are measured for the whole process, so stages running at the same time in
+            different threads (e.g. inside MTGAPI.ingest_all) see each other's usage.
+
+            Args:
+                trace (bool): whether to trace Python allocations with tracemalloc (slows allocation heavy code down).
+                              Before Python 3.9 the traced peak of a stage can include the peaks of earlier stages
+                interval (float): seconds between RSS samples while a stage is running
+                outfile (string): JSON lines file every record is appended to, records are only kept in memory if None
+        """
+        self.trace = trace
+        self.interval = interval
+        self.outfile = outfile
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.active = []
+        self.sampler = None
+
+    def configure(self, trace=None, interval=None, outfile=None):
+        """Changes the settings of the profiler, e.g. from the `profiling` section of plebmtg.yaml."""
+        self.trace = self.trace if trace is None else trace
+        self.interval = self.interval if interval is None else interval
+        self.outfile = self.outfile if outfile is None else outfile
+        return self
+
+    def sample(self):
+        # background thread updating the RSS peak of every running stage
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                rss0 = rss()
+                for s in self.active:
+                    s['rss_peak'] = max(s['rss_peak'], rss0)
+            time.sleep(self.interval)
+
+    def start(self, name, meta):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        state = {'name': name, 'meta': meta, 'parent': stack[-1]['name'] if stack else None, 'time': time.time(),
+                 'wall': time.perf_counter(), 'cpu': time.process_time(), 'rss_start': rss(), 'traced': None,
+                 'traced_peak': 0}
+        state['rss_peak'] = state['rss_start']
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak reached by the enclosing stage so far is handed to it before the peak is reset
+            if stack:
+                stack[-1]['traced_peak'] = max(stack[-1]['traced_peak'], peak)
+            reset_peak()
+            state['traced'] = current
+        stack.append(state)
+        with self.lock:
+            self.active.append(state)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, daemon=True)
+                self.sampler.start()
+        return state
+
+    def stop(self, state, error=None):
+        stack = self.local.stack
+        stack[:] = [s for s in stack if s is not state]
+        with self.lock:
+            self.active = [s for s in self.active if s is not state]
+        rss0 = rss()
+        record0 = {'stage': state['name'], 'parent': state['parent'], 'start': state['time'],
+                   'wall': time.perf_counter() - state['wall'], 'cpu': time.process_time() - state['cpu'],
+                   'rss_start': state['rss_start'], 'rss_end': rss0, 'rss_peak': max(state['rss_peak'], rss0),
+                   'traced_peak': None, 'thread': threading.current_thread().name, 'error': error}
+        if state['traced'] is not None and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], state['traced_peak'])
+            # allocations above what was already allocated when the stage started
+            record0['traced_peak'] = peak - state['traced']
+            if stack:
+                stack[-1]['traced_peak'] = max(stack[-1]['traced_peak'], peak)
+            reset_peak()
+            if not any(s['traced'] is not None for s in self.active):
+                tracemalloc.stop()
+        record0.update(state['meta'])
+        with self.lock:
+            self.records.append(record0)
+            if self.outfile:
+                os.makedirs(os.path.dirname(self.outfile) or '.', exist_ok=True)
+                with open(self.outfile, 'a') as f:
+                    f.write(json.dumps(record0, default=str) + '\n')
+        logger.info(json.dumps(record0, default=str))
+        return record0
+
+    def stage(self, name, **meta):
+        """
+            Context manager timing the code inside it as stage `name`.
+
+            Args:
+                name (string): stage name, e.g. 'scryfall_api'
+                meta: additional fields stored with the record (e.g. number of rows)
+
+            Returns:
+                context manager
+        """
+        return Stage(self, name, meta)
+
+    def track(self, name=None):
+        """
+            Decorator timing every call of a function as one stage, named after the function by default.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__qualname__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+            Summarises the records per stage.
+
+            Returns:
+                Pandas dataframe with the number of calls, summed wall and CPU seconds and the largest RSS and
+                tracemalloc peaks in MB, in the order the stages first finished
+        """
+        df0 = pd.DataFrame(self.records, columns=['stage', 'wall', 'cpu', 'rss_peak', 'traced_peak'])
+        sum0 = df0.groupby('stage', sort=False).agg(calls=('wall', 'count'), wall=('wall', 'sum'),
+                                                    cpu=('cpu', 'sum'), rss_peak_mb=('rss_peak', 'max'),
+                                                    traced_peak_mb=('traced_peak', 'max')).reset_index()
+        sum0['rss_peak_mb'] = sum0['rss_peak_mb'] / 1024 ** 2
+        sum0['traced_peak_mb'] = sum0['traced_peak_mb'].astype(float) / 1024 ** 2
+        return sum0
+
+    def table(self):
+        """Returns the summary as a printable table."""
+        return tabulate(self.summary().round(3), headers='keys', tablefmt='psql', showindex=False)
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+
+
+class Stage:
+    def __init__(self, profiler, name, meta):
+        self.profiler = profiler
+        self.name = name
+        self.meta = meta
+        self.state = None
+        self.record = None
+
+    def __enter__(self):
+        self.state = self.profiler.start(self.name, self.meta)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record = self.profiler.stop(self.state, error=None if exc is None else repr(exc))
+        return False
+
+
+# profiler shared by the whole pipeline
+PROFILER = Profiler()
+stage = PROFILER.stage
+track = PROFILER.track
@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import shutil
+import inspect
+import hashlib
+import threading
+import logging.config
+import joblib
+import pandas as pd
+from tabulate import tabulate
+
+try:
+    from src.utils import profiling
+except ModuleNotFoundError:
+    from utils import profiling
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel("INFO")
+
+
+def digest(h, obj):
+    """
+        Feeds the content of `obj` into the hash object `h`. Frames are hashed column by column from their names,
+        dtypes, index and values, dictionaries, lists and scalars from their JSON.
+    """
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame()
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'frame')
+        h.update(json.dumps([[str(c), str(t)] for c, t in obj.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(obj.index).values.tobytes())
+        for i in range(obj.shape[1]):
+            col = obj.iloc[:, i]
+            try:
+                h.update(pd.util.hash_pandas_object(col, index=False).values.tobytes())
+            except TypeError:
+                # cells holding lists or dictionaries
+                h.update(pd.util.hash_pandas_object(col.astype(str), index=False).values.tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for k in sorted(obj, key=str):
+            digest(h, str(k))
+            digest(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update('list{}'.format(len(obj)).encode())
+        for o in obj:
+            digest(h, o)
+    else:
+        h.update(json.dumps(obj, sort_keys=True, default=str).encode())
+
+
+def fingerprint(*objs):
+    """
+        Args:
+            objs: frames, dictionaries, lists or scalars, e.g. the raw data and a section of plebmtg.yaml
+
+        Returns:
+            hex string that only changes when the content of `objs` changes
+    """
+    h = hashlib.sha256()
+    digest(h, list(objs))
+    return h.hexdigest()
+
+
+def code_version(*objs):
+    """
+        Args:
+            objs: modules (or functions and classes, standing for the module they are defined in)
+
+        Returns:
+            hex string of the source files of the modules, changes whenever one of them is edited
+    """
+    h = hashlib.sha256()
+    mods = {inspect.getmodule(o) if not inspect.ismodule(o) else o for o in objs}
+    for mod in sorted(mods, key=lambda m: m.__name__):
+        h.update(mod.__name__.encode())
+        with open(inspect.getsourcefile(mod), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class StageCache:
+    def __init__(self, cachedir='data/stagecache', keep=3):
+        """
+            Stage outputs on disk, one directory per stage and key. Frames are stored as Parquet where an engine is
+            installed and the frame converts, everything else (and frames that do not) with joblib. Dictionaries
+            are stored entry by entry so single entries can be read back on their own.
+
+            Args:
+                cachedir (string): directory of the cache
+                keep (int): entries kept per stage, the least recently written are removed
+        """
+        self.cachedir = cachedir
+        self.keep = keep
+
+    def path(self, stage, key):
+        return os.path.join(self.cachedir, stage, key)
+
+    def has(self, stage, key):
+        return os.path.isfile(os.path.join(self.path(stage, key), 'manifest.json'))
+
+    def manifest(self, stage, key):
+        with open(os.path.join(self.path(stage, key), 'manifest.json'), 'r') as f:
+            return json.load(f)
+
+    def dump(self, value, path, name, key):
+        """
+            Writes `value` under `path`.
+
+            Returns:
+                dictionary of how to read it back and its fingerprint. Frames are fingerprinted by their content, so
+                stages using a frame that came out the same are not run again, other objects (e.g. fitted models) by
+                the key they were computed for
+        """
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+            specs = {k: self.dump(v, path, '{0}.{1}'.format(name, i), '{0}.{1}'.format(key, k)) for i, (k, v) in
+                     enumerate(value.items())}
+            return {'dict': specs, 'fingerprint': fingerprint({k: v['fingerprint'] for k, v in specs.items()})}
+        if isinstance(value, pd.DataFrame):
+            fp0 = fingerprint(value)
+            file0 = name + '.parquet'
+            try:
+                value.to_parquet(os.path.join(path, file0))
+                return {'parquet': file0, 'fingerprint': fp0}
+            except (ImportError, ValueError, TypeError, NotImplementedError) as e:
+                logger.debug('Storing {0} with joblib instead of Parquet: {1}'.format(name, e))
+                if os.path.isfile(os.path.join(path, file0)):
+                    os.remove(os.path.join(path, file0))
+        else:
+            fp0 = fingerprint(key)
+        file0 = name + '.joblib'
+        joblib.dump(value, os.path.join(path, file0))
+        return {'joblib': file0, 'fingerprint': fp0}
+
+    def read(self, spec, path):
+        if 'dict' in spec:
+            return {k: self.read(v, path) for k, v in spec['dict'].items()}
+        if 'parquet' in spec:
+            return pd.read_parquet(os.path.join(path, spec['parquet']))
+        return joblib.load(os.path.join(path, spec['joblib']))
+
+    def save(self, stage, key, value=None, stored=True):
+        """
+            Saves the output of a stage under `key`. The entry is written to a temporary directory and moved into
+            place, so a failed or concurrent run never leaves a half written entry behind.
+
+            Args:
+                stored (bool): whether to store `value`, side effect stages (e.g. database writes) only record
+                               that they ran for `key`
+        """
+        path0 = self.path(stage, key)
+        tmp0 = '{0}.{1}.{2}.part'.format(path0, os.getpid(), threading.get_ident())
+        shutil.rmtree(tmp0, ignore_errors=True)
+        os.makedirs(tmp0)
+        spec = self.dump(value, tmp0, 'output', key) if stored else None
+        with open(os.path.join(tmp0, 'manifest.json'), 'w') as f:
+            json.dump({'stage': stage, 'key': key, 'created': time.time(), 'output': spec}, f)
+        shutil.rmtree(path0, ignore_errors=True)
+        os.replace(tmp0, path0)
+        self.evict(stage)
+
+    def spec(self, stage, key, entry=None):
+        spec = self.manifest(stage, key)['output']
+        return spec['dict'][entry] if entry is not None else spec
+
+    def load(self, stage, key, entry=None):
+        """
+            Args:
+                entry (string): entry of a dictionary output to read, the whole output if None
+
+            Returns:
+                the output saved under `key`
+        """
+        return self.read(self.spec(stage, key, entry), self.path(stage, key))
+
+    def latest(self, stage):
+        """Returns the key of the last entry written for `stage`, None if there is none."""
+        keys = self.keys(stage)
+        return keys[-1] if keys else None
+
+    def keys(self, stage):
+        # keys of the complete entries of a stage, oldest first
+        dir0 = os.path.join(self.cachedir, stage)
+        if not os.path.isdir(dir0):
+            return []
+        found = []
+        for k in os.listdir(dir0):
+            if not k.endswith('.part') and self.has(stage, k):
+                found.append((self.manifest(stage, k)['created'], k))
+        return [k for _, k in sorted(found)]
+
+    def evict(self, stage):
+        if not self.keep:
+            return
+        for k in self.keys(stage)[:-self.keep]:
+            shutil.rmtree(self.path(stage, k), ignore_errors=True)
+
+
+def from_config(enabled=True, **kwargs):
+    """Returns the StageCache of the `stagecache` section of plebmtg.yaml, None if caching is disabled."""
+    return StageCache(**kwargs) if enabled else None
+
+
+class Pipeline:
+    def __init__(self, cache=None, inputs=None, force=None):
+        """
+            Small DAG of pipeline stages whose outputs are cached under a key made from the fingerprints of their
+            inputs, their settings and the source code of the modules they run. A stage whose key is already in the
+            cache is not run, and its output is only read back from disk when a stage that is run needs it. The
+            inputs of a stage are fingerprinted by content where the cache recorded it (see StageCache.dump), so a
+            stage whose upstream stages were run again but gave the same frames is still a hit.
+
+            Args:
+                cache (StageCache): cache of the stage outputs, every stage runs and nothing is stored if None
+                inputs (dict): {name: frame} of the raw data the stages start from
+                force (bool or list): stages to run even if cached (together with the stages depending on them),
+                                      True for all of them
+        """
+        self.cache = cache
+        self.inputs = dict(inputs or {})
+        self.force = force
+        self.stages = {}
+        self.keys = {}
+        self.fingerprints = {}
+        self.values = {}
+        self.records = []
+
+    def stage(self, name, func, deps=None, config=None, code=(), stored=True):
+        """
+            Adds a stage, after the stages it depends on.
+
+            Args:
+                name (string): name of the stage
+                func (function): called with one keyword argument per entry of `deps`
+                deps (dict): {argument: dependency}, a dependency is the name of an input or a stage, or
+                             '<stage>.<entry>' for one entry of a stage returning a dictionary
+                config (dict): settings of the stage, e.g. its section of plebmtg.yaml
+                code (list): modules whose source the output depends on
+                stored (bool): whether the output is stored, False for side effect stages (e.g. database writes),
+                               which are skipped when the last run of the stage had the same key
+        """
+        deps = dict(deps or {})
+        unknown = [d for d in deps.values() if d.split('.')[0] not in self.stages and d not in self.inputs]
+        if unknown:
+            raise ValueError('Stage {0} depends on unknown stages or inputs {1}'.format(name, unknown))
+        self.stages[name] = {'func': func, 'deps': deps, 'config': config, 'code': code_version(*code) if code else '',
+                             'stored': stored}
+        return self
+
+    def forced(self, name):
+        if self.force is True:
+            return True
+        if name in (self.force or []):
+            return True
+        return any(self.forced(d.split('.')[0]) for d in self.stages[name]['deps'].values()
+                   if d.split('.')[0] in self.stages)
+
+    def key(self, name):
+        """Returns the cache key of a stage (or the fingerprint of an input)."""
+        if name not in self.keys:
+            if name in self.inputs:
+                with profiling.PROFILER.stage('stagecache.fingerprint', input=name):
+                    self.keys[name] = fingerprint(self.inputs[name])
+            else:
+                s = self.stages[name]
+                deps = {a: self.fingerprint(d) for a, d in s['deps'].items()}
+                self.keys[name] = fingerprint(name, deps, s['config'], s['code'])
+        return self.keys[name]
+
+    def fingerprint(self, dep):
+        # content fingerprint of a dependency, resolving the stage it comes from first
+        if dep in self.inputs:
+            return self.key(dep)
+        if dep not in self.fingerprints:
+            name, _, entry = dep.partition('.')
+            self.ensure(name)
+            if self.cache is None or not self.stages[name]['stored']:
+                self.fingerprints[dep] = fingerprint(self.key(name), entry)
+            else:
+                self.fingerprints[dep] = self.cache.spec(name, self.key(name), entry or None)['fingerprint']
+        return self.fingerprints[dep]
+
+    def hit(self, name):
+        if self.cache is None or self.forced(name):
+            return False
+        if self.stages[name]['stored']:
+            return self.cache.has(name, self.key(name))
+        return self.cache.latest(name) == self.key(name)
+
+    def compute(self, name):
+        s = self.stages[name]
+        kwargs = {a: self.get(d) for a, d in s['deps'].items()}
+        start = time.perf_counter()
+        with profiling.PROFILER.stage('stage.{}'.format(name)):
+            value = s['func'](**kwargs)
+        if self.cache is not None:
+            self.cache.save(name, self.key(name), value, stored=s['stored'])
+        self.values[name] = value
+        return time.perf_counter() - start
+
+    def ensure(self, name):
+        # runs a stage unless it is cached, once per pipeline
+        if name in self.inputs or any(r['stage'] == name for r in self.records):
+            return
+        hit = self.hit(name)
+        seconds = 0 if hit else self.compute(name)
+        self.records.append({'stage': name, 'key': self.key(name)[:12], 'hit': hit, 'forced': self.forced(name),
+                             'seconds': seconds})
+        logger.info('Stage {0}: {1}'.format(name, 'cached' if hit else 'ran in {} seconds'.format(round(seconds, 2))))
+
+    def get(self, dep):
+        """
+            Args:
+                dep (string): name of an input or a stage, or '<stage>.<entry>'
+
+            Returns:
+                the value, read from the cache if the stage was not run
+        """
+        if dep in self.inputs:
+            return self.inputs[dep]
+        name, _, entry = dep.partition('.')
+        self.ensure(name)
+        if not self.stages[name]['stored'] and name not in self.values:
+            return None
+        if name not in self.values and dep not in self.values:
+            try:
+                self.values[dep] = self.cache.load(name, self.key(name), entry or None)
+            except Exception as e:
+                # unreadable entry, e.g. written by other library versions
+                logger.warning('Could not read the cached output of {0}, running it again: {1}'.format(name, e))
+                seconds = self.compute(name)
+                self.records = [dict(r, hit=False, seconds=seconds) if r['stage'] == name else r
+                                for r in self.records]
+        if name in self.values:
+            return self.values[name][entry] if entry else self.values[name]
+        return self.values[dep]
+
+    def run(self, targets=None):
+        """
+            Runs the stages (all by default) that are not cached, in the order they were added.
+
+            Returns:
+                self, e.g. to read outputs with get() or the report
+        """
+        for name in self.stages if targets is None else targets:
+            self.ensure(name)
+        return self
+
+    def report(self):
+        """
+            Returns:
+                Pandas dataframe with one row per stage that was checked, whether it was a cache hit, whether it was
+                forced and the seconds spent running it
+        """
+        return pd.DataFrame(self.records, columns=['stage', 'key', 'hit', 'forced', 'seconds'])
+
+    def table(self):
+        """Returns the report as a printable table."""
+        return tabulate(self.report().round(3), headers='keys', tablefmt='psql', showindex=False)
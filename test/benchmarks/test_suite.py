@@ -0,0 +1,42 @@
+import sqlite3
+import pytest
+
+try:
+    from benchmarks import suite
+except ModuleNotFoundError:
+    import suite
+
+
+def report(**walls):
+    return {'meta': {}, 'results': [{'stage': s, 'size': 'small', 'wall': w, 'traced_peak_mb': 10.0, 'skipped': None}
+                                    for s, w in walls.items()]}
+
+
+def test_compare():
+    base0 = report(a=1.0, b=1.0, c=0.01, d=1.0)
+    comp0 = suite.compare(report(a=1.2, b=1.5, c=0.03, e=9.0), base0, threshold=0.25)
+    regressed = comp0[comp0['regressed']]
+    # c tripled but only by 20ms, d and e are only in one of the runs
+    assert regressed[['stage', 'metric']].values.tolist() == [['b', 'wall']]
+    assert sorted(set(comp0['stage'])) == ['a', 'b', 'c']
+    assert not suite.compare(report(b=1.5), base0, threshold=0.6)['regressed'].any()
+
+
+def test_run_subset(tmp_path):
+    report0 = suite.run(sizes=[300], stages=['MTGAPI.scryfall_api', 'Clean.merge_all'], repeat=1, memory=False,
+                        ndays=10)
+    assert [(r['stage'], r['size']) for r in report0['results']] == [('MTGAPI.scryfall_api', '300'),
+                                                                     ('Clean.merge_all', '300')]
+    assert all(r['wall'] > 0 and r['traced_peak_mb'] is None for r in report0['results'])
+    suite.save(report0, str(tmp_path / 'out' / 'bench.json'))
+    assert suite.load(str(tmp_path / 'out' / 'bench.json'))['results'] == report0['results']
+    with pytest.raises(ValueError):
+        suite.run(sizes=[300], stages=['nope'])
+
+
+def test_insert_df_stage(tmp_path):
+    data = suite.Data('tiny', 300, str(tmp_path / 'tiny'), ndays=10)
+    suite.STAGES['insert_df'](data)()
+    with sqlite3.connect(str(tmp_path / 'tiny' / 'insert.db')) as conn:
+        rows = conn.execute('SELECT COUNT(*) FROM cluster_result').fetchone()[0]
+    assert rows == len(data.cluster_result())
@@ -0,0 +1,59 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    from benchmarks import synthetic
+    from benchmarks import standin
+    from src.ingestion import get_data, cleandata
+except ModuleNotFoundError:
+    import synthetic
+    import standin
+    from ingestion import get_data, cleandata
+
+
+def test_seeded():
+    syn0 = synthetic.Synthetic(300, ndays=20, seed=3)
+    syn1 = synthetic.Synthetic(300, ndays=20, seed=3)
+    assert syn0.payloads() == syn1.payloads()
+    pd.testing.assert_frame_equal(syn0.mtgjson(), syn1.mtgjson())
+    assert synthetic.Synthetic(300, ndays=20, seed=4).payloads() != syn0.payloads()
+
+
+@pytest.mark.parametrize('nkeyword, nsubtype', [(10, 30), (80, 400)])
+def test_cardinality(nkeyword, nsubtype):
+    syn0 = synthetic.Synthetic(2000, ndays=30, nkeyword=nkeyword, nsubtype=nsubtype)
+    scry0 = syn0.scryfall()
+    iden0, idkey0 = syn0.identifiers()
+    assert 0 < len([c for c in scry0.columns if c.startswith('kw_')]) <= nkeyword
+    assert 0 < len([c for c in iden0.columns if c.startswith('subtype_')]) <= nsubtype + 1
+    # the frames go through the whole cleaning step
+    kmean0 = cleandata.Clean(scry0, syn0.mtgjson()).for_kmeans()
+    assert len(kmean0) and kmean0['scryfallId'].isin(scry0['id']).all()
+
+
+def test_matches_mtgapi(tmp_path):
+    syn0 = synthetic.Synthetic(400, ndays=30)
+    httpd, base = standin.start(syn0.payloads())
+    try:
+        mtg = standin.point(get_data.MTGAPI(codec=None), base)
+        scry0 = mtg.scryfall_api()
+        price0 = mtg.mtgjson_api()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    # the frames built straight from the generated arrays equal the ones parsed from the generated JSON
+    scry1 = syn0.scryfall()
+    assert sorted(scry1.columns) == sorted(scry0.columns)
+    pd.testing.assert_frame_equal(scry1[scry0.columns], scry0)
+    pd.testing.assert_frame_equal(syn0.mtgjson(), price0)
+    store0 = syn0.store()
+    assert store0.shape == mtg.store.shape and np.array_equal(store0.prices, mtg.store.prices, equal_nan=True)
+
+    # the bulk files hold the same documents as the stand-in payloads
+    for path0 in syn0.write(str(tmp_path), codec='gz'):
+        with synthetic.OPENERS['gz'](path0, 'rt') as f:
+            assert json.load(f) == json.loads(standin.StandIn.bodies['/' + os.path.basename(path0)[:-len('.gz')]])
@@ -1,4 +1,6 @@
 import re
+import types
+import tracemalloc
 from datetime import datetime
 import pandas as pd
 import numpy as np
@@ -6,10 +8,20 @@ import pytest
 
 try:
     from test.ingestion import df_for_test as testdf
+    from benchmarks import synthetic
     from src.ingestion import cleandata
+    from src.utils import profiling, dtypes
 except ModuleNotFoundError:
     import df_for_test as testdf
+    import synthetic
     from ingestion import cleandata
+    from utils import profiling, dtypes
+
+try:
+    import pyarrow.parquet
+    PARQUET = True
+except ImportError:
+    PARQUET = False
 
 
 def test_merge_all_happy():
@@ -239,7 +251,7 @@ def test_for_kmeans_happy():
                  value_name='price')
     # get max, min, avg price of each card during time range
     form = []
-    for p in set(m0['pricetype'].values.tolist()):
+    for p in sorted(set(m0['pricetype'].values.tolist())):
         m1 = m0[m0['pricetype'] == p].groupby(['scryfallId'], as_index=False).agg(
             {'price': ['max', 'min', 'mean']})
         m1.columns = ['scryfallId', p + '_max', p + '_min', p + '_mean']
@@ -258,3 +270,297 @@ def test_for_kmeans_un():
     df = testdf.just_string()
     with pytest.raises(TypeError):
         cleandata.Clean(df, df).for_kmeans()
+
+
+def test_clean_computed_once():
+    profiling.PROFILER.reset()
+    clean0 = cleandata.Clean(testdf.scrydf(), testdf.jsondf())
+    merge0 = clean0.merge_all()
+    gee0 = clean0.for_gee()
+    kmean0 = clean0.for_kmeans()
+    stages = [r['stage'] for r in profiling.PROFILER.records]
+    assert stages.count('Clean.merge_all') == 1 and stages.count('Clean.merge_clean') == 1
+    assert clean0.merge_all() is merge0 and clean0.for_gee() is gee0 and clean0.for_kmeans() is kmean0
+
+    # changing an input or the threshold drops the cached results
+    clean0.percentkeep = 0
+    assert clean0.cache == {}
+    assert clean0.for_kmeans().shape[1] > kmean0.shape[1]
+    clean0.mtgjson = testdf.jsondf().iloc[:0]
+    assert clean0.merge_all().empty
+
+
+def test_clean_release():
+    clean0 = cleandata.Clean(testdf.scrydf(), testdf.jsondf(), release=True)
+    gee0 = clean0.for_gee()
+    # merge_all is freed once merge_clean used it, merge_clean once both for_gee and for_kmeans did
+    assert sorted(clean0.cache) == ['for_gee', 'merge_clean']
+    kmean0 = clean0.for_kmeans()
+    assert sorted(clean0.cache) == ['for_gee', 'for_kmeans']
+
+    clean1 = cleandata.Clean(testdf.scrydf(), testdf.jsondf())
+    pd.testing.assert_frame_equal(gee0, clean1.for_gee())
+    pd.testing.assert_frame_equal(kmean0, clean1.for_kmeans())
+    pd.testing.assert_frame_equal(clean0.merge_all(), clean1.merge_all())
+
+
+def test_prune():
+    df = pd.DataFrame({'name': ['a', 'b', 'c', 'd'], 'kw_rare': [1, 0, 0, np.nan], 'kw_flat': [1, 1, 1, 1],
+                       'kw_many': [1, 0, 1, 1], 'cmc': [1.0, 2.0, 2.0, np.nan], 'pd1': [np.nan, 1.0, 1.0, 1.0]})
+    cols = ['kw_rare', 'kw_flat', 'kw_many', 'cmc']
+
+    # same result as dropping the columns one at a time
+    loop0 = df.copy()
+    for n in cols:
+        loop0 = loop0.fillna({n: 0})
+        if loop0[n].sum() < 2:
+            loop0 = loop0.drop([n], axis=1)
+    pd.testing.assert_frame_equal(cleandata.prune(df, cols, minsum=2), loop0)
+
+    assert cleandata.prune(df, cols, minvar=0.1).columns.tolist() == ['name', 'kw_rare', 'kw_many', 'cmc', 'pd1']
+    assert cleandata.prune(df, cols, minunique=3).columns.tolist() == ['name', 'cmc', 'pd1']
+    # columns not checked are left untouched
+    assert cleandata.prune(df, cols)['pd1'].isna().sum() == 1 and cleandata.prune(df, [])['cmc'].isna().sum() == 1
+
+
+def test_clean_prune_thresholds():
+    clean0 = cleandata.Clean(testdf.scrydf(), testdf.jsondf())
+    clean1 = cleandata.Clean(testdf.scrydf(), testdf.jsondf(), minunique=3)
+    cols0, cols1 = clean0.merge_clean().columns, clean1.merge_clean().columns
+    assert set(cols1) < set(cols0)
+    assert all(clean1.merge_clean()[c].nunique() >= 3 for c in cols1 if c.startswith('kw_'))
+
+
+def pivot_gee(scrypr00):
+    # the former melt + pivot_table implementation of for_gee
+    scrypr1 = pd.melt(scrypr00, id_vars=[c for c in scrypr00.columns if not re.match(r"pd[0-9]+", c)],
+                      value_vars=[c for c in scrypr00.columns if re.match(r"pd[0-9]+", c)], var_name='priceday',
+                      value_name='price')
+    scrypr2 = scrypr1.pivot_table(index=[c for c in scrypr1.columns if c not in ['pricetype', 'price']],
+                                  columns='pricetype', values='price', aggfunc='first', fill_value=0,
+                                  observed=True).reset_index()
+    scrypr2['priceday'] = scrypr2['priceday'].apply(lambda x: re.sub(r'[^0-9]', '', x)).astype(int)
+    return scrypr2.sort_values(by=['scryfallId', 'priceday'])
+
+
+def test_long_prices():
+    syn0 = synthetic.Synthetic(300, ndays=20, seed=1)
+    merge0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson()).merge_clean()
+    pdcols = [c for c in merge0.columns if re.match(r"pd[0-9]+", c)]
+    assert len(pdcols) > 10
+    # missing prices on some days and whole cards, a card without sell prices and a card with a missing feature
+    merge0.loc[merge0.index[::3], pdcols[1:4]] = np.nan
+    merge0.loc[merge0.index[1], pdcols] = np.nan
+    merge0 = merge0.drop(merge0.index[(merge0['pricetype'] == 'sell').to_numpy()][:1])
+    merge0.loc[merge0.index[4], 'power'] = np.nan
+    # price days in no particular order
+    merge0 = merge0[[c for c in merge0.columns if c not in pdcols] + pdcols[::-1]]
+    pd.testing.assert_frame_equal(cleandata.long_prices(merge0), pivot_gee(merge0))
+
+    merge1 = merge0.astype({c: 'float32' for c in pdcols}).astype({'pricetype': 'category'})
+    pd.testing.assert_frame_equal(cleandata.long_prices(merge1), pivot_gee(merge1))
+    # a price type without any price is left out
+    merge1.loc[merge1['pricetype'] == 'sell', pdcols] = np.nan
+    pd.testing.assert_frame_equal(cleandata.long_prices(merge1), pivot_gee(merge1))
+
+
+def test_price_summary():
+    syn0 = synthetic.Synthetic(300, ndays=20, seed=2)
+    merge0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson()).merge_clean()
+    pdcols = [c for c in merge0.columns if re.match(r"pd[0-9]+", c)]
+    merge0.loc[merge0.index[1], pdcols] = np.nan
+    merge0 = merge0.drop(merge0.index[(merge0['pricetype'] == 'sell').to_numpy()][:1])
+    merge0 = merge0.astype({c: 'float32' for c in pdcols})
+
+    # max, min and mean as the groupby over the long format gave them
+    m0 = pd.melt(merge0, id_vars=[c for c in merge0 if c not in pdcols], value_vars=pdcols, var_name='priceday',
+                 value_name='price')
+    m2 = m0[[c for c in m0.columns if c not in ['priceday', 'price', 'pricetype']]].drop_duplicates(keep='first')
+    for p in ['buy', 'sell']:
+        m1 = m0[m0['pricetype'] == p].groupby(['scryfallId'], as_index=False).agg({'price': ['max', 'min', 'mean']})
+        m1.columns = ['scryfallId', p + '_max', p + '_min', p + '_mean']
+        m2 = pd.merge(m2, m1, how='left', on='scryfallId')
+    pd.testing.assert_frame_equal(cleandata.price_summary(merge0), m2)
+
+    summ0 = cleandata.price_summary(merge0, features=['last', 'slope', 'count'])
+    assert summ0.columns.tolist()[-6:] == ['buy_last', 'buy_slope', 'buy_count', 'sell_last', 'sell_slope',
+                                           'sell_count']
+    row0 = merge0[merge0['pricetype'] == 'buy'].iloc[2]
+    prices0 = row0[sorted(pdcols, key=lambda c: int(c[2:]))].dropna()
+    res0 = summ0[summ0['scryfallId'] == row0['scryfallId']].iloc[0]
+    assert res0['buy_last'] == prices0.iloc[-1] and res0['buy_count'] == len(prices0)
+    assert (summ0['sell_count'] == 0).sum() == 1 and summ0['sell_last'].isna().sum() >= 1
+
+
+def test_date_features():
+    df = pd.DataFrame({'released_at': ['2021-06-01', '2021-01-01', '2019-06-03', '2021-03-01'],
+                       'set': ['a', 'b', 'b', 'a']}, index=[3, 5, 7, 9])
+    feats = cleandata.date_features(df, '2021-06-03', cleandata.DATEFEATURES)
+    assert feats.index.tolist() == [3, 5, 7, 9]
+    assert feats['days_since_release'].tolist() == [2, 153, 731, 94]
+    assert feats['days_since_set_release'].tolist() == [94, 731, 731, 94]
+    assert feats['age_bucket'].tolist() == [0, 1, 3, 1]
+    with pytest.raises(ValueError):
+        cleandata.date_features(df, '2021-06-03', ['weekday'])
+
+
+def test_clean_refdate():
+    clean0 = cleandata.Clean(testdf.scrydf(), testdf.jsondf(), dates=['days_since_set_release', 'age_bucket'],
+                             refdate='2030-01-01')
+    merge0 = clean0.merge_clean()
+    assert {'days_since_release', 'days_since_set_release', 'age_bucket'} <= set(merge0.columns)
+    assert (merge0['days_since_set_release'] >= merge0['days_since_release']).all()
+    assert (merge0['age_bucket'] == 4).all()
+    # ages move with the reference day only
+    clean1 = cleandata.Clean(testdf.scrydf(), testdf.jsondf(), refdate='2031-01-01')
+    assert (clean1.merge_clean()['days_since_release'] - merge0['days_since_release'] == 365).all()
+    assert clean1.refdate == datetime(2031, 1, 1).date()
+
+
+def test_inner_join():
+    rng = np.random.default_rng(0)
+    left = pd.DataFrame({'id': rng.choice(list('abcdefgh'), 40), 'flag': rng.random(40) > 0.3,
+                         'value': np.arange(40)})
+    right = pd.DataFrame({'key': rng.choice(list('abcdefxyz'), 30), 'value': rng.random(30),
+                          'kind': pd.Categorical(rng.choice(['buy', 'sell'], 30))})
+    ref0 = pd.merge(left, right, left_on='id', right_on='key', how='inner')
+    pd.testing.assert_frame_equal(cleandata.inner_join(left, right, 'id', 'key', keep=left['flag'].to_numpy()),
+                                  ref0[ref0['flag']])
+    pd.testing.assert_frame_equal(cleandata.inner_join(left, right.rename(columns={'key': 'id'}), 'id', 'id'),
+                                  pd.merge(left, right.rename(columns={'key': 'id'}), on='id', how='inner'),
+                                  check_index_type=False)
+    assert cleandata.inner_join(left, right.iloc[:0], 'id', 'key').empty
+
+
+def test_merge_all_prefiltered():
+    syn0 = synthetic.Synthetic(300, ndays=10, seed=4)
+    scry, mtgjson = syn0.scryfall(), syn0.mtgjson()
+    scry.loc[scry.index[::7], 'released_at'] = np.nan
+    scry.loc[scry.index[::5], 'rarity'] = 'special'
+    ref0 = pd.merge(scry, mtgjson, left_on='id', right_on='scryfallId', how='inner')
+    ref0 = ref0[ref0['rarity'].isin(['common', 'rare', 'uncommon', 'mythic'])].dropna(subset=['released_at'])
+    pd.testing.assert_frame_equal(cleandata.Clean(scry, mtgjson).merge_all(), ref0)
+
+
+def clean_reference(scrypr0, refdate):
+    # the former merge_clean, chaining copies of the whole merged dataset
+    noneed = ['object', 'id', 'oracle_id', 'mtgo_id', 'mtgo_foil_id', 'tcgplayer_id', 'cardmarket_id', 'lang',
+              'highres_image', 'image_status', 'image_url', 'type_line', 'oracle_text', 'reserved', 'foil',
+              'nonfoil', 'oversized', 'promo', 'variation', 'digital', 'flavor_text', 'artist', 'border_color',
+              'frame', 'full_art', 'textless', 'booster', 'watermark', 'printed_name', 'printed_type_line',
+              'printed_text', 'content_warning', 'variation_of', 'flavor_name', 'uuid', 'mtgjsonV4Id',
+              'scryfallIllustrationId', 'scryfallOracleId', 'minday', 'maxday', 'layout', 'set', 'set_name',
+              'set_type', 'collector_number']
+    scrypr00 = scrypr0.drop(noneed, axis=1).dropna(axis=1, how='all')
+    numcols = scrypr00.select_dtypes(include=np.number).columns.tolist()
+    numcols1 = [c for c in numcols if not re.match(r"pd[0-9]+", c)]
+    pkeep = len(scrypr00) * 0.03
+    for n in numcols1:
+        scrypr00 = scrypr00.fillna({n: 0})
+        if scrypr00[n].sum() < pkeep:
+            scrypr00 = scrypr00.drop([n], axis=1)
+    for c in ['power', 'toughness', 'loyalty']:
+        scrypr00[c] = pd.to_numeric(scrypr00[c], errors='coerce')
+    scrypr00 = scrypr00.fillna({'power': 0, 'toughness': 0, 'loyalty': 0})
+    for b in scrypr00.select_dtypes(include=bool).columns.tolist():
+        scrypr00[b] = scrypr00[b] * 1
+    if isinstance(scrypr00['rarity'].dtype, pd.CategoricalDtype):
+        scrypr00['rarity'] = scrypr00['rarity'].cat.remove_unused_categories()
+    scrypr00 = pd.get_dummies(scrypr00, prefix=['rarity'], columns=['rarity'], drop_first=True)
+    scrypr00['days_since_release'] = scrypr00['released_at'].apply(
+        lambda x: (datetime.strptime(refdate, "%Y-%m-%d") - datetime.strptime(x, "%Y-%m-%d")).days)
+    scrypr00 = scrypr00.sort_values(by=['scryfallId', 'name', 'days_since_release', 'pricetype'])
+    scrypr00 = scrypr00.drop_duplicates(subset=['name', 'pricetype'], keep='first')
+    scrypr00 = scrypr00.drop(['released_at'], axis=1)
+    return scrypr00[['scryfallId'] + [c for c in scrypr00.columns if c != 'scryfallId']]
+
+
+@pytest.mark.parametrize('downcast', [False, True])
+def test_merge_clean_parity(downcast):
+    enabled = dtypes.POLICY.enabled
+    dtypes.POLICY.configure(enabled=downcast, report=False)
+    try:
+        syn0 = synthetic.Synthetic(400, ndays=10, seed=5)
+        clean0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson(), refdate='2021-06-03')
+        merge0 = clean0.merge_all()
+        pd.testing.assert_frame_equal(clean0.merge_clean(),
+                                      dtypes.downcast(clean_reference(merge0, '2021-06-03'), 'reference'))
+    finally:
+        dtypes.POLICY.configure(enabled=enabled, report=True)
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+# peak memory budget of every Clean step relative to the size of its input (merge_all: both APIs, for_gee: its output)
+BUDGETS = {'merge_all': 1.0, 'merge_clean': 0.75, 'for_gee': 1.2, 'for_kmeans': 1.5}
+
+
+@pytest.fixture(scope='module')
+def medium():
+    syn0 = synthetic.Synthetic(1500, seed=0)
+    return syn0.scryfall(), syn0.mtgjson()
+
+
+def test_copy_on_write_fallback(monkeypatch):
+    # pandas before 1.5 has no copy-on-write mode, the context then does nothing
+    monkeypatch.setattr(cleandata, 'pd', types.SimpleNamespace(options=types.SimpleNamespace(mode=object())))
+    with cleandata.copy_on_write():
+        pass
+
+
+@pytest.mark.skipif('copy_on_write' not in dir(pd.options.mode),
+                    reason='the budgets assume copy-on-write, which needs pandas 1.5 or later')
+@pytest.mark.parametrize('step', list(BUDGETS))
+def test_memory_budget(medium, step):
+    clean0 = cleandata.Clean(*medium, refdate='2021-06-03')
+    # the steps before are computed outside of the measurement
+    for prev in list(BUDGETS)[:list(BUDGETS).index(step)]:
+        getattr(clean0, prev)()
+    tracemalloc.start()
+    try:
+        out = getattr(clean0, step)()
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+    if step == 'merge_all':
+        size0 = frame_mb(medium[0]) + frame_mb(medium[1])
+    else:
+        size0 = frame_mb(out if step == 'for_gee' else clean0.cache['merge_all' if step == 'merge_clean'
+                                                                   else 'merge_clean'])
+    assert peak <= BUDGETS[step] * size0, '{0} peaked at {1} MB, budget {2} MB'.format(
+        step, round(peak, 2), round(BUDGETS[step] * size0, 2))
+
+
+@pytest.mark.parametrize('by', ['hash', 'set'])
+def test_chunks_parity(by):
+    syn0 = synthetic.Synthetic(600, ndays=10, seed=6)
+    kwargs = dict(refdate='2021-06-03', dates=['days_since_set_release', 'age_bucket'], minunique=2,
+                  features=['max', 'mean', 'last', 'slope'])
+    clean0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson(), **kwargs)
+    chunks = list(clean0.chunks(nchunks=5, by=by))
+    assert len(chunks) > 1 and len(set(k for k, _, _ in chunks)) == len(chunks)
+
+    # the chunks hold the same rows and columns as the data cleaned at once
+    gee0 = pd.concat([g for _, g, _ in chunks], ignore_index=True).sort_values(by=['scryfallId', 'priceday'])
+    pd.testing.assert_frame_equal(gee0.reset_index(drop=True), clean0.for_gee().reset_index(drop=True))
+    kmean0 = pd.concat([m for _, _, m in chunks], ignore_index=True).sort_values(by='scryfallId')
+    kmean1 = clean0.for_kmeans().sort_values(by='scryfallId')
+    pd.testing.assert_frame_equal(kmean0.reset_index(drop=True), kmean1.reset_index(drop=True))
+
+    with pytest.raises(ValueError):
+        next(clean0.chunks(by='rarity'))
+
+
+@pytest.mark.skipif(not PARQUET, reason='no Parquet engine')
+def test_partitioned(tmp_path):
+    syn0 = synthetic.Synthetic(400, ndays=10, seed=7)
+    clean0 = cleandata.Clean(syn0.scryfall(), syn0.mtgjson(), refdate='2021-06-03')
+    (tmp_path / 'for_gee').mkdir()
+    (tmp_path / 'for_gee' / 'part-00099.parquet').write_bytes(b'stale')
+    part0 = clean0.partitioned(str(tmp_path), nchunks=3)
+    assert len(part0.parts('for_gee')) == len(part0.parts('for_kmeans')) == 3
+    assert sum(len(c) for c in part0.iter_chunks('for_gee', columns=['scryfallId'])) == len(clean0.for_gee())
+    kmean0 = part0.read('for_kmeans').sort_values(by='scryfallId').reset_index(drop=True)
+    pd.testing.assert_frame_equal(kmean0, clean0.for_kmeans().sort_values(by='scryfallId').reset_index(drop=True))
@@ -0,0 +1,72 @@
+import re
+import numpy as np
+import pandas as pd
+
+try:
+    from src.ingestion import encoders
+except ModuleNotFoundError:
+    from ingestion import encoders
+
+
+def listdf():
+    return pd.DataFrame({'subtypes': [['Human', 'Wizard'], [], np.nan, ['Human'], ['Elder Dragon']],
+                         'produced_mana': [['G', 'G', 'U'], np.nan, ['C'], [], ['G']]},
+                        index=['u3', 'u1', 'u9', 'u4', 'u0'])
+
+
+def test_multihot_happy():
+    df = listdf()
+    hot0 = encoders.multihot(df['subtypes'], 'subtype_')
+
+    # one full column scan per value
+    hot1 = pd.DataFrame(index=df.index)
+    for bt in sorted(set([i for j in df['subtypes'].values.tolist() if isinstance(j, list) for i in j])):
+        hot1['subtype_' + re.sub(r'-|,|/|\s+', '', bt)] = df['subtypes'].apply(
+            lambda x: 1 if isinstance(x, list) and bt in x else 0)
+    pd.testing.assert_frame_equal(hot0, hot1)
+
+
+def test_multihot_count():
+    hot0 = encoders.multihot(listdf()['produced_mana'], 'pmana_', count=True)
+    assert hot0.columns.tolist() == ['pmana_C', 'pmana_G', 'pmana_U']
+    assert hot0['pmana_G'].tolist() == [2, 0, 0, 0, 1]
+
+
+def test_multihot_dtypes():
+    df = listdf()
+    dense0 = encoders.multihot(df['subtypes'], 'subtype_')
+    hot8 = encoders.multihot(df['subtypes'], 'subtype_', dtype='uint8')
+    assert (hot8.dtypes == np.uint8).all()
+    hotsp = encoders.multihot(df['subtypes'], 'subtype_', dtype='uint8', sparse=True)
+    assert all(isinstance(d, pd.SparseDtype) for d in hotsp.dtypes)
+    pd.testing.assert_frame_equal(hotsp.sparse.to_dense().astype('int64'), dense0)
+
+
+def test_multihot_empty():
+    hot0 = encoders.multihot(pd.Series([[], np.nan], index=[5, 6]), 'kw_')
+    assert hot0.shape == (2, 0) and hot0.index.tolist() == [5, 6]
+
+
+def test_mana_symbols_happy():
+    cost = pd.Series(['{2}{W/U}{G/P}', '{X}{R}{R}', np.nan, '{1}{U} // {3}{U}', '{2/B}{2/B}'], index=list('abcde'))
+    sym0 = encoders.mana_symbols(cost, 'colors_')
+    assert sym0.columns.tolist() == ['colors_2B', 'colors_GP', 'colors_R', 'colors_U', 'colors_WU', 'colors_X',
+                                     'colors_generic', 'colors_hybrid', 'colors_phyrexian', 'colors_cmc']
+    assert sym0.index.tolist() == list('abcde')
+    assert sym0.loc['a', ['colors_WU', 'colors_GP', 'colors_generic', 'colors_hybrid', 'colors_phyrexian',
+                          'colors_cmc']].tolist() == [1, 1, 2, 1, 1, 4]
+    assert sym0.loc['b', ['colors_X', 'colors_R', 'colors_cmc']].tolist() == [1, 2, 2]
+    assert (sym0.loc['c'] == 0).all()
+    assert sym0.loc['d', ['colors_U', 'colors_generic', 'colors_cmc']].tolist() == [2, 4, 6]
+    assert sym0.loc['e', ['colors_2B', 'colors_hybrid', 'colors_cmc']].tolist() == [2, 2, 4]
+
+
+def test_mana_symbols_produced():
+    sym0 = encoders.mana_symbols(listdf()['produced_mana'], 'pmana_', totals=False, dtype='int64')
+    pd.testing.assert_frame_equal(sym0, encoders.multihot(listdf()['produced_mana'], 'pmana_', count=True))
+
+
+def test_mana_symbols_empty():
+    sym0 = encoders.mana_symbols(pd.Series([np.nan, '']), 'colors_')
+    assert sym0.columns.tolist() == ['colors_generic', 'colors_hybrid', 'colors_phyrexian', 'colors_cmc']
+    assert (sym0.values == 0).all()
@@ -0,0 +1,151 @@
+import io
+import datetime
+import pandas as pd
+import pytest
+
+try:
+    from benchmarks import standin
+    from src.ingestion import get_data
+except ModuleNotFoundError:
+    import standin
+    from ingestion import get_data
+
+
+@pytest.fixture
+def server():
+    httpd, base = standin.start(standin.payloads())
+    yield base
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('codec', [None, 'gz', 'bz2', 'xz'])
+def test_compressed_variants(server, codec):
+    mtg = standin.point(get_data.MTGAPI(codec=codec), server)
+    price0 = mtg.mtgjson_api()
+    assert standin.StandIn.requests[-1] == '/AllPrices.json' + ('' if codec is None else '.' + codec)
+    pd.testing.assert_frame_equal(price0, standin.point(get_data.MTGAPI(codec=None), server).mtgjson_api())
+    pd.testing.assert_frame_equal(mtg.mtgjson_api(stream=False), price0)
+    with pytest.raises(ValueError):
+        get_data.MTGAPI(codec='zip')
+
+
+def test_stream_matches_whole_file(server):
+    mtg = standin.point(get_data.MTGAPI(), server)
+    scry0 = mtg.scryfall_api(stream=False).reset_index(drop=True)
+    pd.testing.assert_frame_equal(mtg.scryfall_api(stream=True), scry0, check_like=True)
+    pd.testing.assert_frame_equal(mtg.mtgjson_api(stream=True), mtg.mtgjson_api(stream=False))
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_ingest_all_happy(server, tmp_path, cached):
+    mtg = standin.point(get_data.MTGAPI(cachedir=str(tmp_path) if cached else None), server)
+    scry0 = mtg.scryfall_api()
+    price0 = mtg.mtgjson_api()
+    gold0 = mtg.mtggoldfish()
+
+    # slow responses so requests sent together are answered at the same time
+    standin.StandIn.delay = 0.2
+    standin.StandIn.peak = 0
+    raw0 = mtg.ingest_all(sources=['scryfall', 'mtgjson', 'mtggoldfish'])
+    pd.testing.assert_frame_equal(raw0['scryfall'], scry0)
+    pd.testing.assert_frame_equal(raw0['mtgjson'], price0)
+    pd.testing.assert_frame_equal(raw0['mtggoldfish'], gold0)
+    # the scryfall metadata, MTGJSON identifiers and prices (and both MTGGoldfish pages unless cached for the day)
+    # are all requested at once
+    assert standin.StandIn.peak >= (3 if cached else 5)
+    assert mtg.pending == {} and mtg.spooldir is None
+
+
+def test_ingest_all_failure(server, tmp_path, monkeypatch):
+    mtg = standin.point(get_data.MTGAPI(cachedir=str(tmp_path)), server)
+
+    def fail():
+        raise ValueError('bad payload')
+    monkeypatch.setattr(mtg, 'scryfall_api', fail)
+    with pytest.raises(ValueError):
+        mtg.ingest_all(sources=['scryfall', 'mtgjson'])
+    # nothing of the failed run is left for the next one
+    assert mtg.pending == {} and mtg.spooldir is None
+
+    # a download worker never takes a pending future, even one of its own url
+    mtg.pending = {mtg.variant(mtg.identifier): None}
+    assert mtg.download(mtg.variant(mtg.identifier), 'mtgjson').status_code in [200, 304]
+    assert mtg.variant(mtg.identifier) in mtg.pending
+
+
+def test_mtgjson_incremental(server, tmp_path):
+    mtg = standin.point(get_data.MTGAPI(historydir=str(tmp_path)), server)
+    full0 = mtg.mtgjson_api(incremental=False)
+
+    # bootstrap downloads the full file once, the result is the same as without a history
+    pd.testing.assert_frame_equal(mtg.mtgjson_api(), full0, check_exact=True)
+    assert '/AllPrices.json.gz' in standin.StandIn.requests
+
+    # the next day only the daily file is downloaded and appended
+    standin.StandIn.requests = []
+    standin.StandIn.bodies['/AllPricesToday.json'] = standin.prices(['2021-06-04'])
+    price0 = mtg.mtgjson_api()
+    assert '/AllPrices.json.gz' not in standin.StandIn.requests
+    assert (price0['maxday'] == 'p_2021-06-04').all() and (price0['minday'] == 'p_2021-06-01').all()
+    pd.testing.assert_series_equal(price0['pd3'], price0['pd2'], check_names=False)
+    assert mtg.store.uuids.tolist() == price0['uuid'].iloc[:len(price0) // 2].tolist()
+    assert mtg.store.dates[-1] == '2021-06-04'
+
+    # a missing day falls back to the full file
+    standin.StandIn.requests = []
+    standin.StandIn.bodies['/AllPricesToday.json'] = standin.prices(['2021-06-06'])
+    mtg.mtgjson_api()
+    assert '/AllPrices.json.gz' in standin.StandIn.requests
+
+
+def test_mtgjson_incremental_new_cards(server, tmp_path):
+    mtg = standin.point(get_data.MTGAPI(historydir=str(tmp_path)), server)
+    mtg.mtgjson_api()
+    assert 'u6' not in mtg.store.uuids
+
+    # a card joins the identifiers after the bootstrap: its whole window is read from the full file
+    standin.StandIn.requests = []
+    standin.StandIn.bodies['/AllIdentifiers.json'] = standin.payloads(ncard=7)['/AllIdentifiers.json']
+    standin.StandIn.bodies['/AllPricesToday.json'] = standin.prices(['2021-06-04'])
+    price0 = mtg.mtgjson_api()
+    assert '/AllPrices.json.gz' in standin.StandIn.requests
+    new0 = price0[price0['uuid'] == 'u6']
+    assert len(new0) == 2 and (new0['minday'] == 'p_2021-06-01').all() and (new0['maxday'] == 'p_2021-06-04').all()
+    assert new0[['pd0', 'pd1', 'pd2', 'pd3']].notna().all().all()
+
+    # the next day the card is known, only the daily file is downloaded
+    standin.StandIn.requests = []
+    standin.StandIn.bodies['/AllPricesToday.json'] = standin.prices(['2021-06-05'])
+    mtg.mtgjson_api()
+    assert '/AllPrices.json.gz' not in standin.StandIn.requests
+
+
+@pytest.mark.parametrize('page', [
+    None,
+    # a row spanning the whole table, e.g. an ad between the staples
+    '<table><tr><th></th><th>Card</th><th>Decks</th></tr><tr><td>1</td><td>A</td><td>10%</td></tr>'
+    '<tr><td colspan="3">Ad</td></tr><tr><td>2</td><td>B</td><td>1200</td></tr></table>',
+    '<table><tr><th>a</th><th>b</th><th>c</th></tr><tr><td rowspan="2">x</td><td>1</td><td>2</td></tr>'
+    '<tr><td>3</td><td>4</td></tr><tr><td>y</td><td colspan="2">5</td></tr></table>',
+    '<table><tr><th>a</th><th>b</th><th>c</th></tr><tr><td>x</td><td>1</td></tr><tr><td>y</td><td>2</td>'
+    '<td>3</td></tr></table>'])
+def test_html_table_matches_read_html(page):
+    page0 = standin.payloads()['/creatures'] if page is None else page.encode()
+    pd.testing.assert_frame_equal(get_data.html_table(page0), pd.read_html(io.StringIO(page0.decode()))[0])
+
+
+def test_mtggoldfish_day_cache(server, tmp_path):
+    mtg = standin.point(get_data.MTGAPI(cachedir=str(tmp_path)), server)
+    standin.StandIn.delay = 0.2
+    gold0 = mtg.mtggoldfish()
+    # both pages are requested at the same time
+    assert standin.StandIn.peak == 2
+    assert sorted(standin.StandIn.requests) == ['/creatures', '/spells']
+
+    # the same day is served from the cache without any request, a new day downloads again
+    pd.testing.assert_frame_equal(get_data.MTGAPI(cachedir=str(tmp_path)).mtggoldfish(), gold0)
+    assert len(standin.StandIn.requests) == 2
+    mtg.mtggoldfish(day=datetime.date.today() + datetime.timedelta(days=1))
+    assert len(standin.StandIn.requests) == 4
+    assert len(list(tmp_path.glob('mtggoldfish-*.pkl'))) == 1
@@ -0,0 +1,80 @@
+import os
+import pytest
+import requests
+
+try:
+    from benchmarks import standin
+    from src.ingestion import httpcache
+except ModuleNotFoundError:
+    import standin
+    from ingestion import httpcache
+
+
+@pytest.fixture
+def server():
+    httpd, base = standin.start({'/prices.json': b'{"data": {"a": 1}}', '/ids.json': b'{"data": {"b": 2}}',
+                                 '/big.json': b'x' * 100})
+    yield base
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_revalidates(server, tmp_path):
+    cache = httpcache.DownloadCache(str(tmp_path), maxbytes=10000)
+    re0 = cache.get(server + '/prices.json')
+    assert re0.json() == {'data': {'a': 1}} and not re0.fromcache
+    re1 = cache.get(server + '/prices.json')
+    assert re1.status_code == 304 and re1.fromcache
+    assert b''.join(re1.iter_content(chunk_size=4)) == b'{"data": {"a": 1}}'
+    assert cache.stats['misses'] == 1 and cache.stats['revalidated'] == 1
+
+    # upstream changed
+    standin.StandIn.bodies['/prices.json'] = b'{"data": {"a": 2}}'
+    assert cache.get(server + '/prices.json').json() == {'data': {'a': 2}}
+    assert cache.stats['misses'] == 2
+
+
+def test_get_version_skips_request(server, tmp_path):
+    cache = httpcache.DownloadCache(str(tmp_path), maxbytes=10000)
+    cache.get(server + '/prices.json', key='bulk', version='2021-06-01|18')
+    ncalls = len(standin.StandIn.requests)
+    re1 = cache.get(server + '/ids.json', key='bulk', version='2021-06-01|18')
+    assert len(standin.StandIn.requests) == ncalls
+    assert re1.json() == {'data': {'a': 1}} and cache.stats['hits'] == 1
+    # new version is downloaded even though the key is the same
+    assert cache.get(server + '/ids.json', key='bulk', version='2021-06-02|18').json() == {'data': {'b': 2}}
+
+
+def test_get_persists_index(server, tmp_path):
+    httpcache.DownloadCache(str(tmp_path)).get(server + '/prices.json')
+    cache = httpcache.DownloadCache(str(tmp_path))
+    assert cache.get(server + '/prices.json').fromcache
+
+    # hits only change the index in memory until it is flushed
+    mtime0 = os.stat(cache.indexpath).st_mtime_ns
+    lastused = cache.index[server + '/prices.json']['lastused']
+    assert cache.get(server + '/prices.json').fromcache and cache.dirty
+    assert os.stat(cache.indexpath).st_mtime_ns == mtime0
+    cache.flush()
+    assert not cache.dirty
+    assert httpcache.DownloadCache(str(tmp_path)).index[server + '/prices.json']['lastused'] > lastused
+
+
+def test_evict_lru(server, tmp_path):
+    cache = httpcache.DownloadCache(str(tmp_path), maxbytes=120)
+    cache.get(server + '/prices.json')
+    cache.get(server + '/ids.json')
+    cache.get(server + '/prices.json')
+    # ids.json is the least recently used entry
+    cache.get(server + '/big.json')
+    assert server + '/ids.json' not in cache.index
+    assert server + '/prices.json' in cache.index
+    assert cache.size() <= 120 and cache.stats['evicted'] == 1
+
+
+def test_get_un(server, tmp_path):
+    cache = httpcache.DownloadCache(str(tmp_path))
+    assert cache.get(server + '/missing.json').status_code == 404
+    assert cache.index == {}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        cache.get('http://127.0.0.1:1/prices.json')
@@ -0,0 +1,54 @@
+import pytest
+import requests
+
+try:
+    from benchmarks import standin
+    from src.ingestion import httpsession
+except ModuleNotFoundError:
+    import standin
+    from ingestion import httpsession
+
+
+@pytest.fixture
+def server():
+    httpd, base = standin.start({'/prices.json': b'{"data": {"a": 1}}', '/big.json': b'x' * 5000})
+    yield base
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_retries(server):
+    standin.StandIn.failures['/prices.json'] = 2
+    sess = httpsession.RetrySession(backoff=0.01, budget=5)
+    re0 = sess.get(server + '/prices.json', source='mtgjson')
+    assert re0.json() == {'data': {'a': 1}}
+    assert sess.records[-1]['retries'] == 2 and sess.records[-1]['bytes'] == len(re0.content)
+    assert sess.spent['mtgjson'] > 0
+
+
+def test_get_keepalive(server):
+    sess = httpsession.RetrySession()
+    sess.get(server + '/prices.json')
+    sess.get(server + '/prices.json')
+    # both requests are sent over the same pooled connection
+    assert standin.StandIn.clients[0] == standin.StandIn.clients[1]
+
+
+def test_get_stream_bytes(server):
+    sess = httpsession.RetrySession()
+    re0 = sess.get(server + '/big.json', source='scryfall', stream=True)
+    assert sess.records[-1]['bytes'] == 0
+    assert b''.join(re0.iter_content(chunk_size=1000)) == b'x' * 5000
+    report0 = sess.report()
+    assert report0['bytes'].tolist() == [5000] and report0['requests'].tolist() == [1]
+
+
+def test_get_budget_un(server):
+    standin.StandIn.failures['/prices.json'] = 100
+    sess = httpsession.RetrySession(backoff=0.05, budget=0.3)
+    with pytest.raises(requests.exceptions.RetryError):
+        sess.get(server + '/prices.json', source='mtgjson')
+    assert sess.spent['mtgjson'] <= 0.3 + 0.1
+    # status codes that are not retried are returned straight away
+    assert sess.get(server + '/missing.json').status_code == 404
+    assert sess.records[-1]['retries'] == 0
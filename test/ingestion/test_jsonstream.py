@@ -0,0 +1,87 @@
+import bz2
+import gzip
+import json
+import lzma
+import pytest
+
+try:
+    from src.ingestion import jsonstream, get_data
+except ModuleNotFoundError:
+    from ingestion import jsonstream, get_data
+
+
+def chunked(text, size):
+    # split an encoded document into small pieces to mimic response.iter_content
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_array_happy():
+    cards = [{'name': 'Ugin, the Spirit Dragon', 'cmc': 8.0, 'keywords': []},
+             {'name': 'Lovestruck Beast // Heart\'s Desire', 'cmc': 3, 'prices': {'usd': None}},
+             {'name': 'Æther Vial', 'cmc': 1, 'flavor_text': 'a "quoted" [bracket] {brace}'}]
+    text = json.dumps(cards, ensure_ascii=False)
+    # chunk sizes that split multi-byte characters, strings and numbers
+    for size in [1, 3, 7, len(text)]:
+        assert list(jsonstream.iter_array(chunked(text, size))) == cards
+
+
+def test_iter_array_numbers():
+    assert list(jsonstream.iter_array(chunked('[1234, 56.78 ,9e2]', 2))) == [1234, 56.78, 900.0]
+
+
+def test_iter_array_path():
+    text = json.dumps({'object': 'list', 'data': [{'a': 1}, {'a': 2}], 'has_more': False})
+    assert list(jsonstream.iter_array(chunked(text, 4), path=('data',))) == [{'a': 1}, {'a': 2}]
+    assert list(jsonstream.iter_array(chunked('{"data": []}', 4), path=('data',))) == []
+
+
+def test_iter_array_un():
+    with pytest.raises(ValueError):
+        list(jsonstream.iter_array(chunked('[{"a": 1}, {"a": ', 4)))
+    with pytest.raises(KeyError):
+        list(jsonstream.iter_array(chunked('{"meta": {}}', 4), path=('data',)))
+
+
+def test_scryfall_keep():
+    card = {'legalities': {'standard': 'legal'}, 'set_type': 'expansion', 'lang': 'en',
+            'type_line': 'Creature — Beast'}
+    assert get_data.scryfall_keep(card)
+    assert not get_data.scryfall_keep(dict(card, lang='ja'))
+    assert not get_data.scryfall_keep(dict(card, set_type='promo'))
+    assert not get_data.scryfall_keep(dict(card, legalities={'standard': 'not_legal'}))
+    assert not get_data.scryfall_keep(dict(card, type_line='Basic Land — Forest'))
+
+
+def test_iter_object_happy():
+    prices = {'meta': {'date': '2021-06-01', 'version': '5.1.0'},
+              'data': {'uuid-a': {'paper': {'tcgplayer': {'retail': {'normal': {'2021-06-01': 0.25}}}}},
+                       'uuid-b': {'mtgo': {'cardhoarder': {'retail': {'normal': {'2021-06-01': 0.02}}}}}}}
+    text = json.dumps(prices)
+    for size in [1, 5, len(text)]:
+        assert list(jsonstream.iter_object(chunked(text, size), path=('data',))) == list(prices['data'].items())
+
+
+def test_iter_object_un():
+    with pytest.raises(ValueError):
+        list(jsonstream.iter_object(chunked('{"data": {"a": 1 "b": 2}}', 3), path=('data',)))
+
+
+def test_paper_normal():
+    entry = {'mtgo': {'cardhoarder': {'retail': {'normal': {'2021-06-01': 0.02}}}},
+             'paper': {'cardkingdom': {'buylist': {'normal': {'2021-06-01': 0.1}, 'foil': {'2021-06-01': 0.5}},
+                                       'retail': {'foil': {'2021-06-01': 1.5}}, 'currency': 'USD'},
+                       'tcgplayer': {'retail': {'normal': {'2021-06-01': 0.25}}, 'currency': 'USD'}}}
+    assert get_data.paper_normal(entry) == {'cardkingdom': {'buylist': {'normal': {'2021-06-01': 0.1}}},
+                                            'tcgplayer': {'retail': {'normal': {'2021-06-01': 0.25}}}}
+    assert get_data.paper_normal({'mtgo': {}}) == {}
+
+
+@pytest.mark.parametrize('codec', ['gz', 'bz2', 'xz'])
+def test_decompress_small_chunks(codec):
+    doc = json.dumps({'data': {'u{}'.format(i): {'paper': {'x': i}} for i in range(500)}}).encode()
+    comp = {'gz': gzip.compress, 'bz2': bz2.compress, 'xz': lzma.compress}[codec](doc)
+    chunks = (comp[i:i + 7] for i in range(0, len(comp), 7))
+    assert dict(jsonstream.iter_object(jsonstream.decompress(chunks, codec), path=('data',))) == \
+        json.loads(doc)['data']
+    assert b''.join(jsonstream.decompress([doc[:10], doc[10:]])) == doc
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import datetime
+import pandas as pd
+import pytest
+
+try:
+    from benchmarks import standin
+    from src.ingestion import get_data, snapshots, httpcache
+except ModuleNotFoundError:
+    import standin
+    from ingestion import get_data, snapshots, httpcache
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_replay_matches_live(tmp_path, cached):
+    httpd, base = standin.start(standin.payloads())
+    kwargs = {'snapshotdir': str(tmp_path / 'snap'), 'historydir': str(tmp_path / 'prices'),
+              'cachedir': str(tmp_path / 'cache') if cached else None}
+    try:
+        mtg = standin.point(get_data.MTGAPI(**kwargs), base)
+        live0 = mtg.ingest_all(sources=['scryfall', 'mtgjson', 'mtggoldfish'])
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    history0 = sorted(os.listdir(tmp_path / 'prices'))
+    mtime0 = os.path.getmtime(tmp_path / 'prices' / 'prices.npy')
+
+    # the server is gone, everything is read from the archive
+    today = datetime.date.today().isoformat()
+    replay0 = standin.point(get_data.MTGAPI(replay=today, **kwargs), base)
+    for s, df in replay0.ingest_all(sources=['scryfall', 'mtgjson', 'mtggoldfish']).items():
+        pd.testing.assert_frame_equal(df, live0[s])
+    assert sorted(os.listdir(tmp_path / 'prices')) == history0
+    assert os.path.getmtime(tmp_path / 'prices' / 'prices.npy') == mtime0
+
+    with pytest.raises(FileNotFoundError):
+        standin.point(get_data.MTGAPI(replay='2000-01-01', **kwargs), base).mtggoldfish()
+
+
+def test_archive_roundtrip(tmp_path):
+    arch0 = snapshots.SnapshotArchive(str(tmp_path))
+    resp0 = arch0.save('http://x/AllPrices.json', Body(b'{"a": 1}'))
+    assert resp0.json() == {'a': 1}
+    arch0.save('http://x/AllPrices.json.gz', Body(b'compressed'))
+
+    today = datetime.date.today().isoformat()
+    assert arch0.dates() == [today]
+    assert arch0.open('http://x/AllPrices.json', today).content == b'{"a": 1}'
+    assert arch0.open('http://x/AllPrices.json.gz', today).content == b'compressed'
+    # bodies are stored compressed
+    assert all(n.endswith('.gz') for n in arch0.manifest().values())
+
+
+def test_archive_dedupe_prune(tmp_path):
+    arch0 = snapshots.SnapshotArchive(str(tmp_path), keep=2)
+    days = ['2021-06-0{}'.format(d) for d in range(1, 5)]
+    for d in days[:3]:
+        # the identifiers do not change, the prices do
+        arch0.save('http://x/AllIdentifiers.json', Body(b'same'), date=d)
+        arch0.save('http://x/AllPrices.json', Body(d.encode()), date=d)
+    assert arch0.dates() == days[1:3]
+    # one shared identifier body and the price bodies of the days kept
+    assert len(os.listdir(tmp_path / 'blobs')) == 3
+    iden0 = 'http://x/AllIdentifiers.json'
+    assert arch0.manifest(days[1])[iden0] == arch0.manifest(days[2])[iden0]
+    assert arch0.open('http://x/AllPrices.json', days[1]).content == days[1].encode()
+
+    arch0.save('http://x/AllPrices.json', Body(b'new'), date=days[3])
+    assert arch0.dates() == days[2:]
+    assert len(os.listdir(tmp_path / 'blobs')) == 3
+    assert arch0.open('http://x/AllIdentifiers.json', days[2]).content == b'same'
+
+
+def test_archive_known_digest(tmp_path):
+    arch0 = snapshots.SnapshotArchive(str(tmp_path / 'snap'))
+    body0 = tmp_path / 'body'
+    body0.write_bytes(b'{"a": 1}')
+    resp0 = httpcache.CachedResponse(str(body0), 304, fromcache=True, sha256=hashlib.sha256(b'{"a": 1}').hexdigest())
+    # a body already on disk is handed back as it is
+    assert arch0.save('http://x/AllPrices.json', resp0, date='2021-06-01') is resp0
+
+    # the digest is archived, the body is not read again
+    body0.unlink()
+    assert arch0.save('http://x/AllPrices.json', resp0, date='2021-06-02') is resp0
+    assert arch0.open('http://x/AllPrices.json', '2021-06-02').content == b'{"a": 1}'
+    assert len(os.listdir(tmp_path / 'snap' / 'blobs')) == 1
+
+
+class Body:
+    # response with a fixed body
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        yield self.body
+
+    def close(self):
+        pass
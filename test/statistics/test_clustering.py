@@ -0,0 +1,30 @@
+import os
+import yaml
+import numpy as np
+import pandas as pd
+
+try:
+    from src.ingestion import cleandata
+    from src.statistics import clustering
+    from benchmarks import synthetic
+except ModuleNotFoundError:
+    from ingestion import cleandata
+    from statistics import clustering
+    import synthetic
+
+
+def test_run_kmeans_zero_first_price():
+    with open(os.path.join('config', 'plebmtg.yaml'), 'r') as f:
+        yaml0 = yaml.load(f, Loader=yaml.FullLoader)
+    syn0 = synthetic.Synthetic(200, ndays=30, seed=1)
+    scry, prices = syn0.scryfall(), syn0.mtgjson()
+    # every card listed at 0 on the first day
+    prices['pd0'] = 0
+    kw = dict(yaml0['get_data']['merge_all'], refdate=syn0.days[-1], features=['max', 'min', 'mean', 'pct_change'])
+    kmean0 = cleandata.Clean(scry, prices, **kw).for_kmeans()
+
+    pct = [c for c in kmean0.columns if c.endswith('pct_change')]
+    assert pct and np.isfinite(kmean0[pct].to_numpy()).all()
+    kcenter, clusters, score = clustering.run_kmeans(kmean0, **yaml0['clustering']['run_kmeans'])
+    assert set(clusters['scryfallId']) == set(kmean0['scryfallId'])
+    assert not kcenter.isna().any().any() and np.isfinite(score)
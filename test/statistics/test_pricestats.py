@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+try:
+    from src.statistics import pricestats
+except ModuleNotFoundError:
+    from statistics import pricestats
+
+
+def test_summarize():
+    arr = np.array([[1, 2, np.nan, 4], [np.nan, np.nan, np.nan, np.nan], [np.nan, 3, np.nan, np.nan],
+                    [0, 1, 2, 3]], dtype=np.float32)
+    res0 = pricestats.summarize(arr, pricestats.FEATURES, days=[10, 11, 12, 13])
+    np.testing.assert_array_equal(res0['count'], [3, 0, 1, 4])
+    np.testing.assert_allclose(res0['mean'], [7 / 3, np.nan, 3, 1.5])
+    np.testing.assert_allclose(res0['std'], [np.std([1, 2, 4], ddof=1), np.nan, 0, np.std([0, 1, 2, 3], ddof=1)],
+                               rtol=1e-6)
+    np.testing.assert_array_equal(res0['max'], [4, np.nan, 3, 3])
+    np.testing.assert_array_equal(res0['first'], [1, np.nan, 3, 0])
+    np.testing.assert_array_equal(res0['last'], [4, np.nan, 3, 3])
+    assert res0['max'].dtype == res0['last'].dtype == np.float32
+    np.testing.assert_allclose(res0['pct_change'], [3, np.nan, 0, 2])
+    zero0 = pricestats.summarize(np.array([[0, 0, np.nan], [np.nan, 0, 5]]), ['pct_change'])
+    np.testing.assert_array_equal(zero0['pct_change'], [0, 0])
+    np.testing.assert_allclose(res0['slope'], [np.polyfit([10, 11, 13], [1, 2, 4], 1)[0], np.nan, 0, 1])
+
+    with pytest.raises(ValueError):
+        pricestats.summarize(arr, ['median'])
+    assert np.isnan(pricestats.summarize(arr[:, :0], ['max'])['max']).all()
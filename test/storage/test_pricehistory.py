@@ -0,0 +1,42 @@
+import pandas as pd
+
+try:
+    from src.storage import pricehistory
+except ModuleNotFoundError:
+    from storage import pricehistory
+
+
+def entries(days, uuids=('u1', 'u2')):
+    return [(u, {'tcgplayer': {'buylist': {'normal': {d: 1.0 for d in days}},
+                               'retail': {'normal': {d: 2.0 for d in days}}}}) for u in uuids]
+
+
+def test_history_append_expire(tmp_path):
+    hist0 = pricehistory.PriceHistory(str(tmp_path), window=3)
+    assert hist0.lastdate() is None and hist0.gap(['2021-06-01'])
+
+    hist0.replace(entries(['2021-06-01', '2021-06-02', '2021-06-03']))
+    assert not hist0.gap(hist0.dates(entries(['2021-06-04'])))
+    assert hist0.gap(hist0.dates(entries(['2021-06-05'])))
+
+    assert hist0.new(entries(['2021-06-04'], uuids=('u2', 'u3')) + [('u4', {})]) == {'u3'}
+    hist0.update(entries(['2021-06-04'], uuids=('u2', 'u3')))
+    hist0.expire()
+    assert hist0.buy.columns.tolist() == ['2021-06-02', '2021-06-03', '2021-06-04']
+    assert hist0.complete().tolist() == ['u1', 'u2', 'u3']
+
+    hist0.save()
+    hist1 = pricehistory.PriceHistory(str(tmp_path), window=3).load()
+    pd.testing.assert_frame_equal(hist1.buy, hist0.buy)
+    pd.testing.assert_frame_equal(hist1.sell, hist0.sell)
+    assert hist1.provider.to_dict() == hist0.provider.to_dict()
+
+
+def test_history_keeps_provider():
+    hist0 = pricehistory.PriceHistory(window=3)
+    hist0.replace([('u1', {'cardkingdom': {'buylist': {'normal': {'2021-06-01': 1.0}},
+                                           'retail': {'normal': {'2021-06-01': 2.0}}}})])
+    hist0.update([('u1', {'tcgplayer': {'buylist': {'normal': {'2021-06-02': 5.0}}},
+                          'cardkingdom': {'buylist': {'normal': {'2021-06-02': 1.5}}}})])
+    assert hist0.provider['u1'] == 'cardkingdom'
+    assert hist0.buy.loc['u1'].tolist() == [1.0, 1.5]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from src.storage import pricestore
+except ModuleNotFoundError:
+    from storage import pricestore
+
+
+def frames():
+    dates = ['2021-06-0{}'.format(d) for d in range(1, 6)]
+    buy = pd.DataFrame([[1, 2, np.nan, 4, np.nan], [np.nan] * 5, [5, 5, 5, 5, 5]], index=['u1', 'u2', 'u3'],
+                       columns=dates, dtype=float)
+    sell = pd.DataFrame([[2, 3, 4, 5, 6]], index=['u4'], columns=dates[1:] + ['2021-06-06'], dtype=float)
+    return buy, sell
+
+
+def test_store_roundtrip(tmp_path):
+    buy, sell = frames()
+    store0 = pricestore.PriceStore.from_frames(buy, sell)
+    assert store0.shape == (2, 4, 6) and store0.prices.dtype == np.float32
+    assert store0.uuids.tolist() == ['u1', 'u2', 'u3', 'u4']
+
+    store0.save(str(tmp_path))
+    store1 = pricestore.PriceStore.load(str(tmp_path))
+    assert isinstance(store1.prices, np.memmap)
+    pd.testing.assert_frame_equal(store1.frame('buy'), store0.frame('buy'))
+    pd.testing.assert_frame_equal(store1.frame('buy').loc[buy.index, buy.columns].astype(float), buy,
+                                  check_names=False)
+    assert store1.frame('sell', prefix='p_').columns[-1] == 'p_2021-06-06'
+
+
+def test_store_window_subset_stats():
+    buy, sell = frames()
+    store0 = pricestore.PriceStore.from_frames(buy, sell)
+
+    win0 = store0.window('2021-06-02', '2021-06-04')
+    assert win0.dates.tolist() == ['2021-06-02', '2021-06-03', '2021-06-04']
+    assert np.shares_memory(win0.prices, store0.prices)
+    assert store0.last(2).dates.tolist() == ['2021-06-05', '2021-06-06']
+
+    sub0 = store0.subset(['u3', 'u1', 'missing'])
+    assert sub0.uuids.tolist() == ['u3', 'u1']
+    assert sub0.plane('buy')[0, :5].tolist() == [5] * 5 and np.isnan(sub0.plane('buy')[0, 5])
+
+    stats0 = store0.stats()
+    assert stats0.loc['u1', 'buy_count'] == 3
+    assert np.isclose(stats0.loc['u1', 'buy_mean'], np.mean([1, 2, 4]))
+    assert stats0.loc['u1', 'buy_last'] == 4 and stats0.loc['u1', 'buy_max'] == 4
+    assert np.isnan(stats0.loc['u2', 'buy_mean']) and np.isnan(stats0.loc['u2', 'buy_last'])
+    assert stats0.loc['u4', 'sell_last'] == 6 and stats0.loc['u4', 'sell_min'] == 2
@@ -0,0 +1,73 @@
+import os
+import sys
+import subprocess
+import yaml
+import pandas as pd
+
+try:
+    from src import pipeline
+    from src.utils import stagecache
+    from benchmarks import synthetic
+except ModuleNotFoundError:
+    import pipeline
+    from utils import stagecache
+    import synthetic
+
+
+class Database:
+    # records the tables a pipeline writes
+    connstring = 'sqlite://'
+    u = ''
+    db = 'msia423_db'
+    sche = 'msia423_db'
+
+    def __init__(self):
+        self.tables = {}
+
+    def insert_df(self, df, name, replace=True):
+        self.tables[name] = df
+
+
+def test_refresh_cached(tmp_path):
+    with open(os.path.join('config', 'plebmtg.yaml'), 'r') as f:
+        yaml0 = yaml.load(f, Loader=yaml.FullLoader)
+    syn = synthetic.Synthetic(200, ndays=30, seed=1)
+    scry, prices = syn.scryfall(), syn.mtgjson()
+    yaml0['get_data']['merge_all']['refdate'] = syn.days[-1]
+    cache = stagecache.StageCache(str(tmp_path))
+
+    db0 = Database()
+    pipe0 = pipeline.refresh(yaml0, scry, prices, cache=cache, chsql=db0).run()
+    assert not pipe0.report()['hit'].any()
+    assert sorted(db0.tables) == ['cards', 'cluster_result', 'gee_result', 'merge_raw', 'ols_result']
+
+    # same raw data and settings: nothing runs, the cached outputs are the ones computed before
+    db1 = Database()
+    pipe1 = pipeline.refresh(yaml0, scry.copy(), prices.copy(), cache=cache, chsql=db1).run()
+    assert pipe1.report()['hit'].all() and db1.tables == {}
+    pd.testing.assert_frame_equal(pipe1.get('clean.for_kmeans'), pipe0.get('clean.for_kmeans'))
+    pd.testing.assert_frame_equal(pipe1.get('kmeans.clusters'), db0.tables['cluster_result'])
+
+    # other price features change the k-means data only, the GEE data comes out the same
+    yaml0['get_data']['merge_all']['features'] = ['max', 'min', 'mean', 'last', 'slope']
+    pipe2 = pipeline.refresh(yaml0, scry, prices, cache=cache, chsql=Database()).run()
+    hits = pipe2.report().set_index('stage')['hit']
+    assert hits['gee'] and not hits[['clean', 'kmeans', 'ols', 'cards']].any()
+
+
+def test_refresh_key_hashseed():
+    # the clean key has to be the same in every process for the cache to hit across run.py invocations
+    code = """if True:
+        import yaml
+        from src import pipeline
+        from benchmarks import synthetic
+        with open('config/plebmtg.yaml') as f:
+            yaml0 = yaml.load(f, Loader=yaml.FullLoader)
+        syn = synthetic.Synthetic(200, ndays=30, seed=1)
+        yaml0['get_data']['merge_all']['refdate'] = syn.days[-1]
+        pipe = pipeline.refresh(yaml0, syn.scryfall(), syn.mtgjson())
+        print(pipe.key('scryfall'), pipe.key('mtgjson'), pipe.key('clean'))
+    """
+    keys = [subprocess.check_output([sys.executable, '-c', code], env=dict(os.environ, PYTHONHASHSEED=str(seed)),
+                                    universal_newlines=True).split()[-3:] for seed in [1, 2]]
+    assert keys[0] == keys[1]
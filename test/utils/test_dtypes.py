@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    from test.ingestion import df_for_test as testdf
+    from src.utils import dtypes
+    from src.ingestion import cleandata
+except ModuleNotFoundError:
+    from ingestion import df_for_test as testdf
+    from utils import dtypes
+    from ingestion import cleandata
+
+
+@pytest.fixture
+def policy():
+    dtypes.POLICY.reset()
+    yield dtypes.POLICY
+    dtypes.POLICY.configure(enabled=False)
+    dtypes.POLICY.reset()
+
+
+def plain(df):
+    # categoricals back to strings and numbers to float64 so frames can be compared by value
+    df = df.astype({c: object for c, t in df.dtypes.items() if isinstance(t, pd.CategoricalDtype)})
+    return df.astype({c: 'float64' for c, t in df.dtypes.items() if pd.api.types.is_numeric_dtype(t)
+                      and not pd.api.types.is_bool_dtype(t)})
+
+
+def test_casts():
+    df0 = pd.DataFrame({'kw_a': [0, 1, 1, 0], 'count': [0, 2, 1, 0], 'pd0': [0.1, np.nan, 0.3, 0.4],
+                        'cmc': [1.0, 2.0, 3.0, 4.0], 'flag': [True, False, True, True],
+                        'rarity': ['rare', 'rare', 'common', 'rare'], 'name': ['a', 'b', 'c', 'd']})
+    casts = dtypes.DtypePolicy(enabled=True).casts(df0)
+    assert casts == {'kw_a': 'uint8', 'pd0': 'float32', 'rarity': 'category'}
+    assert dtypes.DtypePolicy().apply(df0) is df0
+    with pytest.raises(TypeError):
+        dtypes.DtypePolicy().configure(nothing=1)
+
+
+def test_clean_numerically_equal(policy):
+    scry, mtgjson = testdf.scrydf(), testdf.jsondf()
+    gee0 = cleandata.Clean(scry, mtgjson).for_gee()
+    kmean0 = cleandata.Clean(scry, mtgjson).for_kmeans()
+
+    policy.configure(enabled=True)
+    # stage boundaries of scryfall_api and mtgjson_api
+    scry1, mtgjson1 = dtypes.downcast(scry, 'scryfall_api'), dtypes.downcast(mtgjson, 'mtgjson_api')
+    assert (mtgjson1['pricetype'].dtype == 'category') and (mtgjson1['pd0'].dtype == np.float32)
+    gee1 = cleandata.Clean(scry1, mtgjson1).for_gee()
+    kmean1 = cleandata.Clean(scry1, mtgjson1).for_kmeans()
+
+    pd.testing.assert_frame_equal(plain(gee1), plain(gee0), rtol=1e-6, check_column_type=False)
+    pd.testing.assert_frame_equal(plain(kmean1), plain(kmean0), rtol=1e-6)
+
+    report0 = policy.summary()
+    assert report0['frame'].tolist()[:2] == ['scryfall_api', 'mtgjson_api']
+    assert 'Clean.merge_clean' in report0['frame'].tolist()
+    assert (report0['after_mb'] <= report0['before_mb']).all()
+    assert report0.loc[report0['frame'] == 'mtgjson_api', 'saved_pct'].iloc[0] > 0
@@ -0,0 +1,57 @@
+import json
+import time
+import pytest
+
+try:
+    from src.utils import profiling
+except ModuleNotFoundError:
+    from utils import profiling
+
+
+def test_stage_records(tmp_path):
+    prof0 = profiling.Profiler(trace=True, outfile=str(tmp_path / 'out' / 'profile.jsonl'))
+
+    @prof0.track()
+    def allocate(n):
+        return [0] * n
+
+    with prof0.stage('outer', rows=3):
+        time.sleep(0.05)
+        allocate(2 * 1024 ** 2)
+    with pytest.raises(ValueError):
+        with prof0.stage('failing'):
+            raise ValueError('bad')
+
+    inner, outer, failing = prof0.records
+    assert inner['stage'].endswith('allocate') and inner['parent'] == 'outer'
+    # a list of 2M pointers is at least 16MB
+    assert inner['traced_peak'] >= 16 * 1024 ** 2
+    assert outer['traced_peak'] >= inner['traced_peak']
+    assert outer['wall'] >= 0.05 and outer['rows'] == 3 and outer['rss_peak'] >= outer['rss_start']
+    assert failing['error'] == "ValueError('bad')"
+
+    lines = [json.loads(x) for x in open(tmp_path / 'out' / 'profile.jsonl')]
+    assert [x['stage'] for x in lines] == [r['stage'] for r in prof0.records]
+
+    sum0 = prof0.summary()
+    assert sum0['stage'].tolist() == [inner['stage'], 'outer', 'failing']
+    assert 'outer' in prof0.table()
+
+
+def test_no_trace():
+    prof0 = profiling.Profiler()
+    with prof0.stage('plain'):
+        pass
+    assert prof0.records[0]['traced_peak'] is None and prof0.records[0]['cpu'] >= 0
+
+
+def test_trace_without_reset_peak(monkeypatch):
+    # tracemalloc.reset_peak is new in Python 3.9, the peak since tracing started is reported without it
+    monkeypatch.delattr(profiling.tracemalloc, 'reset_peak', raising=False)
+    prof0 = profiling.Profiler(trace=True)
+    with prof0.stage('outer'):
+        with prof0.stage('inner'):
+            x = [0] * 1024 ** 2
+        del x
+    inner, outer = prof0.records
+    assert inner['traced_peak'] >= 8 * 1024 ** 2 and outer['traced_peak'] >= inner['traced_peak']
@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    from src.utils import stagecache
+except ModuleNotFoundError:
+    from utils import stagecache
+
+
+def frame():
+    return pd.DataFrame({'name': ['a', 'b', 'c'], 'price': np.array([1.0, np.nan, 3.0], dtype='float32'),
+                         'colors': [['W'], [], ['U', 'B']]})
+
+
+def test_fingerprint():
+    df0 = frame()
+    assert stagecache.fingerprint(df0, {'k': 1}) == stagecache.fingerprint(frame(), {'k': 1})
+    # values, dtypes, index, column names and settings all change the fingerprint
+    df1 = frame()
+    df1.loc[1, 'price'] = 2
+    changed = [df1, df0.astype({'price': 'float64'}), df0.set_axis([1, 2, 3]), df0.rename(columns={'name': 'n'}),
+               df0.assign(colors=[['W'], ['G'], ['U', 'B']])]
+    fps = {stagecache.fingerprint(df, {'k': 1}) for df in changed}
+    assert len(fps) == len(changed) and stagecache.fingerprint(df0, {'k': 1}) not in fps
+    assert stagecache.fingerprint(df0, {'k': 1}) != stagecache.fingerprint(df0, {'k': 2})
+    assert stagecache.fingerprint({'a': 1, 'b': 2}) == stagecache.fingerprint({'b': 2, 'a': 1})
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path), keep=2)
+    out0 = {'frame': frame(), 'model': {'coef': np.arange(3)}, 'score': 0.5}
+    cache.save('stage', 'k1', out0)
+    assert cache.has('stage', 'k1') and not cache.has('stage', 'k2')
+    pd.testing.assert_frame_equal(cache.load('stage', 'k1', 'frame'), out0['frame'])
+    back = cache.load('stage', 'k1')
+    assert back['score'] == 0.5 and back['model']['coef'].tolist() == [0, 1, 2]
+
+    # only the newest `keep` entries are kept and no partial entries are left behind
+    cache.save('stage', 'k2', 1)
+    cache.save('stage', 'k3', 2)
+    assert cache.keys('stage') == ['k2', 'k3'] and cache.latest('stage') == 'k3'
+    assert sorted(os.listdir(tmp_path / 'stage')) == ['k2', 'k3']
+
+
+def build(cache, raw, calls, config=1, force=None):
+    def record(name, value):
+        calls.append(name)
+        return value
+
+    pipe = stagecache.Pipeline(cache, inputs={'raw': raw}, force=force)
+    pipe.stage('clean', lambda raw: record('clean', {'a': raw * 2, 'b': raw + config}), deps={'raw': 'raw'},
+               config={'setting': config}, code=[stagecache])
+    pipe.stage('model', lambda a: record('model', a.sum()), deps={'a': 'clean.a'})
+    pipe.stage('other', lambda b: record('other', b.mean()), deps={'b': 'clean.b'})
+    pipe.stage('write', lambda total, mean: record('write', None), deps={'total': 'model', 'mean': 'other'},
+               stored=False)
+    return pipe
+
+
+def test_pipeline(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path))
+    raw = pd.DataFrame({'x': [1.0, 2.0, 3.0]})
+    calls = []
+    pipe = build(cache, raw, calls).run()
+    assert calls == ['clean', 'model', 'other', 'write']
+    assert not pipe.report()['hit'].any()
+
+    # nothing changed: every stage is a hit and no output is read back
+    calls.clear()
+    pipe = build(cache, raw.copy(), calls).run()
+    assert calls == [] and pipe.report()['hit'].all() and pipe.values == {}
+    assert pipe.get('model')['x'] == 12
+    assert 'hit' in pipe.table()
+
+    # a changed setting reruns the stage and only the stages using an entry that came out differently
+    calls.clear()
+    pipe = build(cache, raw, calls, config=2).run()
+    assert calls == ['clean', 'other', 'write']
+    assert pipe.report().set_index('stage')['hit'].to_dict() == {'clean': False, 'model': True, 'other': False,
+                                                                  'write': False}
+
+    # the first outputs are still cached, but the side effect stage runs again as another key was written since
+    calls.clear()
+    build(cache, raw, calls).run()
+    assert calls == ['write']
+
+    # changed input
+    calls.clear()
+    build(cache, raw * 3, calls).run()
+    assert calls == ['clean', 'model', 'other', 'write']
+
+    # forcing a stage also reruns what depends on it
+    calls.clear()
+    pipe = build(cache, raw * 3, calls, force=['model']).run()
+    assert calls == ['model', 'write']
+    assert pipe.report().set_index('stage')['forced'].tolist() == [False, True, False, True]
+    calls.clear()
+    build(cache, raw * 3, calls, force=True).run()
+    assert calls == ['clean', 'model', 'other', 'write']
+
+    # no cache: everything runs and nothing is stored
+    calls.clear()
+    build(None, raw, calls).run()
+    assert calls == ['clean', 'model', 'other', 'write']
+
+    with pytest.raises(ValueError, match='unknown'):
+        stagecache.Pipeline(cache).stage('model', len, deps={'a': 'clean.a'})
+
+
+def test_pipeline_unreadable(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path))
+    raw = pd.DataFrame({'x': [1.0, 2.0]})
+    calls = []
+    pipe = build(cache, raw, calls).run()
+    key = pipe.key('clean')
+    # entry written by e.g. other library versions
+    spec = cache.manifest('clean', key)['output']['dict']['a']
+    with open(tmp_path / 'clean' / key / list(spec.values())[0], 'wb') as f:
+        f.write(b'broken')
+    calls.clear()
+    pipe = build(cache, raw, calls, force=['model'])
+    assert pipe.get('model')['x'] == 6
+    assert calls == ['clean', 'model']
+    assert not pipe.report().set_index('stage').loc['clean', 'hit']
+    assert json.load(open(tmp_path / 'clean' / key / 'manifest.json'))['key'] == key